@@ -1,14 +1,134 @@
 import asyncio
+import fcntl
 import os
 import subprocess
 import psutil
 import shutil
+import time
+import gzip
+import hashlib
+import math
+import re
+import json
+import signal
+import stat
+import sys
+from collections import deque
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
 import git
+import httpx
 from config import Config
 from database import db
 from logger import logger
+from webhook_ingress import webhook_ingress
+from log_collector import log_collector
+from trash_bin import trash_bin
+
+# Script names deploy_bot accepts as a bot entrypoint, in order of preference
+ENTRYPOINT_CANDIDATES = ["main.py", "bot.py", "app.py", "run.py"]
+# Written next to bot.py by create_bot_template; marks bots that can run inside a shared host
+TEMPLATE_MARKER = ".template_bot"
+SHARED_HOST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared_host.py")
+ZYGOTE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote.py")
+# Pre-built bot directories live under <deployment_dir>/.warm_pool/slot_*; a slot is ready once it holds the marker
+WARM_POOL_DIR = ".warm_pool"
+WARM_SLOT_MARKER = ".warm_ready"
+# Prepared bot directories (checkout + venv), one per commit, under <deployment_dir>/.snapshots/<sha>
+SNAPSHOT_DIR = ".snapshots"
+SNAPSHOT_MARKER = ".snapshot_ready"
+# Venv files rewritten in place, so each bot gets its own copy instead of a hardlink
+SNAPSHOT_PRIVATE_FILES = {os.path.join('venv', 'pyvenv.cfg'), os.path.join('venv', '.requirements.sha256')}
+# ioctl cloning a whole file as a copy-on-write reflink (btrfs, XFS with reflink=1, ...)
+FICLONE = 0x40049409
+# Progress hook of deploy/update/restart/delete: awaited with the name of each stage as it begins
+StageCallback = Callable[[str], Awaitable[None]]
+
+class AdoptedProcess:
+    """Popen-like handle for a bot process the current manager did not spawn (re-adopted after a restart).
+    Exit codes of non-children are not observable, so returncode becomes -1 once the process is gone.
+    """
+    def __init__(self, proc: psutil.Process):
+        self._proc = proc
+        self.pid = proc.pid
+        self.returncode = None
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is None:
+            try:
+                # is_running() also guards against PID reuse (create_time is compared)
+                if self._proc.is_running() and self._proc.status() != psutil.STATUS_ZOMBIE:
+                    return None
+            except psutil.Error:
+                pass
+            self.returncode = -1
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        self._proc.send_signal(sig)
+
+    def terminate(self):
+        self._proc.terminate()
+
+    def kill(self):
+        self._proc.kill()
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        try:
+            self._proc.wait(timeout=timeout)
+        except psutil.TimeoutExpired:
+            raise subprocess.TimeoutExpired(str(self.pid), timeout)
+        except psutil.NoSuchProcess:
+            pass
+        return self.poll()
+
+class ZygoteChild(AdoptedProcess):
+    """Handle for a bot forked by a zygote. The zygote reaps it, so poll() only reports -1 once it is gone;
+    BotManager._collect_exit_code asks the zygote for the real exit code (once) after the exit was awaited."""
+    def __init__(self, proc: psutil.Process, zygote_socket: str):
+        super().__init__(proc)
+        self.zygote_socket = zygote_socket
+        self.exit_queried = False
+
+# Restart modes whose run also does everything a restart of the given mode would (see restart_bot)
+RESTART_COVERED_BY = {'fast': ('auto', 'upgrade'), 'auto': ('upgrade',), 'upgrade': ()}
+
+class AdmissionDenied(Exception):
+    """Raised by deploy_bot when starting the bot would exceed the host capacity limits (ADMISSION_*).
+    The message starts with 'capacity:' and says which limit was hit."""
+
+class DeployRun:
+    """Stage timings of one deploy, update or restart, stored in deploy_runs when it finishes.
+    It is passed down as the on_stage hook, so nested calls (restart -> update -> deploy) add
+    their stages to the outer run instead of recording runs of their own.
+    """
+    def __init__(self, bot_id: int, kind: str, on_stage: Optional[StageCallback] = None):
+        self.bot_id = bot_id
+        self.kind = kind
+        self.on_stage = on_stage
+        self.started_at = time.time()
+        self.stages: List[Dict[str, Any]] = []
+
+    @classmethod
+    def begin(cls, bot_id: int, kind: str, on_stage: Optional[StageCallback]) -> Tuple['DeployRun', bool]:
+        """The run to report stages to, and whether the caller owns (and must finish) it"""
+        if isinstance(on_stage, DeployRun):
+            return on_stage, False
+        return cls(bot_id, kind, on_stage), True
+
+    async def __call__(self, stage: str):
+        now = time.time()
+        if self.stages:
+            self.stages[-1]['end'] = now
+        self.stages.append({'stage': stage, 'start': now, 'end': None})
+        if self.on_stage:
+            await self.on_stage(stage)
+
+    async def finish(self, ok: bool):
+        now = time.time()
+        if self.stages and self.stages[-1]['end'] is None:
+            self.stages[-1]['end'] = now
+        await db.add_deploy_run(self.bot_id, self.kind, ok, self.started_at, now, self.stages)
 
 class BotManager:
     def __init__(self):
@@ -17,17 +137,87 @@ class BotManager:
         # Prefer venv python if present inside deployment dir; fallback to configured path
         self.python_path = Config.BOT_PYTHON_PATH
         self.running_bots = {}  # bot_id -> process_info
+        # Single bare mirror of repo_url shared by every bot checkout
+        self.mirror_dir = Config.BOT_MIRROR_DIR
+        self._mirror_lock = asyncio.Lock()
+        self._mirror_synced_at = 0.0
+        # Separate bounds for heavy git/pip work and for process spawns
+        self._install_semaphore = asyncio.Semaphore(Config.BOT_INSTALL_CONCURRENCY)
+        self._spawn_semaphore = asyncio.Semaphore(Config.BOT_SPAWN_CONCURRENCY)
+        # Supervisor state: recent unexpected exits per bot (monotonic timestamps) for crash-loop detection
+        self._crash_history = {}  # bot_id -> deque[float]
+        # Shared hosts for template bots: index -> {'process', 'socket', 'bots': set(bot_id)}
+        self.shared_hosts = {}
+        self._shared_host_lock = asyncio.Lock()
+        # Fork-servers: key (interpreter + requirements hash) -> {'process', 'socket', 'bots': set(bot_id)}
+        self.zygotes = {}
+        self._zygote_lock = asyncio.Lock()
+        # Hibernation: in-flight wakes (one per bot) and the getUpdates peek loop
+        self._wake_tasks = {}
+        self._wake_poller_running = False
+        webhook_ingress.wake_callback = self.wake_bot
+        # Warm pool: pre-built bot directories (checkout + venv + requirements) taken by first deploys
+        self.warm_pool_dir = os.path.join(self.deployment_dir, WARM_POOL_DIR)
+        self._warm_pool_lock = asyncio.Lock()
+        self._warm_refill_task = None
+        # Snapshots: bot directories are materialized from them with reflinks/hardlinks
+        self.snapshot_dir = os.path.join(self.deployment_dir, SNAPSHOT_DIR)
+        self._snapshot_lock = asyncio.Lock()
+        self._reflink_ok = None  # unknown until the first materialization tries it
+        # Admission control: memory promised to bots between the decision and their spawn (bot_id -> bytes)
+        self._admission_lock = asyncio.Lock()
+        self._admission_reserved: Dict[int, int] = {}
+        # Demo bots picked for preemption whose stop is still in progress
+        self._preempting = set()
+        # Control operations: one at a time per bot, identical requests in flight are joined
+        self._bot_locks: Dict[int, asyncio.Lock] = {}
+        self._bot_ops: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._bot_op_owner: Dict[int, asyncio.Task] = {}  # bot_id -> task running its current operation
         
+    async def _bot_operation(self, bot_id: int, op: str, factory: Callable[[], Awaitable[Any]],
+                             covered_by: Tuple[str, ...] = ()) -> Any:
+        """Run a control operation of a bot (deploy, restart, update, stop, delete).
+        Operations of one bot run one after another; a request identical to one queued or in flight (or to one
+        of the `covered_by` operations, which do everything it would) joins it and gets its result instead of
+        repeating the work. Calls made by the operation itself (restart -> stop -> deploy) run directly, so the
+        per-bot lock behaves as reentrant.
+        """
+        if self._bot_op_owner.get(bot_id) is asyncio.current_task():
+            return await factory()
+        key = (bot_id, op)
+        task = self._bot_ops.get(key)
+        if task is None or task.done():
+            for other in covered_by:
+                candidate = self._bot_ops.get((bot_id, other))
+                if candidate is not None and not candidate.done():
+                    task, op = candidate, other
+                    break
+        if task is None or task.done():
+            task = asyncio.create_task(self._run_bot_operation(bot_id, factory))
+            self._bot_ops[key] = task
+            task.add_done_callback(lambda done: self._bot_ops.pop(key, None) if self._bot_ops.get(key) is done else None)
+        else:
+            logger.log_bot_event(bot_id, "Joined operation in flight", details=op)
+        # Shielded: a caller giving up does not abort the operation for the others
+        return await asyncio.shield(task)
+
+    async def _run_bot_operation(self, bot_id: int, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self._bot_locks.setdefault(bot_id, asyncio.Lock()):
+            self._bot_op_owner[bot_id] = asyncio.current_task()
+            try:
+                return await factory()
+            finally:
+                del self._bot_op_owner[bot_id]
+
+    def _bot_dir(self, bot_id: int) -> str:
+        return os.path.join(self.deployment_dir, f"bot_{bot_id}")
+
     def _venv_python(self, bot_dir: str) -> str:
         return os.path.join(bot_dir, 'venv', 'bin', 'python')
 
     def _ensure_clean_venv(self, bot_dir: str):
         """(Sync) Remove and recreate a fresh venv with ensurepip. Best-effort; raises on creation failure."""
-        venv_dir = os.path.join(bot_dir, 'venv')
-        try:
-            shutil.rmtree(venv_dir, ignore_errors=True)
-        except Exception:
-            pass
+        trash_bin.discard(os.path.join(bot_dir, 'venv'))
         # Create venv
         subprocess.run([self.python_path, "-m", "venv", "venv"], cwd=bot_dir, check=True)
         venv_python = self._venv_python(bot_dir)
@@ -58,26 +248,125 @@ class BotManager:
         except Exception:
             return None
 
+    def _install_requirements(self, bot_id: int, bot_dir: str, python_exec: str):
+        """(Sync) pip install requirements.txt unless the venv already holds this exact file.
+        A hash of the installed requirements is kept inside the venv, so unchanged code skips pip entirely.
+        """
+        requirements_file = os.path.join(bot_dir, "requirements.txt")
+        if not os.path.exists(requirements_file):
+            return
+        with open(requirements_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        marker = os.path.join(bot_dir, 'venv', '.requirements.sha256')
+        try:
+            with open(marker) as f:
+                if f.read().strip() == digest:
+                    logger.log_bot_event(bot_id, "Dependencies up to date", details=digest[:12])
+                    return
+        except OSError:
+            pass
+        env = os.environ.copy()
+        env['PIP_DISABLE_PIP_VERSION_CHECK'] = '1'
+        logger.log_bot_event(bot_id, "Installing dependencies", details=requirements_file)
+        subprocess.run([python_exec, "-m", "pip", "install", "-r", requirements_file, "--no-cache-dir", "-q"], cwd=bot_dir, check=True, env=env)
+        with open(marker, 'w') as f:
+            f.write(digest)
+
+    def _checkout_sha(self, bot_dir: str) -> Optional[str]:
+        """(Sync) Commit SHA checked out in a bot directory, or None if it is not a git checkout."""
+        try:
+            return git.Repo(bot_dir).head.commit.hexsha
+        except Exception:
+            return None
+
+    async def get_target_sha(self) -> Optional[str]:
+        """Commit SHA bots should run: the mirror HEAD (fetched at most once per BOT_MIRROR_MAX_AGE)."""
+        if not await self.sync_mirror():
+            return None
+        try:
+            return git.Repo(self.mirror_dir).head.commit.hexsha
+        except Exception:
+            return None
+
+    async def needs_code_update(self, bot_id: int, target_sha: Optional[str] = None) -> bool:
+        """True if the bot checkout differs from the target SHA (or either side is unknown).
+        A target the bot was rolled back from (bad_sha) is not an update until a newer head arrives."""
+        bot_dir = self._bot_dir(bot_id)
+        if not os.path.exists(bot_dir):
+            return True
+        current = self._checkout_sha(bot_dir)
+        if current is None:
+            # Local template: nothing to pull unless a repo is configured (deploy_bot reclones then)
+            return bool(self.repo_url)
+        target = target_sha or await self.get_target_sha()
+        if target is None:
+            try:
+                # No mirror: ask origin directly (one ls-remote, no object transfer)
+                target = git.Repo(bot_dir).git.ls_remote('origin', 'HEAD').split()[0]
+            except Exception:
+                return True
+        if current == target:
+            return False
+        bot = await db.get_bot(bot_id)
+        return not (bot and bot.get('bad_sha') == target)
+
     async def setup_deployment_directory(self):
-        """Create deployment directory if it doesn't exist"""
+        """Create deployment directory if it doesn't exist and resume emptying the trash"""
         if not os.path.exists(self.deployment_dir):
             os.makedirs(self.deployment_dir)
             logger.log_system_event("Created deployment directory", details=self.deployment_dir)
+        trash_bin.start()
     
+    def _mirror_ready(self) -> bool:
+        return os.path.exists(os.path.join(self.mirror_dir, 'HEAD'))
+
+    def _sync_mirror_blocking(self):
+        """(Sync) Create the bare mirror on first use, otherwise fetch and prune all refs."""
+        if self._mirror_ready():
+            git.Repo(self.mirror_dir).git.remote('update', '--prune')
+        else:
+            # Leftovers of an interrupted mirror clone would make clone_from fail
+            shutil.rmtree(self.mirror_dir, ignore_errors=True)
+            git.Repo.clone_from(self.repo_url, self.mirror_dir, mirror=True)
+
+    async def sync_mirror(self, force: bool = False) -> bool:
+        """Fetch BOT_REPO_URL into the local bare mirror.
+        Fetches are skipped while the previous one is younger than BOT_MIRROR_MAX_AGE unless force=True,
+        so a fleet-wide update costs a single network fetch. Returns True if the mirror is usable.
+        """
+        if not self.repo_url:
+            return False
+        async with self._mirror_lock:
+            age = time.monotonic() - self._mirror_synced_at
+            if not force and self._mirror_synced_at and age < Config.BOT_MIRROR_MAX_AGE and self._mirror_ready():
+                return True
+            try:
+                await asyncio.to_thread(self._sync_mirror_blocking)
+                self._mirror_synced_at = time.monotonic()
+                logger.log_system_event("Repository mirror synced", details=f"{self.repo_url} -> {self.mirror_dir}")
+            except Exception as e:
+                logger.error(f"Error syncing repository mirror: {e}")
+            return self._mirror_ready()
+
     async def clone_bot_template(self, bot_id: int) -> bool:
         """Clone the bot template repository for a specific bot"""
         try:
             bot_dir = os.path.join(self.deployment_dir, f"bot_{bot_id}")
             
-            # Remove existing directory if it exists
-            if os.path.exists(bot_dir):
-                shutil.rmtree(bot_dir)
+            # Move an existing directory out of the way (deleted in the background)
+            trash_bin.discard(bot_dir)
             
-            # Clone the repository; if fails, fall back to local template
+            # Clone from the local mirror (objects are hardlinked), then the network, then fall back to local template
             try:
-                logger.log_bot_event(bot_id, "Cloning bot repository", details=f"repo={self.repo_url}")
-                # Shallow, single-branch clone to reduce disk and time
-                git.Repo.clone_from(self.repo_url, bot_dir, depth=1, single_branch=True)
+                mirror_ok = await self.sync_mirror()
+                async with self._install_semaphore:
+                    if mirror_ok:
+                        logger.log_bot_event(bot_id, "Cloning from local mirror", details=self.mirror_dir)
+                        await asyncio.to_thread(git.Repo.clone_from, self.mirror_dir, bot_dir)
+                    else:
+                        logger.log_bot_event(bot_id, "Cloning bot repository", details=f"repo={self.repo_url}")
+                        # Shallow, single-branch clone to reduce disk and time
+                        await asyncio.to_thread(git.Repo.clone_from, self.repo_url, bot_dir, depth=1, single_branch=True)
                 logger.log_bot_event(bot_id, "Clone completed", details=bot_dir)
             except Exception:
                 # Fallback: create minimal template locally
@@ -89,13 +378,254 @@ class BotManager:
             logger.error(f"Error cloning bot template: {e}")
             return False
     
+    def _warm_slots(self) -> List[str]:
+        """(Sync) Ready warm pool slots, oldest first."""
+        try:
+            names = sorted(os.listdir(self.warm_pool_dir))
+        except OSError:
+            return []
+        return [os.path.join(self.warm_pool_dir, name) for name in names
+                if name.startswith('slot_') and os.path.exists(os.path.join(self.warm_pool_dir, name, WARM_SLOT_MARKER))]
+
+    async def _build_prepared_dir(self, path: str):
+        """Prepare a directory the way a first deploy would: clone (or template), entrypoint, venv, requirements.
+        Raises if the venv cannot be prepared.
+        """
+        mirror_ok = await self.sync_mirror()
+        try:
+            async with self._install_semaphore:
+                if mirror_ok:
+                    await asyncio.to_thread(git.Repo.clone_from, self.mirror_dir, path)
+                elif self.repo_url:
+                    await asyncio.to_thread(git.Repo.clone_from, self.repo_url, path, depth=1, single_branch=True)
+                else:
+                    raise RuntimeError("no repository configured")
+        except Exception:
+            trash_bin.discard(path)
+            await self.create_bot_template(path)
+        if not any(os.path.exists(os.path.join(path, fname)) for fname in ENTRYPOINT_CANDIDATES):
+            await self.create_bot_template(path)
+        async with self._install_semaphore:
+            await asyncio.to_thread(self._prepare_venv, 0, path)
+
+    def _clone_file(self, src: str, dst: str, rel: str) -> str:
+        """(Sync) Put one snapshot file into a bot directory. Returns how: 'reflink', 'link' or 'copy'.
+        Reflinks are private copy-on-write copies and are used for everything when the filesystem has them.
+        Otherwise only files that are replaced but never rewritten in place (git objects, installed packages)
+        are hardlinked, and the rest is copied, so a bot writing to its own files never changes another bot's.
+        """
+        if self._reflink_ok is not False:
+            try:
+                with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                shutil.copystat(src, dst)
+                self._reflink_ok = True
+                return 'reflink'
+            except OSError:
+                if self._reflink_ok is None:
+                    self._reflink_ok = False
+                try:
+                    os.unlink(dst)
+                except OSError:
+                    pass
+        shareable = rel.startswith(os.path.join('.git', 'objects') + os.sep) or (
+            rel.startswith('venv' + os.sep) and rel not in SNAPSHOT_PRIVATE_FILES)
+        if shareable:
+            try:
+                os.link(src, dst)
+                return 'link'
+            except OSError:
+                pass
+        shutil.copy2(src, dst)
+        return 'copy'
+
+    def _materialize(self, snapshot: str, bot_dir: str) -> Dict[str, int]:
+        """(Sync) Recreate a snapshot as a new bot directory. Returns the number of files per clone method."""
+        return self._clone_tree(snapshot, bot_dir)
+
+    def _clone_tree(self, source: str, target: str, rel_base: str = '') -> Dict[str, int]:
+        """(Sync) Clone a directory tree file by file with _clone_file; rel_base is the source's path
+        inside a bot directory (decides which files may be hardlinked)."""
+        counts = {'reflink': 0, 'link': 0, 'copy': 0}
+        os.makedirs(target)
+        for root, dirs, files in os.walk(source):
+            rel_root = os.path.relpath(root, source)
+            target_root = target if rel_root == '.' else os.path.join(target, rel_root)
+            for name in list(dirs):
+                if os.path.islink(os.path.join(root, name)):
+                    # Not descended into; recreated as a link below
+                    dirs.remove(name)
+                    files.append(name)
+                else:
+                    os.mkdir(os.path.join(target_root, name))
+                    shutil.copymode(os.path.join(root, name), os.path.join(target_root, name))
+            for name in files:
+                if rel_root == '.' and name == SNAPSHOT_MARKER:
+                    continue
+                src = os.path.join(root, name)
+                dst = os.path.join(target_root, name)
+                if os.path.islink(src):
+                    os.symlink(os.readlink(src), dst)
+                    continue
+                counts[self._clone_file(src, dst, os.path.normpath(os.path.join(rel_base, rel_root, name)))] += 1
+        return counts
+
+    def _snapshots(self) -> List[str]:
+        """(Sync) Complete snapshots, most recently captured first."""
+        try:
+            names = os.listdir(self.snapshot_dir)
+        except OSError:
+            return []
+        markers = [os.path.join(self.snapshot_dir, name, SNAPSHOT_MARKER) for name in names]
+        ready = [marker for marker in markers if os.path.exists(marker)]
+        ready.sort(key=os.path.getmtime, reverse=True)
+        return [os.path.dirname(marker) for marker in ready]
+
+    def _prune_snapshots(self, current: str):
+        """(Sync) Keep the SNAPSHOT_KEEP most recent snapshots and drop unfinished ones.
+        Bot directories made from a pruned snapshot are unaffected: they hold their own links or copies.
+        """
+        keep = self._snapshots()[:max(1, Config.SNAPSHOT_KEEP)]
+        try:
+            names = os.listdir(self.snapshot_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.snapshot_dir, name)
+            if path != current and path not in keep:
+                trash_bin.discard(path)
+
+    async def _ensure_snapshot(self) -> Optional[str]:
+        """Path of the snapshot of the target commit, captured on first use (call under _snapshot_lock).
+        None when snapshots are disabled, the target commit is unknown or the snapshot cannot be built.
+        """
+        if not Config.SNAPSHOTS_ENABLED:
+            return None
+        key = 'template'
+        if self.repo_url:
+            key = await self.get_target_sha()
+            if not key:
+                return None
+        path = os.path.join(self.snapshot_dir, key)
+        if os.path.exists(os.path.join(path, SNAPSHOT_MARKER)):
+            return path
+        building = f"{path}.building"
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            trash_bin.discard(building)
+            await self._build_prepared_dir(building)
+            if self.repo_url and self._checkout_sha(building) != key:
+                # Clone failed and a local template was generated: not what this commit looks like
+                raise RuntimeError(f"could not check out {key[:12]}")
+            with open(os.path.join(building, SNAPSHOT_MARKER), 'w') as f:
+                f.write(key)
+            os.rename(building, path)
+        except Exception as e:
+            logger.error(f"Error capturing snapshot {key[:12]}: {e}")
+            trash_bin.discard(building)
+            return None
+        logger.log_system_event("Snapshot captured", details=key)
+        self._prune_snapshots(path)
+        return path
+
+    async def materialize_snapshot(self, bot_dir: str, bot_id: Optional[int] = None) -> bool:
+        """Create bot_dir (which must not exist) from the snapshot of the target commit, capturing it if needed.
+        Per-bot files (.env, logs/, run/) are written afterwards by the deploy. False if no snapshot is available.
+        """
+        async with self._snapshot_lock:
+            # Held while copying too, so a concurrent capture cannot prune the snapshot being read
+            snapshot = await self._ensure_snapshot()
+            if snapshot is None:
+                return False
+            try:
+                counts = await asyncio.to_thread(self._materialize, snapshot, bot_dir)
+            except Exception as e:
+                logger.error(f"Error materializing snapshot into {bot_dir}: {e}")
+                trash_bin.discard(bot_dir)
+                return False
+        details = f"{os.path.basename(snapshot)[:12]} " + " ".join(f"{k}={v}" for k, v in counts.items())
+        if bot_id is not None:
+            logger.log_bot_event(bot_id, "Materialized from snapshot", details=details)
+        return True
+
+    async def _build_warm_slot(self) -> bool:
+        """Prepare one slot (from the snapshot when there is one, else as a first deploy would), then mark it ready.
+        It is built under a *.building name, so a manager restart never leaves a half-built slot claimable.
+        """
+        name = f"slot_{time.time_ns()}"
+        building = os.path.join(self.warm_pool_dir, f"{name}.building")
+        try:
+            os.makedirs(self.warm_pool_dir, exist_ok=True)
+            if not await self.materialize_snapshot(building):
+                await self._build_prepared_dir(building)
+            with open(os.path.join(building, WARM_SLOT_MARKER), 'w') as f:
+                f.write(self._checkout_sha(building) or '')
+            os.rename(building, os.path.join(self.warm_pool_dir, name))
+            logger.log_system_event("Warm pool slot ready", details=name)
+            return True
+        except Exception as e:
+            logger.error(f"Error building warm pool slot: {e}")
+            trash_bin.discard(building)
+            return False
+
+    async def refill_warm_pool(self):
+        """Top the warm pool up to WARM_POOL_SIZE ready slots, replacing slots built from an outdated commit."""
+        if Config.WARM_POOL_SIZE <= 0:
+            return
+        async with self._warm_pool_lock:
+            # Builds only happen under this lock, so *.building leftovers are from an interrupted run
+            try:
+                leftovers = [name for name in os.listdir(self.warm_pool_dir) if not name.startswith('slot_') or name.endswith('.building')]
+            except OSError:
+                leftovers = []
+            for name in leftovers:
+                trash_bin.discard(os.path.join(self.warm_pool_dir, name))
+            target = await self.get_target_sha() if self.repo_url else None
+            if target:
+                for slot in self._warm_slots():
+                    with open(os.path.join(slot, WARM_SLOT_MARKER)) as f:
+                        if f.read().strip() == target:
+                            continue
+                    # Moved out at once, so a concurrent deploy cannot claim it
+                    trash_bin.discard(slot)
+            while len(self._warm_slots()) < Config.WARM_POOL_SIZE:
+                if not await self._build_warm_slot():
+                    break
+
+    def kick_warm_pool_refill(self):
+        """Refill the warm pool in the background unless a refill is already running."""
+        if Config.WARM_POOL_SIZE <= 0:
+            return
+        if self._warm_refill_task is None or self._warm_refill_task.done():
+            self._warm_refill_task = asyncio.create_task(self.refill_warm_pool())
+
+    def _claim_warm_slot(self, bot_id: int, bot_dir: str) -> bool:
+        """(Sync) Move a ready slot into place as the bot's directory. False if the pool is empty."""
+        for slot in self._warm_slots():
+            try:
+                # A rename within the deployment directory: atomic, and the venv keeps working from its new path
+                os.rename(slot, bot_dir)
+            except OSError:
+                continue
+            try:
+                os.remove(os.path.join(bot_dir, WARM_SLOT_MARKER))
+            except OSError:
+                pass
+            logger.log_bot_event(bot_id, "Claimed warm pool slot", details=os.path.basename(slot))
+            return True
+        return False
+
     async def create_bot_template(self, bot_dir: str):
         """Create a basic bot template (python-telegram-bot v21)"""
         logger.log_system_event("Generating minimal bot template", details=bot_dir)
+        os.makedirs(bot_dir, exist_ok=True)
         bot_code = '''import asyncio
+import json
 import logging
+import signal
+import time
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, ContextTypes, TypeHandler
 import os
 from dotenv import load_dotenv
 
@@ -112,27 +642,81 @@ logger = logging.getLogger(__name__)
 class BotInstance:
     def __init__(self, token: str):
         self.token = token
-        self.application = Application.builder().token(token).build()
+        builder = Application.builder().token(token)
+        # Set by the manager when bots talk to a local Bot API server
+        if os.getenv('BOT_API_BASE_URL'):
+            builder = builder.base_url(os.getenv('BOT_API_BASE_URL'))
+        self.application = builder.build()
+        self.last_heartbeat = 0.0
         self.setup_handlers()
     
     def setup_handlers(self):
+        # Runs before every other handler: lets the manager see when the bot was last used
+        self.application.add_handler(TypeHandler(Update, self.record_activity), group=-1)
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("status", self.status_command))
     
+    async def record_activity(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        now = time.time()
+        if now - self.last_heartbeat < 30:
+            return
+        self.last_heartbeat = now
+        run_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run")
+        os.makedirs(run_dir, exist_ok=True)
+        with open(os.path.join(run_dir, "last_update"), "w") as f:
+            f.write(str(int(now)))
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text("🤖 ربات فعاله!\nبرای دیدن دستورات /help رو بزن.")
+        await update.message.reply_text("🤖 ربات فعاله!\\nبرای دیدن دستورات /help رو بزن.")
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        help_text = "🤖 دستورات ربات:\n/start - شروع\n/help - همین راهنما\n/status - وضعیت ربات"
+        help_text = "🤖 دستورات ربات:\\n/start - شروع\\n/help - همین راهنما\\n/status - وضعیت ربات"
         await update.message.reply_text(help_text)
     
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("✅ ربات فعاله و سالم کار می‌کنه!")
     
+    async def handle_update_connection(self, reader, writer):
+        # One JSON update per line from the manager's webhook ingress; "ok" once it is queued
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                update = Update.de_json(json.loads(line), self.application.bot)
+                await self.application.update_queue.put(update)
+                writer.write(b"ok\\n")
+            except Exception as e:
+                logger.error(f"Bad update from ingress: {e}")
+                writer.write(b"error\\n")
+            await writer.drain()
+        writer.close()
+    
     async def run(self):
+        update_socket = os.getenv('BOT_UPDATE_SOCKET')
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
         try:
-            await self.application.run_polling()
+            async with self.application:
+                await self.application.start()
+                if update_socket:
+                    # Webhook mode: updates arrive from the manager instead of a long-poll loop
+                    if os.path.exists(update_socket):
+                        os.unlink(update_socket)
+                    server = await asyncio.start_unix_server(self.handle_update_connection, path=update_socket)
+                    os.chmod(update_socket, 0o600)
+                else:
+                    server = None
+                    await self.application.updater.start_polling()
+                await stop.wait()
+                if server:
+                    server.close()
+                if self.application.updater.running:
+                    await self.application.updater.stop()
+                await self.application.stop()
         except Exception as e:
             logger.error(f"Error running bot: {e}")
 
@@ -165,15 +749,116 @@ python-dotenv==1.0.1
 '''
         with open(os.path.join(bot_dir, ".env.template"), "w") as f:
             f.write(env_template)
+        
+        with open(os.path.join(bot_dir, TEMPLATE_MARKER), "w") as f:
+            f.write("bot.py\n")
     
-    async def update_bot_code(self, bot_id: int) -> bool:
+    def _held_back(self, bot_id: int, repo: git.Repo, bad_sha: Optional[str]) -> bool:
+        """(Sync) True if the fetched origin head is the commit the bot was rolled back from."""
+        if not bad_sha:
+            return False
+        if repo.commit(f'origin/{repo.active_branch.name}').hexsha != bad_sha:
+            return False
+        logger.log_bot_event(bot_id, "Update held back: head was rolled back", details=bad_sha[:7])
+        return True
+
+    def _fast_forward_from_mirror(self, repo: git.Repo, bot_id: int = 0, bad_sha: Optional[str] = None):
+        """(Sync) Point origin at the local mirror and fast-forward the checked out branch from it
+        (unless the mirror head is bad_sha, the commit the bot was rolled back from)."""
+        origin = repo.remotes.origin
+        # Bots cloned from the network before the mirror existed are migrated here
+        if origin.url != self.mirror_dir:
+            origin.set_url(self.mirror_dir)
+        origin.fetch()
+        if self._held_back(bot_id, repo, bad_sha):
+            return
+        branch = repo.active_branch.name
+        try:
+            repo.git.merge('--ff-only', f'origin/{branch}')
+        except git.GitCommandError:
+            # Diverged (e.g. force-push upstream): follow the mirror
+            repo.git.reset('--hard', f'origin/{branch}')
+
+    def _update_checkout(self, bot_id: int, bot_dir: str, mirror_ok: bool, bad_sha: Optional[str] = None) -> bool:
+        """(Sync) Bring a git checkout up to date from the mirror (or origin). Returns False on git errors.
+        A head equal to bad_sha (see rollback_bot) is not checked out; the bot stays where it is."""
+        try:
+            repo = git.Repo(bot_dir)
+            old_sha = None
+            try:
+                old_sha = repo.head.commit.hexsha[:7]
+            except Exception:
+                pass
+            try:
+                # Discard local changes to avoid merge conflicts during pull
+                repo.git.reset('--hard')
+            except Exception:
+                pass
+            pull_info = None
+            if mirror_ok:
+                self._fast_forward_from_mirror(repo, bot_id, bad_sha)
+            elif bad_sha:
+                repo.remotes.origin.fetch()
+                if not self._held_back(bot_id, repo, bad_sha):
+                    pull_info = repo.remotes.origin.pull()
+            else:
+                # Pull latest changes from origin
+                pull_info = repo.remotes.origin.pull()
+            new_sha = None
+            try:
+                new_sha = repo.head.commit.hexsha[:7]
+            except Exception:
+                pass
+            details = f"pulled {'mirror' if mirror_ok else 'origin'} -> {new_sha or '-'}"
+            if old_sha and new_sha:
+                details = f"{old_sha} -> {new_sha}"
+            # Summarize pulled refs if available
+            try:
+                if pull_info:
+                    ref_summaries = ", ".join([f"{pi.name}:{getattr(pi, 'commit', None) and getattr(pi.commit, 'hexsha', '')[:7]}" for pi in pull_info])
+                    details += f" | refs: {ref_summaries}"
+            except Exception:
+                pass
+            logger.log_bot_event(bot_id, "Git update completed", details=details)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating repo for bot {bot_id}: {e}")
+            return False
+
+    def _prepare_venv(self, bot_id: int, bot_dir: str) -> str:
+        """(Sync) Ensure a venv with working pip and installed requirements. Returns the venv python."""
+        python_exec = self._ensure_pip_ok(bot_dir)
+        if not python_exec:
+            raise RuntimeError("Failed to bootstrap pip inside venv")
+        # Install requirements if present (skipped when unchanged)
+        self._install_requirements(bot_id, bot_dir, python_exec)
+        return python_exec
+
+    async def update_bot_code(self, bot_id: int, fetch: bool = True, on_stage: Optional[StageCallback] = None) -> bool:
         """Update bot code from the configured Git repository and ensure dependencies are installed.
-        - If the bot directory is a git repo, perform a pull.
+        - If the bot directory is a git repo, fast-forward it from the local mirror (or pull from origin without one).
         - Ensure venv exists and install requirements.
+        Pass fetch=False when the caller already synced the mirror for this update cycle.
+        git/pip work runs in a worker thread, bounded by BOT_INSTALL_CONCURRENCY.
+        on_stage is awaited with 'fetch' and 'install' as each stage begins; stage timings go to deploy_runs.
         """
+        return await self._bot_operation(bot_id, f"update:{fetch}",
+                                         lambda: self._update_bot_code_op(bot_id, fetch, on_stage))
+
+    async def _update_bot_code_op(self, bot_id: int, fetch: bool, on_stage: Optional[StageCallback]) -> bool:
+        run, owned = DeployRun.begin(bot_id, 'update', on_stage)
+        ok = await self._update_bot_code(bot_id, fetch, run)
+        if owned:
+            await run.finish(ok)
+        return ok
+
+    async def _update_bot_code(self, bot_id: int, fetch: bool, on_stage: StageCallback) -> bool:
         try:
             bot_dir = os.path.join(self.deployment_dir, f"bot_{bot_id}")
             logger.log_bot_event(bot_id, "Update requested", details=bot_dir)
+            if on_stage:
+                await on_stage('fetch')
+            mirror_ok = (await self.sync_mirror()) if fetch else self._mirror_ready()
             # Ensure bot directory exists
             if not os.path.exists(bot_dir):
                 # Create by cloning or generating template
@@ -181,70 +866,63 @@ python-dotenv==1.0.1
                 if not created:
                     return False
             
-            git_dir = os.path.join(bot_dir, '.git')
-            if os.path.exists(git_dir):
-                try:
-                    repo = git.Repo(bot_dir)
-                    old_sha = None
-                    try:
-                        old_sha = repo.head.commit.hexsha[:7]
-                    except Exception:
-                        pass
-                    try:
-                        # Discard local changes to avoid merge conflicts during pull
-                        repo.git.reset('--hard')
-                    except Exception:
-                        pass
-                    # Pull latest changes from origin
-                    pull_info = repo.remotes.origin.pull()
-                    new_sha = None
-                    try:
-                        new_sha = repo.head.commit.hexsha[:7]
-                    except Exception:
-                        pass
-                    details = f"pulled origin -> {new_sha or '-'}"
-                    if old_sha and new_sha:
-                        details = f"{old_sha} -> {new_sha}"
-                    # Summarize pulled refs if available
-                    try:
-                        if pull_info:
-                            ref_summaries = ", ".join([f"{pi.name}:{getattr(pi, 'commit', None) and getattr(pi.commit, 'hexsha', '')[:7]}" for pi in pull_info])
-                            details += f" | refs: {ref_summaries}"
-                    except Exception:
-                        pass
-                    logger.log_bot_event(bot_id, "Git pull completed", details=details)
-                except Exception as e:
-                    logger.error(f"Error updating repo for bot {bot_id}: {e}")
-                    return False
-            else:
-                # Not a git repo; skip code update to avoid nuking local files
-                # Admin can re-deploy if needed to convert to git-backed.
-                logger.log_bot_event(bot_id, "Skipping update: not a git repository", details=bot_dir)
-
-            # Ensure Python venv and working pip
-            python_exec = self._ensure_pip_ok(bot_dir)
-            if not python_exec:
-                raise RuntimeError("Failed to bootstrap pip inside venv during update")
-
-            # Install requirements if present
-            requirements_file = os.path.join(bot_dir, "requirements.txt")
-            if os.path.exists(requirements_file):
-                env = os.environ.copy()
-                env['PIP_DISABLE_PIP_VERSION_CHECK'] = '1'
-                logger.log_bot_event(bot_id, "Installing dependencies", details=requirements_file)
-                subprocess.run([python_exec, "-m", "pip", "install", "-r", requirements_file, "--no-cache-dir", "-q"], cwd=bot_dir, check=True, env=env)
+            async with self._install_semaphore:
+                git_dir = os.path.join(bot_dir, '.git')
+                if os.path.exists(git_dir):
+                    bot_row = await db.get_bot(bot_id)
+                    bad_sha = bot_row.get('bad_sha') if bot_row else None
+                    if not await asyncio.to_thread(self._update_checkout, bot_id, bot_dir, mirror_ok, bad_sha):
+                        return False
+                else:
+                    # Not a git repo; skip code update to avoid nuking local files
+                    # Admin can re-deploy if needed to convert to git-backed.
+                    logger.log_bot_event(bot_id, "Skipping update: not a git repository", details=bot_dir)
+
+                # Ensure Python venv, working pip and requirements
+                if on_stage:
+                    await on_stage('install')
+                await asyncio.to_thread(self._prepare_venv, bot_id, bot_dir)
 
             return True
         except Exception as e:
             logger.error(f"Error updating code for bot {bot_id}: {e}")
             return False
     
-    async def deploy_bot(self, bot_id: int, bot_token: str) -> bool:
-        """Deploy a bot with the given token"""
+    async def deploy_bot(self, bot_id: int, bot_token: str, on_stage: Optional[StageCallback] = None,
+                         admit: bool = True) -> bool:
+        """Deploy a bot with the given token.
+        on_stage is awaited with 'claim', 'materialize' or 'clone' (only when the directory has to be created),
+        'install' and 'spawn' as each stage begins, so callers can persist progress; stage timings go to deploy_runs.
+        With admit=True (new starts) the host capacity is checked before the directory is built and
+        AdmissionDenied is raised if the bot does not fit; restarts of a bot that was just running pass admit=False.
+        A bot that is already running is left alone, and concurrent deploys of it join the one in flight.
+        """
+        return await self._bot_operation(bot_id, 'deploy', lambda: self._deploy_bot_op(bot_id, bot_token, on_stage, admit))
+
+    async def _deploy_bot_op(self, bot_id: int, bot_token: str, on_stage: Optional[StageCallback], admit: bool) -> bool:
+        if await self.is_bot_running(bot_id):
+            logger.log_bot_event(bot_id, "Deploy skipped: already running")
+            return True
+        run, owned = DeployRun.begin(bot_id, 'deploy', on_stage)
+        try:
+            ok = await self._deploy_bot(bot_id, bot_token, run, admit)
+        finally:
+            self._admission_reserved.pop(bot_id, None)
+        if owned:
+            await run.finish(ok)
+        return ok
+
+    async def _deploy_bot(self, bot_id: int, bot_token: str, on_stage: StageCallback, admit: bool) -> bool:
         try:
             bot_dir = os.path.join(self.deployment_dir, f"bot_{bot_id}")
             logger.log_bot_event(bot_id, "Deploy requested", details=bot_dir)
             
+            # Before any clone/install work, so a refused deploy is cheap to retry. Bots already set up
+            # for the shared host do not get a process of their own and are not subject to admission.
+            shared = Config.SHARED_HOST_ENABLED and os.path.exists(os.path.join(bot_dir, TEMPLATE_MARKER))
+            if admit and bot_id not in self.running_bots and not shared:
+                await self.admit_bot(bot_id)
+            
             # Ensure repo present: if BOT_REPO_URL is set but directory is missing or not a git repo, reclone
             need_clone = False
             if not os.path.exists(bot_dir):
@@ -253,16 +931,31 @@ python-dotenv==1.0.1
                 git_dir = os.path.join(bot_dir, '.git')
                 if Config.BOT_REPO_URL and not os.path.exists(git_dir):
                     # Existing non-git directory (likely local template). Re-clone from repo.
-                    shutil.rmtree(bot_dir, ignore_errors=True)
+                    trash_bin.discard(bot_dir)
                     need_clone = True
-            if need_clone:
-                if not await self.clone_bot_template(bot_id):
-                    return False
+            if need_clone and self._claim_warm_slot(bot_id, bot_dir):
+                if on_stage:
+                    await on_stage('claim')
+                self.kick_warm_pool_refill()
+                # A slot can predate the latest fetch; bring it to the target commit (requirements follow in 'install')
+                if self.repo_url and self._checkout_sha(bot_dir) != await self.get_target_sha():
+                    async with self._install_semaphore:
+                        await asyncio.to_thread(self._update_checkout, bot_id, bot_dir, self._mirror_ready())
+            elif need_clone:
+                materialized = False
+                if Config.SNAPSHOTS_ENABLED:
+                    if on_stage:
+                        await on_stage('materialize')
+                    materialized = await self.materialize_snapshot(bot_dir, bot_id)
+                if not materialized:
+                    if on_stage:
+                        await on_stage('clone')
+                    if not await self.clone_bot_template(bot_id):
+                        return False
             
             # Detect entrypoint. If missing, generate a minimal template.
-            candidate_files = ["main.py", "bot.py", "app.py", "run.py"]
             entrypoint = None
-            for fname in candidate_files:
+            for fname in ENTRYPOINT_CANDIDATES:
                 if os.path.exists(os.path.join(bot_dir, fname)):
                     entrypoint = fname
                     break
@@ -281,26 +974,34 @@ python-dotenv==1.0.1
                 ))
             logger.log_bot_event(bot_id, ".env written", details=env_file)
             
-            # Ensure venv + working pip
-            python_exec = self._ensure_pip_ok(bot_dir)
-            if not python_exec:
-                raise RuntimeError("Failed to bootstrap pip inside venv")
-
-            # Install dependencies inside venv (quiet; disable version check to reduce noise)
-            requirements_file = os.path.join(bot_dir, "requirements.txt")
-            if os.path.exists(requirements_file):
-                env = os.environ.copy()
-                env['PIP_DISABLE_PIP_VERSION_CHECK'] = '1'
-                logger.log_bot_event(bot_id, "Installing dependencies", details=requirements_file)
-                subprocess.run([python_exec, "-m", "pip", "install", "-r", requirements_file, "--no-cache-dir", "-q"], cwd=bot_dir, check=True, env=env)
+            if Config.SHARED_HOST_ENABLED and entrypoint == "bot.py" and os.path.exists(os.path.join(bot_dir, TEMPLATE_MARKER)):
+                if on_stage:
+                    await on_stage('spawn')
+                return await self._deploy_shared(bot_id, bot_token, bot_dir)
+            
+            # Ensure venv + working pip + dependencies (quiet; skipped when requirements are unchanged)
+            if on_stage:
+                await on_stage('install')
+            async with self._install_semaphore:
+                python_exec = await asyncio.to_thread(self._prepare_venv, bot_id, bot_dir)
             
-            # Start the bot process (log to files to avoid pipe blocking)
+            # Plan-based limits; the cgroup (if configured) is prepared before the spawn
+            if on_stage:
+                await on_stage('spawn')
+            limits = await self.get_resource_limits(bot_id)
+            cgroup = await asyncio.to_thread(self._setup_cgroup, bot_id, limits)
+            oom_kills = self._cgroup_oom_kills(cgroup)
+            pids_max_hits = self._cgroup_pids_max_hits(cgroup)
+
+            # Start the bot process; output goes through the log collector's pipes (rotated, size-capped
+            # logs under logs/) and straight to the log files when the collector is off
             logs_dir = os.path.join(bot_dir, 'logs')
             os.makedirs(logs_dir, exist_ok=True)
             stdout_path = os.path.join(logs_dir, 'stdout.log')
             stderr_path = os.path.join(logs_dir, 'stderr.log')
-            stdout_file = open(stdout_path, 'ab', buffering=0)
-            stderr_file = open(stderr_path, 'ab', buffering=0)
+            pipes = log_collector.prepare(bot_id, bot_dir)
+            if pipes:
+                stdout_path, stderr_path = pipes['stdout'], pipes['stderr']
 
             # Pass BOT_TOKEN via environment to support repos that read env directly
             env = os.environ.copy()
@@ -308,6 +1009,10 @@ python-dotenv==1.0.1
             # Prefer per-bot admin/channel from DB if present
             try:
                 bot_row = await db.get_bot(bot_id)
+                if bot_row and bot_row.get('status') == Config.BOT_STATUS_QUARANTINED:
+                    # Explicit start of a quarantined bot releases it with a clean crash history
+                    self._crash_history.pop(bot_id, None)
+                    logger.log_bot_event(bot_id, "Released from quarantine")
                 if bot_row and bot_row.get('admin_user_id'):
                     env['ADMIN_ID'] = str(bot_row['admin_user_id'])
                 else:
@@ -320,48 +1025,890 @@ python-dotenv==1.0.1
                 env['ADMIN_ID'] = str(Config.ADMIN_USER_ID or '')
                 env['CHANNEL_ID'] = str(Config.LOCKED_CHANNEL_ID or '')
             env['PYTHONUNBUFFERED'] = '1'
+            if Config.TELEGRAM_API_BASE_URL != 'https://api.telegram.org':
+                env['BOT_API_BASE_URL'] = f"{Config.TELEGRAM_API_BASE_URL}/bot"
+            # Template bots can take updates from the webhook ingress; without a webhook they keep polling
+            if webhook_ingress.enabled and os.path.exists(os.path.join(bot_dir, TEMPLATE_MARKER)):
+                os.makedirs(os.path.join(bot_dir, 'run'), exist_ok=True)
+                if await webhook_ingress.register(bot_id, bot_token):
+                    env['BOT_UPDATE_SOCKET'] = webhook_ingress.update_socket(bot_id)
+                    logger.log_bot_event(bot_id, "Webhook registered", details="updates via ingress")
+                else:
+                    logger.log_bot_event(bot_id, "Webhook registration failed; bot will poll")
 
-            process = subprocess.Popen(
-                [python_exec, entrypoint],
-                cwd=bot_dir,
-                stdout=stdout_file,
-                stderr=stderr_file,
-                env=env
-            )
+            # Bounded so a fleet-wide restart does not boot hundreds of interpreters at once;
+            # the slot is held for a short settle period covering interpreter start-up
+            async with self._spawn_semaphore:
+                zygote_key = None
+                process = None
+                if Config.BOT_ZYGOTE_ENABLED:
+                    zygote_key = self._zygote_key(python_exec, bot_dir)
+                    process = await self._spawn_via_zygote(bot_id, zygote_key, python_exec, bot_dir, entrypoint, env,
+                                                           stdout_path, stderr_path)
+                if process is None:
+                    zygote_key = None
+                    # Own session/process group: manager crashes, restarts and terminal signals do not reach the bot.
+                    # The log targets are only needed by the child, so the parent's handles are closed right away.
+                    stdout_fd = self._open_log_target(stdout_path)
+                    stderr_fd = self._open_log_target(stderr_path)
+                    try:
+                        process = subprocess.Popen(
+                            [python_exec, entrypoint],
+                            cwd=bot_dir,
+                            stdin=subprocess.DEVNULL,
+                            stdout=stdout_fd,
+                            stderr=stderr_fd,
+                            env=env,
+                            start_new_session=True
+                        )
+                    finally:
+                        os.close(stdout_fd)
+                        os.close(stderr_fd)
+                # Applied from the parent (prlimit/cgroup.procs) instead of preexec_fn, which is unsafe with threads
+                self._apply_resource_limits(bot_id, process.pid, limits, cgroup)
+                if Config.BOT_SPAWN_SETTLE_SECONDS > 0:
+                    await asyncio.sleep(Config.BOT_SPAWN_SETTLE_SECONDS)
             
             # Store process info
+            deployed_sha = self._checkout_sha(bot_dir)
             self.running_bots[bot_id] = {
                 'process': process,
                 'started_at': datetime.now(),
-                'bot_dir': bot_dir
+                'bot_dir': bot_dir,
+                'sha': deployed_sha,
+                'limits': limits,
+                'cgroup': cgroup,
+                'oom_kills': oom_kills,
+                'pids_max_hits': pids_max_hits,
+                'zygote': zygote_key
             }
             
+            # Await the child's exit in the background so crashes are handled within seconds
+            self.running_bots[bot_id]['watcher'] = asyncio.create_task(self._watch_bot(bot_id, process))
+            
             # Update database
             await db.update_bot_status(bot_id, Config.BOT_STATUS_ACTIVE, process.pid)
-            logger.log_bot_event(bot_id, "Bot started", details=f"pid={process.pid}")
+            await db.set_bot_deployed_sha(bot_id, deployed_sha)
+            try:
+                # Enough to find, verify and signal the process after a manager restart
+                create_time = psutil.Process(process.pid).create_time()
+                await db.set_bot_launch_meta(bot_id, create_time, {
+                    'pid': process.pid,
+                    'pgid': process.pid,
+                    'create_time': create_time,
+                    'python': python_exec,
+                    'entrypoint': entrypoint,
+                    'cwd': bot_dir,
+                    'sha': deployed_sha,
+                    'tier': limits['tier'],
+                    'cgroup': cgroup,
+                    'zygote': zygote_key,
+                    'stdout': stdout_path,
+                    'stderr': stderr_path,
+                    'started_at': datetime.now().isoformat()
+                })
+            except psutil.Error:
+                pass
+            logger.log_bot_event(bot_id, "Bot started", details=f"pid={process.pid} sha={(deployed_sha or '-')[:7]}")
             
             return True
+        except AdmissionDenied:
+            raise
         except Exception as e:
             logger.error(f"Error deploying bot {bot_id}: {e}")
             return False
     
+    @staticmethod
+    def _open_log_target(path: str) -> int:
+        """Open a child's stdout/stderr target: a collector pipe read-write (writes never hit EPIPE while
+        the manager is away, but block once the pipe buffer is full), a plain log file for appending."""
+        if os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode):
+            return os.open(path, os.O_RDWR)
+        return os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    async def _wait_for_exit(self, process, timeout: Optional[float] = None) -> bool:
+        """Await process exit without blocking the event loop. Returns True if it exited within timeout.
+        Uses a pidfd registered with the loop on Linux (no threads, no polling) and falls back to polling.
+        """
+        if process.poll() is not None:
+            await self._collect_exit_code(process)
+            return True
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            pidfd = None
+        try:
+            if pidfd is not None:
+                exited = loop.create_future()
+                loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+                try:
+                    await asyncio.wait_for(exited, timeout)
+                finally:
+                    loop.remove_reader(pidfd)
+            else:
+                deadline = None if timeout is None else loop.time() + timeout
+                while process.poll() is None:
+                    if deadline is not None and loop.time() >= deadline:
+                        return False
+                    await asyncio.sleep(0.5)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+        await self._collect_exit_code(process)
+        return True
+
+    async def _collect_exit_code(self, process):
+        """Reap the child and populate returncode. A zygote child's code is asked from its zygote once;
+        if that query fails the code stays at the unknown -1 instead of being asked again on every poll."""
+        process.poll()
+        if isinstance(process, ZygoteChild) and process.returncode is not None and not process.exit_queried:
+            process.exit_queried = True
+            try:
+                reply = await self._zygote_request(process.zygote_socket, {'op': 'status', 'pid': process.pid}, timeout=1)
+                if reply.get('exit_code') is not None:
+                    process.returncode = reply['exit_code']
+            except (OSError, ValueError, asyncio.TimeoutError):
+                pass
+
+    def _shared_host_dir(self) -> str:
+        return os.path.join(self.deployment_dir, '.shared_host')
+
+    async def _shared_host_request(self, index: int, payload: Dict[str, Any], timeout: float = 60) -> Dict[str, Any]:
+        """Send one JSON request to a shared host over its Unix socket and return the JSON reply."""
+        socket_path = os.path.join(self._shared_host_dir(), f"host_{index}.sock")
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(socket_path), timeout)
+        try:
+            writer.write(json.dumps(payload).encode() + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        finally:
+            writer.close()
+        if not line:
+            return {'ok': False, 'error': 'shared host closed the connection'}
+        return json.loads(line)
+
+    async def _ensure_shared_host(self, index: int) -> Dict[str, Any]:
+        """Return shared host `index`, spawning it if it is not running. Caller holds _shared_host_lock."""
+        host = self.shared_hosts.get(index)
+        if host and host['process'].poll() is None:
+            return host
+        base = self._shared_host_dir()
+        os.makedirs(base, exist_ok=True)
+        socket_path = os.path.join(base, f"host_{index}.sock")
+        with open(os.path.join(base, f"host_{index}.log"), 'ab', buffering=0) as log_file:
+            process = subprocess.Popen(
+                [sys.executable, SHARED_HOST_SCRIPT, '--socket', socket_path],
+                cwd=base,
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+        with open(os.path.join(base, f"host_{index}.pid"), 'w') as f:
+            f.write(str(process.pid))
+        # Wait for the socket to answer before handing out the host
+        for _ in range(100):
+            if process.poll() is not None:
+                raise RuntimeError(f"shared host {index} exited with code {process.returncode}")
+            try:
+                if (await self._shared_host_request(index, {'op': 'ping'}, timeout=2)).get('ok'):
+                    break
+            except (OSError, asyncio.TimeoutError, ValueError):
+                pass
+            await asyncio.sleep(0.2)
+        else:
+            self._signal_process(process, signal.SIGKILL)
+            raise RuntimeError(f"shared host {index} did not come up")
+        host = {'process': process, 'socket': socket_path, 'bots': set()}
+        self.shared_hosts[index] = host
+        logger.log_system_event("Shared host started", details=f"index={index} pid={process.pid}")
+        return host
+
+    def _register_shared_bot(self, bot_id: int, index: int, bot_dir: str, started_at: Optional[datetime] = None):
+        host = self.shared_hosts[index]
+        host['bots'].add(bot_id)
+        self.running_bots[bot_id] = {
+            'process': host['process'],
+            'started_at': started_at or datetime.now(),
+            'bot_dir': bot_dir,
+            'sha': self._checkout_sha(bot_dir),
+            'shared': index
+        }
+        # A shared bot goes down with its host, so the supervisor watches the host process
+        self.running_bots[bot_id]['watcher'] = asyncio.create_task(self._watch_bot(bot_id, host['process']))
+
+    async def _deploy_shared(self, bot_id: int, bot_token: str, bot_dir: str) -> bool:
+        """Start a template bot inside a shared host (filling hosts up to SHARED_HOST_CAPACITY bots each)."""
+        bot_row = await db.get_bot(bot_id)
+        if bot_row and bot_row.get('status') == Config.BOT_STATUS_QUARANTINED:
+            self._crash_history.pop(bot_id, None)
+            logger.log_bot_event(bot_id, "Released from quarantine")
+        async with self._shared_host_lock:
+            index = 0
+            while True:
+                host = self.shared_hosts.get(index)
+                if host is None or host['process'].poll() is not None or len(host['bots']) < Config.SHARED_HOST_CAPACITY:
+                    break
+                index += 1
+            host = await self._ensure_shared_host(index)
+            # Reserve the slot before releasing the lock so concurrent deploys spread across hosts
+            host['bots'].add(bot_id)
+        try:
+            response = await self._shared_host_request(index, {
+                'op': 'start', 'bot_id': bot_id, 'token': bot_token, 'bot_dir': bot_dir
+            })
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            response = {'ok': False, 'error': f"shared host unreachable: {e}"}
+        if not response.get('ok'):
+            host['bots'].discard(bot_id)
+            logger.log_bot_event(bot_id, "Shared host start failed", details=response.get('error'))
+            # After a timeout the host may have started the bot anyway; it must not poll untracked
+            try:
+                await self._shared_host_request(index, {'op': 'stop', 'bot_id': bot_id}, timeout=10)
+            except (OSError, asyncio.TimeoutError, ValueError):
+                pass
+            return False
+        self._register_shared_bot(bot_id, index, bot_dir)
+        pid = host['process'].pid
+        await db.update_bot_status(bot_id, Config.BOT_STATUS_ACTIVE, pid)
+        await db.set_bot_deployed_sha(bot_id, self.running_bots[bot_id]['sha'])
+        try:
+            create_time = psutil.Process(pid).create_time()
+            await db.set_bot_launch_meta(bot_id, create_time, {
+                'mode': 'shared',
+                'host': index,
+                'pid': pid,
+                'create_time': create_time,
+                'socket': host['socket'],
+                'cwd': bot_dir,
+                'sha': self.running_bots[bot_id]['sha'],
+                'started_at': datetime.now().isoformat()
+            })
+        except psutil.Error:
+            pass
+        logger.log_bot_event(bot_id, "Bot started in shared host", details=f"host={index} pid={pid}")
+        return True
+
+    async def _stop_shared(self, bot_id: int, process_info: Dict[str, Any]):
+        index = process_info['shared']
+        process_info['stopping'] = True
+        try:
+            response = await self._shared_host_request(index, {'op': 'stop', 'bot_id': bot_id})
+            if not response.get('ok'):
+                logger.log_bot_event(bot_id, "Shared host stop failed", details=response.get('error'))
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            # Host already gone: nothing left to stop
+            logger.log_bot_event(bot_id, "Shared host unreachable on stop", details=str(e))
+        host = self.shared_hosts.get(index)
+        if host:
+            host['bots'].discard(bot_id)
+        watcher = process_info.get('watcher')
+        if watcher:
+            # The host keeps running, so this bot's watcher would never return
+            watcher.cancel()
+
+    async def _adopt_shared_bots(self) -> List[int]:
+        """Re-attach to shared hosts that survived a manager restart and register their bots."""
+        base = self._shared_host_dir()
+        if not os.path.isdir(base):
+            return []
+        bots = {bot['id']: bot for bot in await db.get_all_bots()}
+        adopted = []
+        for name in sorted(os.listdir(base)):
+            if not (name.startswith('host_') and name.endswith('.pid')):
+                continue
+            try:
+                index = int(name[5:-4])
+                with open(os.path.join(base, name)) as f:
+                    proc = psutil.Process(int(f.read().strip()))
+                if SHARED_HOST_SCRIPT not in proc.cmdline():
+                    continue
+                self.shared_hosts[index] = {
+                    'process': AdoptedProcess(proc),
+                    'socket': os.path.join(base, f"host_{index}.sock"),
+                    'bots': set()
+                }
+                response = await self._shared_host_request(index, {'op': 'list'}, timeout=10)
+            except (OSError, ValueError, psutil.Error, asyncio.TimeoutError):
+                continue
+            for key, started_at in (response.get('bots') or {}).items():
+                bot_id = int(key)
+                if bot_id not in bots or bot_id in self.running_bots:
+                    # Deleted bot, or already running elsewhere: it must not keep polling here
+                    await self._shared_host_request(index, {'op': 'stop', 'bot_id': bot_id})
+                    continue
+                self._register_shared_bot(bot_id, index, self._bot_dir(bot_id), datetime.fromtimestamp(started_at))
+                if bots[bot_id].get('status') != Config.BOT_STATUS_ACTIVE:
+                    await db.update_bot_status(bot_id, Config.BOT_STATUS_ACTIVE, self.shared_hosts[index]['process'].pid)
+                adopted.append(bot_id)
+                logger.log_bot_event(bot_id, "Adopted bot in shared host", details=f"host={index}")
+        return adopted
+
+    def _zygote_key(self, python_exec: str, bot_dir: str) -> str:
+        """Bots whose venvs share the base interpreter and the installed requirements can fork from one zygote.
+        The zygote runs from its own copy of the first such venv (see _zygote_venv), never from a bot's."""
+        try:
+            with open(os.path.join(bot_dir, 'venv', '.requirements.sha256')) as f:
+                requirements = f.read().strip()
+        except OSError:
+            requirements = 'none'
+        return hashlib.sha256(f"{os.path.realpath(python_exec)}|{requirements}".encode()).hexdigest()[:16]
+
+    async def _zygote_request(self, socket_path: str, payload: Dict[str, Any], timeout: float = 10) -> Dict[str, Any]:
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(socket_path), timeout)
+        try:
+            writer.write(json.dumps(payload).encode() + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        finally:
+            writer.close()
+        return json.loads(line) if line else {'ok': False, 'error': 'zygote closed the connection'}
+
+    def _zygote_venv(self, key: str, python_exec: str) -> str:
+        """(Sync) The zygote's private venv, cloned from a bot's venv on first use; returns its interpreter.
+        Forked bots see the zygote's sys.prefix and site-packages, so they must outlive the bot whose venv
+        the zygote was created from (deleted, or its venv dropped by the disk GC)."""
+        venv = os.path.join(self.deployment_dir, '.zygotes', key, 'venv')
+        python = os.path.join(venv, 'bin', 'python')
+        if not os.path.exists(python):
+            source = os.path.dirname(os.path.dirname(python_exec))
+            partial = f"{venv}.partial"
+            trash_bin.discard(partial)
+            trash_bin.discard(venv)
+            self._clone_tree(source, partial, 'venv')
+            os.rename(partial, venv)
+        return python
+
+    async def _ensure_zygote(self, key: str, python_exec: str) -> Dict[str, Any]:
+        """Return the zygote for `key`, re-attaching to one that survived a manager restart or starting it."""
+        async with self._zygote_lock:
+            base = os.path.join(self.deployment_dir, '.zygotes')
+            zygote_python = os.path.join(base, key, 'venv', 'bin', 'python')
+            zygote = self.zygotes.get(key)
+            if zygote and zygote['process'].poll() is None:
+                if os.path.exists(zygote_python):
+                    return zygote
+                # Its venv is gone: children forked now would fail on the first lazy import
+                await self._stop_zygote(key)
+            os.makedirs(base, exist_ok=True)
+            socket_path = os.path.join(base, f"{key}.sock")
+            try:
+                reply = await self._zygote_request(socket_path, {'op': 'ping'}, timeout=2)
+                if reply.get('ok') and os.path.exists(zygote_python):
+                    zygote = {'process': AdoptedProcess(psutil.Process(reply['pid'])), 'socket': socket_path, 'bots': set()}
+                    self.zygotes[key] = zygote
+                    return zygote
+            except (OSError, ValueError, asyncio.TimeoutError, psutil.Error):
+                pass
+            if os.path.exists(socket_path):
+                # A surviving zygote of an older layout (or with its venv removed): replace it
+                try:
+                    reply = await self._zygote_request(socket_path, {'op': 'ping'}, timeout=2)
+                    if reply.get('ok'):
+                        self._signal_process(AdoptedProcess(psutil.Process(reply['pid'])), signal.SIGTERM)
+                except (OSError, ValueError, asyncio.TimeoutError, psutil.Error):
+                    pass
+            zygote_python = await asyncio.to_thread(self._zygote_venv, key, python_exec)
+            with open(os.path.join(base, f"{key}.log"), 'ab', buffering=0) as log_file:
+                process = subprocess.Popen(
+                    [zygote_python, ZYGOTE_SCRIPT, '--socket', socket_path, '--preload', Config.BOT_ZYGOTE_PRELOAD],
+                    cwd=base,
+                    stdin=subprocess.DEVNULL,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True
+                )
+            # Preloading takes a moment; wait until the socket answers
+            for _ in range(150):
+                if process.poll() is not None:
+                    raise RuntimeError(f"zygote exited with code {process.returncode}")
+                try:
+                    if (await self._zygote_request(socket_path, {'op': 'ping'}, timeout=2)).get('ok'):
+                        break
+                except (OSError, ValueError, asyncio.TimeoutError):
+                    pass
+                await asyncio.sleep(0.2)
+            else:
+                self._signal_process(process, signal.SIGKILL)
+                raise RuntimeError("zygote did not come up")
+            zygote = {'process': process, 'socket': socket_path, 'bots': set()}
+            self.zygotes[key] = zygote
+            logger.log_system_event("Zygote started", details=f"key={key} pid={process.pid}")
+            return zygote
+
+    async def _spawn_via_zygote(self, bot_id: int, key: str, python_exec: str, bot_dir: str, entrypoint: str,
+                                env: Dict[str, str], stdout_path: str, stderr_path: str):
+        """Fork the bot from its zygote. Returns a process handle, or None to fall back to a normal spawn."""
+        try:
+            zygote = await self._ensure_zygote(key, python_exec)
+            reply = await self._zygote_request(zygote['socket'], {
+                'op': 'spawn', 'entrypoint': entrypoint, 'cwd': bot_dir, 'env': env,
+                'stdout': stdout_path, 'stderr': stderr_path
+            })
+            if not reply.get('ok'):
+                raise RuntimeError(reply.get('error'))
+            zygote['bots'].add(bot_id)
+            return ZygoteChild(psutil.Process(reply['pid']), zygote['socket'])
+        except Exception as e:
+            logger.log_bot_event(bot_id, "Zygote spawn failed; using a fresh interpreter", details=str(e))
+            return None
+
+    async def _stop_zygote(self, key: str):
+        zygote = self.zygotes.pop(key, None)
+        if zygote and zygote['process'].poll() is None:
+            logger.log_system_event("Stopping zygote", details=key)
+            # Forked bots run in their own sessions, so this only reaches the zygote
+            self._signal_process(zygote['process'], signal.SIGTERM)
+            await self._wait_for_exit(zygote['process'], 5)
+
+    async def _prune_zygotes(self):
+        """Stop zygotes no running bot was forked from (e.g. after a requirements change) and drop their venvs."""
+        in_use = {info.get('zygote') for info in self.running_bots.values()}
+        async with self._zygote_lock:
+            for key in [key for key in self.zygotes if key not in in_use]:
+                await self._stop_zygote(key)
+                trash_bin.discard(os.path.join(self.deployment_dir, '.zygotes', key))
+
+    def _running_rss(self) -> Dict[int, int]:
+        """(Sync) Current RSS of the bots running in a process of their own"""
+        rss = {}
+        for bot_id, info in list(self.running_bots.items()):
+            if info.get('shared') is not None:
+                continue
+            try:
+                rss[bot_id] = psutil.Process(info['process'].pid).memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    async def estimate_bot_footprint(self, bot_id: int, running_rss: Optional[Dict[int, int]] = None) -> int:
+        """Expected RSS of a bot in bytes: its own peak over the last week, else the median of the running
+        bots, else ADMISSION_DEFAULT_BOT_MB; never more than its plan's memory limit."""
+        history = await db.get_bot_metrics_hourly(bot_id, 24 * 7)
+        peaks = [row['rss_max'] for row in history if row.get('rss_max')]
+        if peaks:
+            estimate = max(peaks)
+        else:
+            observed = sorted((running_rss if running_rss is not None else self._running_rss()).values())
+            estimate = observed[len(observed) // 2] if observed else Config.ADMISSION_DEFAULT_BOT_MB * 1024 * 1024
+        limit_mb = (await self.get_resource_limits(bot_id))['memory_mb']
+        if limit_mb > 0:
+            estimate = min(estimate, limit_mb * 1024 * 1024)
+        return int(estimate)
+
+    def host_headroom(self) -> Dict[str, float]:
+        """(Sync) Memory that can still be promised to new bots (bytes, after ADMISSION_MIN_FREE_MB and pending
+        starts) and the 1-minute load average per CPU."""
+        available = psutil.virtual_memory().available
+        available -= Config.ADMISSION_MIN_FREE_MB * 1024 * 1024 + sum(self._admission_reserved.values())
+        try:
+            load = os.getloadavg()[0] / (psutil.cpu_count() or 1)
+        except OSError:
+            load = 0.0
+        return {'memory': available, 'load_per_cpu': load}
+
+    async def admit_bot(self, bot_id: int):
+        """Reserve room for a bot about to be spawned, or raise AdmissionDenied.
+        Paid bots that do not fit stop running demo bots (largest first) to make room; the monitor requeues
+        those demos, and they come back once there is capacity again. The load limit only holds back demos.
+        """
+        if not Config.ADMISSION_ENABLED:
+            return
+        victims = []
+        async with self._admission_lock:
+            running_rss = await asyncio.to_thread(self._running_rss)
+            needed = await self.estimate_bot_footprint(bot_id, running_rss)
+            headroom = await asyncio.to_thread(self.host_headroom)
+            paid = (await self.get_resource_limits(bot_id))['tier'] == 'paid'
+            if headroom['memory'] < needed and paid:
+                victims = await self._pick_demo_victims(needed - headroom['memory'], running_rss)
+                headroom['memory'] += sum(rss for _, rss in victims)
+            if headroom['memory'] < needed:
+                raise AdmissionDenied(f"capacity: needs ~{needed / 1048576:.0f} MB, "
+                                      f"{max(0, headroom['memory']) / 1048576:.0f} MB available "
+                                      f"(keeping {Config.ADMISSION_MIN_FREE_MB} MB free)")
+            if not paid and Config.ADMISSION_MAX_LOAD > 0 and headroom['load_per_cpu'] > Config.ADMISSION_MAX_LOAD:
+                raise AdmissionDenied(f"capacity: load {headroom['load_per_cpu']:.2f} per CPU "
+                                      f"above {Config.ADMISSION_MAX_LOAD}")
+            self._admission_reserved[bot_id] = needed
+            self._preempting.update(victim for victim, _ in victims)
+            logger.log_bot_event(bot_id, "Admitted", details=f"~{needed / 1048576:.0f} MB of "
+                                                             f"{headroom['memory'] / 1048576:.0f} MB headroom")
+        # Outside the admission lock: a stop waits for the demo's own operation (e.g. a pip install in a restart)
+        if victims:
+            await self._preempt_demos(victims)
+
+    async def _pick_demo_victims(self, deficit: int, running_rss: Dict[int, int]) -> List[Tuple[int, int]]:
+        """Running demo bots, largest first, whose stop frees about `deficit` bytes, as (bot_id, rss);
+        empty when stopping every demo would still not be enough. Demos already being preempted are skipped."""
+        demos = []
+        for bot_id, rss in running_rss.items():
+            if bot_id not in self._preempting and (await self.get_resource_limits(bot_id))['tier'] == 'demo':
+                demos.append((rss, bot_id))
+        demos.sort(reverse=True)
+        if sum(rss for rss, _ in demos) < deficit:
+            # Keep them running
+            return []
+        victims, freed = [], 0
+        for rss, bot_id in demos:
+            if freed >= deficit:
+                break
+            victims.append((bot_id, rss))
+            freed += rss
+        return victims
+
+    async def _preempt_demos(self, victims: List[Tuple[int, int]]):
+        """Stop the demo bots picked by _pick_demo_victims"""
+        try:
+            await self.stop_many([bot_id for bot_id, _ in victims])
+            for bot_id, rss in victims:
+                logger.log_bot_event(bot_id, "Preempted for a paid bot", details=f"freed ~{rss / 1048576:.0f} MB")
+        finally:
+            self._preempting.difference_update(bot_id for bot_id, _ in victims)
+
+    async def get_resource_limits(self, bot_id: int) -> Dict[str, Any]:
+        """Resource limits for a bot, by plan: demo subscriptions get the DEMO_* limits, everything else PAID_*."""
+        subscription = await db.get_bot_subscription(bot_id)
+        tier = 'demo' if subscription and subscription.get('plan_type') == 'demo' else 'paid'
+        prefix = tier.upper()
+        return {
+            'tier': tier,
+            'memory_mb': getattr(Config, f'{prefix}_MEMORY_LIMIT_MB'),
+            'data_mb': getattr(Config, f'{prefix}_DATA_LIMIT_MB'),
+            'max_open_files': getattr(Config, f'{prefix}_MAX_OPEN_FILES'),
+            'max_processes': getattr(Config, f'{prefix}_MAX_PROCESSES'),
+            'cpu_weight': getattr(Config, f'{prefix}_CPU_WEIGHT'),
+            'nice': getattr(Config, f'{prefix}_NICE'),
+            'idle_hibernate_minutes': getattr(Config, f'{prefix}_IDLE_HIBERNATE_MINUTES')
+        }
+
+    def _cgroup_path(self, bot_id: int) -> Optional[str]:
+        if not Config.BOT_CGROUP_ROOT:
+            return None
+        return os.path.join(Config.BOT_CGROUP_ROOT, f"bot_{bot_id}")
+
+    def _setup_cgroup(self, bot_id: int, limits: Dict[str, Any]) -> Optional[str]:
+        """(Sync) Create/update the bot's cgroup v2 with memory.max, cpu.weight and pids.max.
+        Returns its path, or None when cgroups are not configured or not writable (memory is then not capped).
+        """
+        path = self._cgroup_path(bot_id)
+        if not path:
+            return None
+        try:
+            try:
+                with open(os.path.join(Config.BOT_CGROUP_ROOT, 'cgroup.subtree_control'), 'w') as f:
+                    f.write('+memory +cpu +pids')
+            except OSError:
+                # Already enabled, or managed by the delegating unit
+                pass
+            os.makedirs(path, exist_ok=True)
+            settings = {
+                'memory.max': str(limits['memory_mb'] * 1024 * 1024) if limits['memory_mb'] else 'max',
+                # Without swap a bot over memory.max is OOM-killed instead of thrashing the host
+                'memory.swap.max': '0' if limits['memory_mb'] else 'max',
+                'cpu.weight': str(max(1, min(10000, limits['cpu_weight']))),
+                'pids.max': str(limits['max_processes']) if limits['max_processes'] else 'max'
+            }
+            for name, value in settings.items():
+                try:
+                    with open(os.path.join(path, name), 'w') as f:
+                        f.write(value)
+                except OSError as e:
+                    logger.log_bot_event(bot_id, "cgroup setting not applied", details=f"{name}: {e}")
+            return path
+        except OSError as e:
+            logger.log_bot_event(bot_id, "cgroup unavailable; memory and process limits not enforced", details=str(e))
+            return None
+
+    def _cgroup_event_count(self, cgroup: Optional[str], filename: str, event: str) -> int:
+        """(Sync) A counter from one of the cgroup's *.events files (cumulative for the cgroup's lifetime)."""
+        if not cgroup:
+            return 0
+        try:
+            with open(os.path.join(cgroup, filename)) as f:
+                for line in f:
+                    key, _, value = line.partition(' ')
+                    if key == event:
+                        return int(value)
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def _cgroup_oom_kills(self, cgroup: Optional[str]) -> int:
+        """(Sync) oom_kill counter from the cgroup's memory.events"""
+        return self._cgroup_event_count(cgroup, 'memory.events', 'oom_kill')
+
+    def _cgroup_pids_max_hits(self, cgroup: Optional[str]) -> int:
+        """(Sync) Times a fork/thread creation was refused by the cgroup's pids.max"""
+        return self._cgroup_event_count(cgroup, 'pids.events', 'max')
+
+    def _apply_resource_limits(self, bot_id: int, pid: int, limits: Dict[str, Any], cgroup: Optional[str]):
+        """(Sync) Move a freshly spawned bot into its cgroup and set its rlimits and niceness."""
+        if cgroup:
+            try:
+                with open(os.path.join(cgroup, 'cgroup.procs'), 'w') as f:
+                    f.write(str(pid))
+            except OSError as e:
+                logger.log_bot_event(bot_id, "Could not join cgroup", details=str(e))
+        try:
+            proc = psutil.Process(pid)
+            if limits['data_mb']:
+                # Opt-in backstop for hosts without cgroups. RLIMIT_DATA also counts every thread stack
+                # (8 MB each by default), so it must sit far above the bot's real memory use: near it,
+                # thread creation fails before the heap ever reaches the limit. Memory itself is
+                # enforced by the cgroup's memory.max.
+                data_bytes = limits['data_mb'] * 1024 * 1024
+                proc.rlimit(psutil.RLIMIT_DATA, (data_bytes, data_bytes))
+            if limits['max_open_files']:
+                proc.rlimit(psutil.RLIMIT_NOFILE, (limits['max_open_files'], limits['max_open_files']))
+            if limits['nice']:
+                proc.nice(limits['nice'])
+        except (psutil.Error, OSError, ValueError) as e:
+            logger.log_bot_event(bot_id, "Resource limits not fully applied", details=str(e))
+
+    def _exit_reason(self, bot_id: int, info: Dict[str, Any], exit_code: Optional[int]) -> Optional[str]:
+        """(Sync) Classify an unexpected exit as a limit hit: oom_killed, memory_limit, fd_limit or pids_limit."""
+        cgroup = info.get('cgroup')
+        if cgroup and self._cgroup_oom_kills(cgroup) > info.get('oom_kills', 0):
+            return 'oom_killed'
+        try:
+            path = os.path.join(info.get('bot_dir') or self._bot_dir(bot_id), 'logs', 'stderr.log')
+            with open(path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(path) - 8192))
+                tail = f.read().decode('utf-8', errors='replace')
+        except OSError:
+            tail = ''
+        if 'MemoryError' in tail:
+            return 'memory_limit'
+        if 'Too many open files' in tail:
+            return 'fd_limit'
+        if "can't start new thread" in tail or 'Resource temporarily unavailable' in tail:
+            # Only pids.max limits the number of tasks; otherwise the thread stack hit RLIMIT_DATA (or the host ran out)
+            if cgroup and self._cgroup_pids_max_hits(cgroup) > info.get('pids_max_hits', 0):
+                return 'pids_limit'
+            if (info.get('limits') or {}).get('data_mb'):
+                return 'memory_limit'
+            return None
+        if exit_code == -signal.SIGKILL:
+            # Not sent by us (stops are marked); on a memory-limited bot this is almost always the kernel OOM killer
+            return 'killed'
+        return None
+
+    async def _watch_bot(self, bot_id: int, process):
+        """Supervisor: react as soon as a bot process exits on its own."""
+        try:
+            await self._wait_for_exit(process)
+        except asyncio.CancelledError:
+            return
+        info = self.running_bots.get(bot_id)
+        if not info or info.get('process') is not process or info.get('stopping'):
+            # Stopped or replaced on purpose
+            return
+        del self.running_bots[bot_id]
+        # The final output (e.g. a traceback) has to be in logs/stderr.log before the exit is classified
+        log_collector.detach(bot_id)
+        exit_code = process.poll()
+        reason = self._exit_reason(bot_id, info, exit_code)
+        logger.log_bot_event(bot_id, "Process exited unexpectedly",
+                             details=f"pid={process.pid} code={exit_code} reason={reason or '-'}")
+        try:
+            await self._handle_crash(bot_id, exit_code, reason)
+        except Exception as e:
+            logger.error(f"Supervisor error for bot {bot_id}: {e}")
+
+    async def _handle_crash(self, bot_id: int, exit_code: Optional[int], reason: Optional[str] = None):
+        """Restart a crashed bot with exponential backoff, or quarantine it when it crash-loops."""
+        await db.record_bot_crash(bot_id, exit_code, reason)
+        now = time.monotonic()
+        history = self._crash_history.setdefault(bot_id, deque())
+        history.append(now)
+        while history and now - history[0] > Config.CRASH_LOOP_WINDOW:
+            history.popleft()
+
+        if len(history) > Config.CRASH_LOOP_MAX_RESTARTS:
+            await db.update_bot_status(bot_id, Config.BOT_STATUS_QUARANTINED)
+            logger.log_bot_event(bot_id, "Crash loop detected; quarantined",
+                                 details=f"{len(history)} exits in {Config.CRASH_LOOP_WINDOW}s")
+            return
+        if not await db.is_subscription_active(bot_id):
+            await db.update_bot_status(bot_id, Config.BOT_STATUS_INACTIVE)
+            return
+
+        delay = min(Config.SUPERVISOR_BACKOFF_BASE * (2 ** (len(history) - 1)), Config.SUPERVISOR_BACKOFF_MAX)
+        logger.log_bot_event(bot_id, "Supervisor restart scheduled", details=f"in {delay:.0f}s (attempt {len(history)})")
+        await asyncio.sleep(delay)
+
+        # Someone may have started or stopped the bot during the backoff
+        bot_info = await db.get_bot(bot_id)
+        if bot_id in self.running_bots or not bot_info or bot_info.get('status') != Config.BOT_STATUS_ACTIVE:
+            return
+        # The crashed process's memory is free again, so this restart is not subject to admission
+        if await self.deploy_bot(bot_id, bot_info['bot_token'], admit=False):
+            await db.increment_bot_restart_count(bot_id)
+
+    def _scan_bot_processes(self) -> Dict[int, list]:
+        """(Sync) Find live processes whose working directory is a bot directory, grouped by bot id."""
+        root = os.path.realpath(self.deployment_dir)
+        found = {}
+        for proc in psutil.process_iter(['pid', 'cwd']):
+            try:
+                cwd = proc.info.get('cwd')
+                if not cwd or proc.pid == os.getpid() or os.path.dirname(cwd) != root:
+                    continue
+                name = os.path.basename(cwd)
+                if not name.startswith('bot_'):
+                    continue
+                found.setdefault(int(name[4:]), []).append(proc)
+            except (psutil.Error, ValueError):
+                continue
+        return found
+
+    def _is_bot_process(self, proc: psutil.Process, bot: Optional[Dict[str, Any]] = None) -> bool:
+        """(Sync) True if proc looks like a bot launched by deploy_bot: python running a known entrypoint,
+        and, when the bot row is given, the recorded create_time matches (protects against PID reuse).
+        """
+        try:
+            cmdline = proc.cmdline()
+            # Children forked by a zygote keep the zygote's command line (their cwd was checked by the caller)
+            forked = ZYGOTE_SCRIPT in cmdline
+            if not forked and (len(cmdline) < 2 or 'python' not in os.path.basename(cmdline[0])):
+                return False
+            if not forked and os.path.basename(cmdline[-1]) not in ENTRYPOINT_CANDIDATES:
+                return False
+            started_at = bot.get('process_started_at') if bot else None
+            if started_at and abs(proc.create_time() - float(started_at)) > 1.0:
+                return False
+            meta = self._launch_meta(bot)
+            if meta.get('entrypoint') and not forked and cmdline[-1] != meta['entrypoint']:
+                return False
+            return True
+        except psutil.Error:
+            return False
+
+    def _launch_meta(self, bot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            return json.loads(bot.get('launch_meta') or '{}') if bot else {}
+        except ValueError:
+            return {}
+
+    def _signal_process(self, process, sig: int):
+        """Signal a bot's whole process group when it leads its own session, otherwise just the process."""
+        try:
+            if os.getpgid(process.pid) == process.pid:
+                os.killpg(process.pid, sig)
+                return
+        except OSError:
+            pass
+        process.send_signal(sig)
+
+    async def reconcile_processes(self) -> Dict[str, list]:
+        """Re-adopt bot processes that survived a manager restart and reap stale ones.
+        - The process recorded in bots.process_id is adopted if its cwd, cmdline and create_time match.
+        - Other bot-looking processes in the same bot directory (duplicate pollers) are terminated.
+        - Recorded PIDs that no longer belong to a bot are cleared from the database.
+        Returns {'adopted': [bot_id], 'stale': [bot_id], 'reaped': [pid]}.
+        """
+        summary = {'adopted': [], 'stale': [], 'reaped': []}
+        summary['adopted'].extend(await self._adopt_shared_bots())
+        bots = {bot['id']: bot for bot in await db.get_all_bots()}
+        found = await asyncio.to_thread(self._scan_bot_processes)
+        to_reap = []
+
+        for bot_id, bot in bots.items():
+            if bot_id in self.running_bots:
+                continue
+            pid = bot.get('process_id')
+            adopted = None
+            for proc in found.pop(bot_id, []):
+                if adopted is None and pid and proc.pid == int(pid) and self._is_bot_process(proc, bot):
+                    adopted = proc
+                elif self._is_bot_process(proc):
+                    to_reap.append(proc)
+            if adopted is not None:
+                handle = AdoptedProcess(adopted)
+                self.running_bots[bot_id] = {
+                    'process': handle,
+                    'started_at': datetime.fromtimestamp(adopted.create_time()),
+                    'bot_dir': self._bot_dir(bot_id),
+                    'sha': bot.get('deployed_sha'),
+                    # Keeps the zygote venv it was forked from in use
+                    'zygote': self._launch_meta(bot).get('zygote'),
+                    'adopted': True
+                }
+                self.running_bots[bot_id]['watcher'] = asyncio.create_task(self._watch_bot(bot_id, handle))
+                try:
+                    # Pick up its output again, including what it wrote while no manager was reading
+                    log_collector.attach(bot_id, self._bot_dir(bot_id))
+                except OSError as e:
+                    logger.error(f"Error attaching logs of bot {bot_id}: {e}")
+                if bot.get('status') != Config.BOT_STATUS_ACTIVE:
+                    await db.update_bot_status(bot_id, Config.BOT_STATUS_ACTIVE, adopted.pid)
+                summary['adopted'].append(bot_id)
+                logger.log_bot_event(bot_id, "Adopted running process", details=f"pid={adopted.pid}")
+            elif pid:
+                await db.clear_bot_process(bot_id)
+                if bot.get('status') == Config.BOT_STATUS_ACTIVE:
+                    await db.update_bot_status(bot_id, Config.BOT_STATUS_INACTIVE)
+                summary['stale'].append(bot_id)
+                logger.log_bot_event(bot_id, "Cleared stale process record", details=f"pid={pid}")
+
+        # Bot directories without a bot row (deleted bots) must not keep polling either
+        for procs in found.values():
+            to_reap.extend(proc for proc in procs if self._is_bot_process(proc))
+
+        if to_reap:
+            for proc in to_reap:
+                try:
+                    proc.terminate()
+                except psutil.Error:
+                    pass
+            _, alive = await asyncio.to_thread(psutil.wait_procs, to_reap, timeout=10)
+            for proc in alive:
+                try:
+                    proc.kill()
+                except psutil.Error:
+                    pass
+            summary['reaped'] = [proc.pid for proc in to_reap]
+            logger.log_system_event("Reaped orphan bot processes", details=", ".join(str(pid) for pid in summary['reaped']))
+
+        logger.log_system_event("Process reconciliation finished",
+                                details=f"adopted={len(summary['adopted'])} stale={len(summary['stale'])} reaped={len(summary['reaped'])}")
+        return summary
+
+    async def _terminate_async(self, bot_id: int, process, timeout: float = 10) -> int:
+        """SIGTERM the bot's process group, await exit without blocking the loop, escalate to SIGKILL on timeout."""
+        self._signal_process(process, signal.SIGTERM)
+        if not await self._wait_for_exit(process, timeout):
+            logger.log_bot_event(bot_id, "Terminate timeout; killing process", details=f"pid={process.pid}")
+            self._signal_process(process, signal.SIGKILL)
+            await self._wait_for_exit(process)
+        return process.poll()
+
     async def stop_bot(self, bot_id: int) -> bool:
-        """Stop a running bot"""
+        """Stop a running bot (waits for operations of the bot in flight; concurrent stops join)"""
+        return await self._bot_operation(bot_id, 'stop', lambda: self._stop_bot(bot_id))
+
+    async def _stop_bot(self, bot_id: int) -> bool:
         try:
             # Try in-memory process first
             if bot_id in self.running_bots:
                 process_info = self.running_bots[bot_id]
                 process = process_info['process']
-                # Terminate the process
+                # Tell the supervisor this exit is intentional
+                process_info['stopping'] = True
                 logger.log_bot_event(bot_id, "Stopping bot (in-memory)")
-                process.terminate()
-                try:
-                    process.wait(timeout=10)
-                except subprocess.TimeoutExpired:
-                    logger.log_bot_event(bot_id, "Terminate timeout; killing process")
-                    process.kill()
-                    process.wait()
-                del self.running_bots[bot_id]
+                if process_info.get('shared') is not None:
+                    # Only this bot's Application is stopped; the host keeps serving the others
+                    await self._stop_shared(bot_id, process_info)
+                else:
+                    # Terminate the process (and anything it spawned in its session)
+                    await self._terminate_async(bot_id, process)
+                    log_collector.detach(bot_id)
+                if self.running_bots.get(bot_id) is process_info:
+                    del self.running_bots[bot_id]
                 await db.update_bot_status(bot_id, Config.BOT_STATUS_INACTIVE)
                 logger.log_bot_event(bot_id, "Bot stopped")
                 return True
@@ -371,15 +1918,10 @@ python-dotenv==1.0.1
             if bot_info and bot_info.get('process_id'):
                 pid = int(bot_info['process_id'])
                 try:
-                    p = psutil.Process(pid)
+                    p = AdoptedProcess(psutil.Process(pid))
                     logger.log_bot_event(bot_id, "Stopping bot by PID", details=f"pid={pid}")
-                    p.terminate()
-                    try:
-                        p.wait(timeout=10)
-                    except psutil.TimeoutExpired:
-                        logger.log_bot_event(bot_id, "Terminate timeout by PID; killing", details=f"pid={pid}")
-                        p.kill()
-                        p.wait()
+                    await self._terminate_async(bot_id, p)
+                    log_collector.detach(bot_id)
                     await db.update_bot_status(bot_id, Config.BOT_STATUS_INACTIVE)
                     logger.log_bot_event(bot_id, "Bot stopped by PID", details=f"pid={pid}")
                     return True
@@ -389,31 +1931,220 @@ python-dotenv==1.0.1
         except Exception as e:
             logger.error(f"Error stopping bot {bot_id}: {e}")
             return False
+
+    def _last_activity(self, bot_id: int, info: Dict[str, Any]) -> float:
+        """(Sync) Latest of: process start, last update through the ingress, the template's run/last_update heartbeat."""
+        times = [info['started_at'].timestamp(), webhook_ingress.last_update.get(bot_id, 0.0)]
+        try:
+            times.append(os.path.getmtime(os.path.join(info['bot_dir'], 'run', 'last_update')))
+        except OSError:
+            pass
+        return max(times)
+
+    async def hibernate_idle_bots(self) -> List[int]:
+        """Stop template bots idle longer than their plan's threshold and mark them hibernated.
+        Only template bots report activity, so other bots are never hibernated.
+        """
+        if not Config.HIBERNATION_ENABLED:
+            return []
+        idle = []
+        now = time.time()
+        for bot_id, info in list(self.running_bots.items()):
+            if info.get('shared') is not None or not os.path.exists(os.path.join(info['bot_dir'], TEMPLATE_MARKER)):
+                continue
+            minutes = (await self.get_resource_limits(bot_id))['idle_hibernate_minutes']
+            if minutes > 0 and now - self._last_activity(bot_id, info) >= minutes * 60:
+                idle.append(bot_id)
+        if not idle:
+            return []
+        await self.stop_many(idle)
+        for bot_id in idle:
+            await db.update_bot_status(bot_id, Config.BOT_STATUS_HIBERNATED)
+            logger.log_bot_event(bot_id, "Hibernated (idle)")
+        return idle
+
+    async def wake_bot(self, bot_id: int) -> bool:
+        """Start a hibernated bot. Concurrent calls for the same bot share one wake. Returns True if it is running."""
+        task = self._wake_tasks.get(bot_id)
+        if task is None:
+            task = asyncio.create_task(self._wake(bot_id))
+            self._wake_tasks[bot_id] = task
+            task.add_done_callback(lambda _: self._wake_tasks.pop(bot_id, None))
+        return await asyncio.shield(task)
+
+    async def _wake(self, bot_id: int) -> bool:
+        bot = await db.get_bot(bot_id)
+        if not bot or bot.get('status') != Config.BOT_STATUS_HIBERNATED:
+            return bot_id in self.running_bots
+        if not await db.is_subscription_active(bot_id):
+            await db.update_bot_status(bot_id, Config.BOT_STATUS_EXPIRED)
+            return False
+        started = time.monotonic()
+        try:
+            if not await self.deploy_bot(bot_id, bot['bot_token']):
+                return False
+        except AdmissionDenied as e:
+            logger.log_bot_event(bot_id, "Wake deferred", details=str(e))
+            return False
+        if webhook_ingress.enabled:
+            # Ready once the bot accepts updates on its socket
+            deadline = started + Config.HIBERNATION_WAKE_TIMEOUT
+            while not await webhook_ingress.is_ready(bot_id):
+                if time.monotonic() >= deadline or bot_id not in self.running_bots:
+                    break
+                await asyncio.sleep(0.1)
+        latency_ms = int((time.monotonic() - started) * 1000)
+        await db.set_bot_cold_start(bot_id, latency_ms)
+        logger.log_bot_event(bot_id, "Woke from hibernation", details=f"cold start {latency_ms} ms")
+        return True
+
+    async def peek_hibernated_bots(self) -> List[int]:
+        """Wake hibernated bots that have pending updates. getUpdates without an offset only peeks:
+        nothing is confirmed, so the woken bot still receives the update. Bots served by the ingress are skipped.
+        """
+        bots = [bot for bot in await db.get_all_bots() if bot.get('status') == Config.BOT_STATUS_HIBERNATED]
+        if webhook_ingress.enabled:
+            bots = [bot for bot in bots if not os.path.exists(os.path.join(self._bot_dir(bot['id']), TEMPLATE_MARKER))]
+        if not bots:
+            return []
+        woken = []
+        semaphore = asyncio.Semaphore(16)
+
+        async def peek(client: httpx.AsyncClient, bot: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    response = await client.post(f"{Config.TELEGRAM_API_BASE_URL}/bot{bot['bot_token']}/getUpdates",
+                                                 json={'limit': 1, 'timeout': 0})
+                    pending = response.json().get('result')
+                except (httpx.HTTPError, ValueError):
+                    return
+            if pending and await self.wake_bot(bot['id']):
+                woken.append(bot['id'])
+
+        async with httpx.AsyncClient(timeout=10) as client:
+            await asyncio.gather(*(peek(client, bot) for bot in bots))
+        return woken
+
+    async def start_wake_poller(self):
+        """Loop peeking hibernated polling bots every HIBERNATION_PEEK_INTERVAL seconds"""
+        self._wake_poller_running = True
+        while self._wake_poller_running:
+            try:
+                await self.peek_hibernated_bots()
+            except Exception as e:
+                logger.error(f"Error peeking hibernated bots: {e}")
+            await asyncio.sleep(Config.HIBERNATION_PEEK_INTERVAL)
+
+    def stop_wake_poller(self):
+        self._wake_poller_running = False
+
+    async def stop_many(self, bot_ids: List[int]) -> Dict[int, bool]:
+        """Stop several bots at once: all targets are signalled up front and their exits awaited concurrently,
+        so the whole batch takes about one termination timeout instead of one per bot.
+        """
+        results = await asyncio.gather(*(self.stop_bot(bot_id) for bot_id in bot_ids), return_exceptions=True)
+        return {bot_id: result is True for bot_id, result in zip(bot_ids, results)}
     
-    async def restart_bot(self, bot_id: int) -> bool:
-        """Restart a bot"""
+    async def restart_bot(self, bot_id: int, mode: str = "auto", on_stage: Optional[StageCallback] = None) -> bool:
+        """Restart a bot.
+        mode='fast' only respawns the process, mode='upgrade' updates code and dependencies first,
+        mode='auto' upgrades only when the checkout differs from the mirror/origin head.
+        on_stage sees the update stages (if any), then 'stop' and the deploy stages; the whole restart
+        is recorded as one run in deploy_runs.
+        A restart requested while one of the same or a stronger mode (fast < auto < upgrade) is queued or in flight
+        joins it; a stronger request runs after a weaker one, since that one may not load the new code. Within
+        RESTART_COOLDOWN seconds of the last start a restart that would run the same code is skipped (and
+        still returns True; callers that report outcomes check in_restart_cooldown first).
+        """
+        return await self._bot_operation(bot_id, f"restart:{mode}", lambda: self._restart_bot_op(bot_id, mode, on_stage),
+                                         covered_by=tuple(f"restart:{m}" for m in RESTART_COVERED_BY[mode]))
+
+    async def in_restart_cooldown(self, bot_id: int, mode: str) -> bool:
+        """True if a restart of the bot in this mode would be skipped by RESTART_COOLDOWN"""
+        info = self.running_bots.get(bot_id)
+        if Config.RESTART_COOLDOWN <= 0 or not info or not await self.is_bot_running(bot_id):
+            return False
+        age = (datetime.now() - info['started_at']).total_seconds()
+        if age >= Config.RESTART_COOLDOWN:
+            return False
+        # A restart that would load new code is never held back
+        if info.get('sha') != self._checkout_sha(info['bot_dir']):
+            return False
+        if mode != 'fast' and await self.needs_code_update(bot_id):
+            return False
+        logger.log_bot_event(bot_id, "Restart skipped: cooldown", details=f"started {age:.0f}s ago")
+        return True
+
+    async def _restart_bot_op(self, bot_id: int, mode: str, on_stage: Optional[StageCallback]) -> bool:
+        if await self.in_restart_cooldown(bot_id, mode):
+            return True
+        run, owned = DeployRun.begin(bot_id, 'restart', on_stage)
+        ok = await self._restart_bot(bot_id, mode, run)
+        if owned:
+            await run.finish(ok)
+        return ok
+
+    async def _restart_bot(self, bot_id: int, mode: str, on_stage: StageCallback) -> bool:
         bot_info = await db.get_bot(bot_id)
         if not bot_info:
             return False
 
-        # Always try to update bot code before restart so latest changes take effect
-        try:
-            logger.log_bot_event(bot_id, "Restart requested: updating code")
-            await self.update_bot_code(bot_id)
-        except Exception as e:
-            logger.error(f"Error updating code before restart for bot {bot_id}: {e}")
+        upgrade = mode == "upgrade"
+        if mode == "auto":
+            upgrade = await self.needs_code_update(bot_id)
+        if upgrade:
+            try:
+                logger.log_bot_event(bot_id, "Restart requested: updating code")
+                await self.update_bot_code(bot_id, on_stage=on_stage)
+            except Exception as e:
+                logger.error(f"Error updating code before restart for bot {bot_id}: {e}")
+        else:
+            logger.log_bot_event(bot_id, "Restart requested: code unchanged, respawning only")
 
-        # Stop the bot first
+        # Stop the bot first (stop_bot waits for the process to exit)
         logger.log_bot_event(bot_id, "Restart: stopping")
+        if on_stage:
+            await on_stage('stop')
+        was_running = await self.is_bot_running(bot_id)
         await self.stop_bot(bot_id)
         
-        # Wait a moment
-        await asyncio.sleep(2)
-        
         # Start it again
         logger.log_bot_event(bot_id, "Restart: starting")
-        return await self.deploy_bot(bot_id, bot_info['bot_token'])
+        # A bot that was running frees the memory it needs by the stop above; one that was stopped,
+        # preempted or hibernated is a new start and goes through admission
+        return await self.deploy_bot(bot_id, bot_info['bot_token'], on_stage=on_stage, admit=not was_running)
     
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        """Nearest-rank percentile of a sorted list"""
+        return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+    async def deploy_timing_stats(self, days: float = 7) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """p50/p95 duration per kind and stage over the last `days`:
+        {kind: {stage: {'count', 'p50', 'p95'}}}, with the whole run under stage 'total'
+        and the number of failed runs under 'failed'.
+        """
+        runs = await db.get_deploy_runs(time.time() - days * 86400)
+        samples: Dict[str, Dict[str, List[float]]] = {}
+        failed: Dict[str, int] = {}
+        for run in runs:
+            by_stage = samples.setdefault(run['kind'], {})
+            if not run['ok']:
+                failed[run['kind']] = failed.get(run['kind'], 0) + 1
+                continue
+            by_stage.setdefault('total', []).append(run['finished_at'] - run['started_at'])
+            for stage in run['stages']:
+                if stage.get('end') is not None:
+                    by_stage.setdefault(stage['stage'], []).append(stage['end'] - stage['start'])
+        stats = {}
+        for kind, by_stage in samples.items():
+            stats[kind] = {'failed': {'count': failed.get(kind, 0)}}
+            for stage, values in by_stage.items():
+                values.sort()
+                stats[kind][stage] = {'count': len(values), 'p50': self._percentile(values, 50),
+                                      'p95': self._percentile(values, 95)}
+        return stats
+
     async def is_bot_running(self, bot_id: int) -> bool:
         """Check if a bot is currently running"""
         if bot_id not in self.running_bots:
@@ -444,7 +2175,12 @@ python-dotenv==1.0.1
             'last_activity': bot_info['last_activity'],
             'has_subscription': subscription is not None,
             'subscription_active': is_subscription_active,
-            'subscription_end_date': subscription['end_date'] if subscription else None
+            'subscription_end_date': subscription['end_date'] if subscription else None,
+            'deployed_sha': bot_info.get('deployed_sha'),
+            'restart_count': bot_info.get('restart_count') or 0,
+            'last_exit_code': bot_info.get('last_exit_code'),
+            'last_exit_reason': bot_info.get('last_exit_reason'),
+            'last_cold_start_ms': bot_info.get('last_cold_start_ms')
         }
     
     async def cleanup_expired_bots(self):
@@ -457,6 +2193,7 @@ python-dotenv==1.0.1
             'already_inactive_expired': []
         }
         
+        to_stop = []
         for bot in bots:
             bot_id = bot['id']
             is_subscription_active = await db.is_subscription_active(bot_id)
@@ -464,66 +2201,402 @@ python-dotenv==1.0.1
             if not is_subscription_active:
                 if await self.is_bot_running(bot_id):
                     logger.log_bot_event(bot_id, "Stopping expired bot")
-                    await self.stop_bot(bot_id)
-                    await db.update_bot_status(bot_id, Config.BOT_STATUS_EXPIRED)
-                    summary['stopped_expired'].append({'id': bot_id, 'username': bot.get('bot_username')})
+                    to_stop.append(bot)
                 else:
                     summary['already_inactive_expired'].append({'id': bot_id, 'username': bot.get('bot_username')})
+
+        # Stop them as one batch rather than waiting out each bot's shutdown in turn
+        await self.stop_many([bot['id'] for bot in to_stop])
+        for bot in to_stop:
+            await db.update_bot_status(bot['id'], Config.BOT_STATUS_EXPIRED)
+            summary['stopped_expired'].append({'id': bot['id'], 'username': bot.get('bot_username')})
         return summary
     
-    async def restart_all_bots(self):
+    async def _restart_one_of_all(self, bot: Dict[str, Any], only_if_changed: bool, target_sha: Optional[str]) -> Dict[str, Any]:
+        """Handle a single bot for restart_all_bots. Returns {'id', 'username', 'outcomes': [summary keys], 'error'}."""
+        bot_id = bot['id']
+        result = {'id': bot_id, 'username': bot.get('bot_username'), 'outcomes': [], 'error': None}
+        try:
+            changed = await self.needs_code_update(bot_id, target_sha)
+            is_subscription_active = await db.is_subscription_active(bot_id)
+            subscription = await db.get_bot_subscription(bot_id)
+
+            if only_if_changed and not changed and is_subscription_active and await self.is_bot_running(bot_id):
+                result['outcomes'].append('unchanged')
+                return result
+
+            if is_subscription_active and bot.get('status') == Config.BOT_STATUS_HIBERNATED:
+                # Stays asleep (as in the monitor): its code is brought up to date and its next wake starts it
+                if changed and await self.update_bot_code(bot_id, fetch=False):
+                    result['outcomes'].append('updated_only')
+                else:
+                    result['outcomes'].append('unchanged')
+                return result
+
+            # Update the bot code and dependencies (pip is skipped when requirements are unchanged)
+            updated_ok = await self.update_bot_code(bot_id, fetch=False) if changed else False
+
+            if is_subscription_active:
+                if await self.in_restart_cooldown(bot_id, "fast"):
+                    result['outcomes'].append('skipped_cooldown')
+                    return result
+                logger.log_bot_event(bot_id, "Restarting (active subscription)")
+                # Code is already current: respawn only, avoiding a second update
+                if await self.restart_bot(bot_id, mode="fast"):
+                    result['outcomes'].append('restarted')
+                else:
+                    result['error'] = "restart failed"
+            else:
+                # Ensure bot is not running
+                if await self.is_bot_running(bot_id):
+                    await self.stop_bot(bot_id)
+                # Mark status based on whether it has a (now expired) subscription or none
+                if subscription:
+                    await db.update_bot_status(bot_id, Config.BOT_STATUS_EXPIRED)
+                    result['outcomes'].append('stopped_expired')
+                else:
+                    await db.update_bot_status(bot_id, Config.BOT_STATUS_INACTIVE)
+                    result['outcomes'].append('stopped_inactive')
+                if updated_ok:
+                    result['outcomes'].append('updated_only')
+        except Exception as e:
+            logger.error(f"Error handling bot {bot_id} during restart_all_bots: {e}")
+            result['error'] = str(e)
+        return result
+
+    async def restart_all_bots(self, only_if_changed: bool = False, progress_callback=None, concurrency: Optional[int] = None):
         """Update code for all bots and restart only those with active subscriptions.
+        With only_if_changed=True, running bots already on the mirror head are left untouched;
+        stopped bots with an active subscription are still started and expired ones still stopped.
+        Bots are processed in parallel (RESTART_CONCURRENCY wide, git/pip and spawns bounded separately).
+        progress_callback(done, total, result, summary) is awaited after each bot finishes.
         Returns a summary dict with lists of affected bots.
-        Summary keys: restarted, updated_only, stopped_expired, stopped_inactive, errors
+        Summary keys: restarted, updated_only, unchanged, skipped_cooldown, stopped_expired, stopped_inactive, errors
         """
         bots = await db.get_all_bots()
         summary = {
             'restarted': [],
             'updated_only': [],
+            'unchanged': [],
+            'skipped_cooldown': [],
             'stopped_expired': [],
             'stopped_inactive': [],
             'errors': []
         }
-        logger.log_system_event("Restart-all requested", details=f"total_bots={len(bots)}")
+        width = max(1, int(concurrency or Config.RESTART_CONCURRENCY))
+        logger.log_system_event("Restart-all requested", details=f"total_bots={len(bots)} only_if_changed={only_if_changed} width={width}")
+        # One network fetch for the whole cycle; every bot fast-forwards from the local mirror
+        await self.sync_mirror(force=True)
+        target_sha = None
+        try:
+            if self._mirror_ready():
+                target_sha = git.Repo(self.mirror_dir).head.commit.hexsha
+        except Exception:
+            pass
 
-        for bot in bots:
-            bot_id = bot['id']
+        gate = asyncio.Semaphore(width)
+
+        async def run_one(bot):
+            async with gate:
+                return await self._restart_one_of_all(bot, only_if_changed, target_sha)
+
+        done = 0
+        for next_result in asyncio.as_completed([run_one(bot) for bot in bots]):
+            result = await next_result
+            entry = {'id': result['id'], 'username': result['username']}
+            for key in result['outcomes']:
+                summary[key].append(entry)
+            if result['error']:
+                summary['errors'].append({**entry, 'error': result['error']})
+            done += 1
+            if progress_callback:
+                try:
+                    await progress_callback(done, len(bots), result, summary)
+                except Exception as e:
+                    logger.error(f"Error in restart_all_bots progress callback: {e}")
+        logger.log_system_event("Restart-all finished", details=", ".join(f"{k}={len(v)}" for k, v in summary.items()))
+        return summary
+    
+    def _log_files(self, bot_id: int, stream: str) -> List[str]:
+        """(Sync) A bot's log files for one stream, newest first: the active file, then rotated segments."""
+        log_dir = os.path.join(self._bot_dir(bot_id), 'logs')
+        rotated = [path for path, _ in reversed(log_collector.segments(log_dir, stream))]
+        return [os.path.join(log_dir, f"{stream}.log")] + rotated
+
+    @staticmethod
+    def _open_log(path: str):
+        return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+    @staticmethod
+    def _tail_file(path: str, lines: int) -> List[bytes]:
+        """(Sync) Last `lines` lines of a plain file, reading fixed-size blocks backwards from the end."""
+        block = 8192
+        chunks = []
+        newlines = 0
+        try:
+            with open(path, 'rb') as f:
+                pos = f.seek(0, os.SEEK_END)
+                while pos > 0 and newlines <= lines:
+                    size = min(block, pos)
+                    pos -= size
+                    f.seek(pos)
+                    chunk = f.read(size)
+                    chunks.append(chunk)
+                    newlines += chunk.count(b"\n")
+        except OSError:
+            return []
+        return b"".join(reversed(chunks)).splitlines()[-lines:] if lines > 0 else []
+
+    def _tail_lines(self, bot_id: int, stream: str, lines: int) -> List[str]:
+        """(Sync) Tail the active log; right after a rotation the rest comes from the newest segment."""
+        files = self._log_files(bot_id, stream)
+        result = self._tail_file(files[0], lines)
+        if len(result) < lines and len(files) > 1:
             try:
-                # Always try to update the bot code and dependencies
-                updated_ok = await self.update_bot_code(bot_id)
+                with self._open_log(files[1]) as f:
+                    result = list(deque(f, maxlen=lines - len(result))) + result
+            except (OSError, EOFError):
+                pass
+        return [line.rstrip(b"\r\n").decode('utf-8', 'replace') for line in result]
+
+    async def tail_bot_log(self, bot_id: int, stream: str = 'stderr', lines: int = 50) -> List[str]:
+        """Last lines of a bot's stdout or stderr, without reading the whole log."""
+        log_collector.flush(bot_id)
+        return await asyncio.to_thread(self._tail_lines, bot_id, stream, lines)
+
+    def _search_logs(self, bot_id: int, pattern: str, stream: str, regex: bool, limit: int,
+                     time_budget: float) -> Dict[str, Any]:
+        if regex:
+            match = re.compile(pattern.encode('utf-8')).search
+        else:
+            needle = pattern.encode('utf-8')
+            match = lambda line: needle in line
+        deadline = time.monotonic() + time_budget
+        found: List[Tuple[str, str]] = []
+        scanned = 0
+        complete = True
+        # Newest file first, so the most recent matches survive the limit and the time budget
+        for path in self._log_files(bot_id, stream):
+            hits = deque(maxlen=limit - len(found))
+            try:
+                with self._open_log(path) as f:
+                    for n, line in enumerate(f):
+                        if match(line):
+                            hits.append(line)
+                        if n % 4096 == 0 and time.monotonic() > deadline:
+                            complete = False
+                            break
+            except (OSError, EOFError):
+                continue
+            scanned += 1
+            name = os.path.basename(path)
+            found = [(name, line.rstrip(b"\r\n").decode('utf-8', 'replace')) for line in hits] + found
+            if not complete or len(found) >= limit:
+                complete = complete and len(found) < limit
+                break
+        return {'matches': found, 'files_scanned': scanned, 'complete': complete}
+
+    async def search_bot_logs(self, bot_id: int, pattern: str, stream: str = 'stderr', regex: bool = False,
+                              limit: int = 50, time_budget: Optional[float] = None) -> Dict[str, Any]:
+        """Search a bot's active and rotated logs for a substring (or regex), newest file first.
+        Stops at `limit` matches or after time_budget seconds (LOG_SEARCH_TIME_BUDGET by default).
+        Returns {'matches': [(file, line)] oldest first, 'files_scanned': n, 'complete': bool}.
+        Raises re.error for an invalid regex.
+        """
+        log_collector.flush(bot_id)
+        budget = Config.LOG_SEARCH_TIME_BUDGET if time_budget is None else time_budget
+        return await asyncio.to_thread(self._search_logs, bot_id, pattern, stream, regex, limit, budget)
+
+    def _stderr_size(self, bot_id: int) -> int:
+        try:
+            return os.path.getsize(os.path.join(self._bot_dir(bot_id), 'logs', 'stderr.log'))
+        except OSError:
+            return 0
 
-                is_subscription_active = await db.is_subscription_active(bot_id)
-                subscription = await db.get_bot_subscription(bot_id)
+    async def check_bot_health(self, bot_id: int, alive_seconds: Optional[float] = None, stderr_offset: int = 0) -> Tuple[bool, str]:
+        """Wait alive_seconds, then require the process to be alive and no traceback in stderr past stderr_offset.
+        Returns (healthy, reason).
+        """
+        wait = Config.ROLLING_HEALTH_SECONDS if alive_seconds is None else alive_seconds
+        info = self.running_bots.get(bot_id)
+        pid_before = info['process'].pid if info else None
+        if wait > 0:
+            await asyncio.sleep(wait)
+        if not await self.is_bot_running(bot_id):
+            return False, "process exited"
+        if self.running_bots[bot_id]['process'].pid != pid_before:
+            return False, "crashed and was restarted by supervisor"
+        stderr_path = os.path.join(self._bot_dir(bot_id), 'logs', 'stderr.log')
+        try:
+            with open(stderr_path, 'rb') as f:
+                # A file shorter than the offset was rotated by the log collector in between
+                if os.fstat(f.fileno()).st_size < stderr_offset:
+                    stderr_offset = 0
+                f.seek(stderr_offset)
+                fresh = f.read()
+        except OSError:
+            fresh = b''
+        if b'Traceback (most recent call last)' in fresh:
+            return False, "traceback in stderr"
+        return True, "ok"
+
+    def _reset_checkout(self, bot_dir: str, sha: str):
+        """(Sync) Hard-reset a checkout to a given commit."""
+        git.Repo(bot_dir).git.reset('--hard', sha)
+
+    async def rollback_bot(self, bot_id: int, sha: str) -> bool:
+        """Put a bot back on a previous commit (dependencies reinstalled if they differ) and respawn it.
+        The commit it leaves is recorded as the bot's bad_sha: updates and auto restarts do not move it
+        back there, only to a newer head. Runs as an operation of the bot, so no update interleaves."""
+        return await self._bot_operation(bot_id, 'rollback', lambda: self._rollback_bot(bot_id, sha))
 
-                if is_subscription_active:
-                    logger.log_bot_event(bot_id, "Restarting (active subscription)")
-                    # Proper restart to avoid duplicate processes
-                    await self.restart_bot(bot_id)
-                    summary['restarted'].append({'id': bot_id, 'username': bot.get('bot_username')})
+    async def _rollback_bot(self, bot_id: int, sha: str) -> bool:
+        bot_dir = self._bot_dir(bot_id)
+        try:
+            bad_sha = self._checkout_sha(bot_dir)
+            logger.log_bot_event(bot_id, "Rolling back", details=f"{(bad_sha or '-')[:7]} -> {sha[:7]}")
+            if bad_sha and bad_sha != sha:
+                await db.set_bot_bad_sha(bot_id, bad_sha)
+            async with self._install_semaphore:
+                await asyncio.to_thread(self._reset_checkout, bot_dir, sha)
+                await asyncio.to_thread(self._prepare_venv, bot_id, bot_dir)
+            return await self.restart_bot(bot_id, mode="fast")
+        except Exception as e:
+            logger.error(f"Error rolling back bot {bot_id} to {sha}: {e}")
+            return False
+
+    async def rolling_restart_bots(self, wave_size: Optional[int] = None, health_seconds: Optional[float] = None,
+                                   max_failure_rate: Optional[float] = None, rollback: Optional[bool] = None,
+                                   progress_callback=None):
+        """Roll the mirror head out to bots with active subscriptions in health-gated waves.
+        Each wave is upgraded and restarted, then must stay alive for health_seconds without new tracebacks.
+        When the cumulative failure rate exceeds max_failure_rate the rollout halts; with rollback=True
+        the bots of the failing wave go back to their previous commit. Bots already running the head are skipped.
+        Hibernated bots are not woken: their code is updated and they start on it at their next wake.
+        Summary keys: restarted, updated_only, unchanged, unhealthy, rolled_back, skipped, errors, halted, waves
+        """
+        wave_size = max(1, int(wave_size or Config.ROLLING_WAVE_SIZE))
+        health_seconds = Config.ROLLING_HEALTH_SECONDS if health_seconds is None else health_seconds
+        max_failure_rate = Config.ROLLING_MAX_FAILURE_RATE if max_failure_rate is None else max_failure_rate
+        rollback = Config.ROLLING_ROLLBACK if rollback is None else rollback
+        summary = {
+            'restarted': [],
+            'updated_only': [],
+            'unchanged': [],
+            'unhealthy': [],
+            'rolled_back': [],
+            'skipped': [],
+            'errors': [],
+            'halted': False,
+            'waves': 0
+        }
+        await self.sync_mirror(force=True)
+        target_sha = None
+        try:
+            if self._mirror_ready():
+                target_sha = git.Repo(self.mirror_dir).head.commit.hexsha
+        except Exception:
+            pass
+
+        candidates = []
+        hibernated = []
+        for bot in await db.get_all_bots():
+            if not await db.is_subscription_active(bot['id']):
+                continue
+            entry = {'id': bot['id'], 'username': bot.get('bot_username')}
+            changed = await self.needs_code_update(bot['id'], target_sha)
+            if bot.get('status') == Config.BOT_STATUS_HIBERNATED:
+                (hibernated if changed else summary['unchanged']).append(entry)
+            elif not changed and await self.is_bot_running(bot['id']):
+                summary['unchanged'].append(entry)
+            else:
+                candidates.append(entry)
+        logger.log_system_event("Rolling restart requested",
+                                details=f"candidates={len(candidates)} wave={wave_size} target={(target_sha or '-')[:7]}")
+
+        total = len(candidates)
+        done = 0
+        failures = 0
+        gate = asyncio.Semaphore(max(1, Config.RESTART_CONCURRENCY))
+
+        async def update_hibernated(entry):
+            async with gate:
+                if await self.update_bot_code(entry['id'], fetch=False):
+                    summary['updated_only'].append(entry)
                 else:
-                    # Ensure bot is not running
-                    if await self.is_bot_running(bot_id):
-                        await self.stop_bot(bot_id)
-                    # Mark status based on whether it has a (now expired) subscription or none
-                    if subscription:
-                        await db.update_bot_status(bot_id, Config.BOT_STATUS_EXPIRED)
-                        summary['stopped_expired'].append({'id': bot_id, 'username': bot.get('bot_username')})
-                    else:
-                        await db.update_bot_status(bot_id, Config.BOT_STATUS_INACTIVE)
-                        summary['stopped_inactive'].append({'id': bot_id, 'username': bot.get('bot_username')})
-                    if updated_ok:
-                        summary['updated_only'].append({'id': bot_id, 'username': bot.get('bot_username')})
-            except Exception as e:
-                logger.error(f"Error handling bot {bot_id} during restart_all_bots: {e}")
-                summary['errors'].append({'id': bot_id, 'username': bot.get('bot_username'), 'error': str(e)})
+                    summary['errors'].append({**entry, 'error': "update failed"})
+
+        # Not part of the waves: nothing is restarted, so there is no health to gate on
+        await asyncio.gather(*[update_hibernated(entry) for entry in hibernated])
+
+        async def upgrade_one(entry):
+            bot_id = entry['id']
+            async with gate:
+                previous_sha = self._checkout_sha(self._bot_dir(bot_id))
+                offset = self._stderr_size(bot_id)
+                if not await self.update_bot_code(bot_id, fetch=False):
+                    return entry, previous_sha, False, "update failed"
+                try:
+                    if not await self.restart_bot(bot_id, mode="fast"):
+                        return entry, previous_sha, False, "restart failed"
+                except AdmissionDenied as e:
+                    # A stopped bot with no room to start: not a health verdict on the new code
+                    return entry, previous_sha, None, str(e)
+            healthy, reason = await self.check_bot_health(bot_id, health_seconds, offset)
+            return entry, previous_sha, healthy, reason
+
+        for start in range(0, total, wave_size):
+            wave = candidates[start:start + wave_size]
+            summary['waves'] += 1
+            results = await asyncio.gather(*[upgrade_one(entry) for entry in wave], return_exceptions=True)
+            wave_failures = []
+            for entry, outcome in zip(wave, results):
+                done += 1
+                if isinstance(outcome, Exception):
+                    outcome = (entry, None, False, str(outcome))
+                _, previous_sha, healthy, reason = outcome
+                result = {'id': entry['id'], 'username': entry['username'], 'outcomes': [], 'error': None}
+                if healthy is None:
+                    summary['errors'].append({**entry, 'error': reason})
+                    result['error'] = reason
+                elif healthy:
+                    summary['restarted'].append(entry)
+                    result['outcomes'].append('restarted')
+                else:
+                    failures += 1
+                    wave_failures.append((entry, previous_sha))
+                    summary['unhealthy'].append({**entry, 'error': reason})
+                    result['outcomes'].append('unhealthy')
+                    result['error'] = reason
+                    logger.log_bot_event(entry['id'], "Unhealthy after rolling restart", details=reason)
+                if progress_callback:
+                    try:
+                        await progress_callback(done, total, result, summary)
+                    except Exception as e:
+                        logger.error(f"Error in rolling restart progress callback: {e}")
+
+            if failures / max(1, done) > max_failure_rate:
+                summary['halted'] = True
+                logger.log_system_event("Rolling restart halted",
+                                        details=f"failures={failures}/{done} wave={summary['waves']}")
+                if rollback:
+                    for entry, previous_sha in wave_failures:
+                        if previous_sha and previous_sha != target_sha and await self.rollback_bot(entry['id'], previous_sha):
+                            summary['rolled_back'].append(entry)
+                summary['skipped'] = candidates[start + wave_size:]
+                break
         return summary
-    
+
     async def cleanup_dead_processes(self):
         """Clean up any dead bot processes"""
         dead_bots = []
         
         for bot_id, process_info in self.running_bots.items():
             process = process_info['process']
+            watcher = process_info.get('watcher')
+            if watcher and not watcher.done():
+                # The supervisor reacts to this exit itself (restart/backoff/quarantine)
+                continue
             if process.poll() is not None:  # Process has terminated
                 dead_bots.append(bot_id)
         
@@ -531,19 +2604,45 @@ python-dotenv==1.0.1
             logger.log_bot_event(bot_id, "Cleaning up dead process")
             del self.running_bots[bot_id]
             await db.update_bot_status(bot_id, Config.BOT_STATUS_INACTIVE)
+        
+        if self.zygotes:
+            await self._prune_zygotes()
+
+    async def _still_running(self, bot_id: int) -> bool:
+        """Whether the bot has a live process: a handle in running_bots, or the process recorded in its row."""
+        if bot_id in self.running_bots:
+            return True
+        bot = await db.get_bot(bot_id)
+        if not bot or not bot.get('process_id'):
+            return False
+        try:
+            return self._is_bot_process(psutil.Process(int(bot['process_id'])), bot)
+        except psutil.Error:
+            return False
+
+    async def delete_bot(self, bot_id: int, on_stage: Optional[StageCallback] = None) -> bool:
+        """Stop a bot if running and remove its deployment directory (stages 'stop' and 'remove').
+        False, with the files left in place, when its process could not be stopped."""
+        return await self._bot_operation(bot_id, 'delete', lambda: self._delete_bot(bot_id, on_stage))
 
-    async def delete_bot(self, bot_id: int) -> bool:
-        """Stop a bot if running and remove its deployment directory."""
+    async def _delete_bot(self, bot_id: int, on_stage: Optional[StageCallback]) -> bool:
         try:
             # Stop if running
+            if on_stage:
+                await on_stage('stop')
             try:
                 await self.stop_bot(bot_id)
             except Exception:
                 pass
+            if await self._still_running(bot_id):
+                # Retried by the delete job; the bot row (and with it the PID) is kept until this succeeds
+                logger.log_bot_event(bot_id, "Delete postponed: process still running")
+                return False
             # Remove files
+            if on_stage:
+                await on_stage('remove')
             bot_dir = os.path.join(self.deployment_dir, f"bot_{bot_id}")
-            if os.path.exists(bot_dir):
-                shutil.rmtree(bot_dir, ignore_errors=True)
+            if trash_bin.discard(bot_dir):
                 logger.log_bot_event(bot_id, "Bot files removed", details=bot_dir)
             return True
         except Exception as e:
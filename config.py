@@ -19,6 +19,115 @@ class Config:
     _BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     BOT_DEPLOYMENT_DIR = os.getenv('BOT_DEPLOYMENT_DIR', os.path.join(_BASE_DIR, 'deployed bot'))
     BOT_PYTHON_PATH = os.getenv('BOT_PYTHON_PATH', '/usr/bin/python3')
+    # Local bare mirror of BOT_REPO_URL; bots are cloned/fast-forwarded from it instead of the network
+    BOT_MIRROR_DIR = os.getenv('BOT_MIRROR_DIR', os.path.join(BOT_DEPLOYMENT_DIR, '.mirror.git'))
+    # Seconds a mirror fetch stays fresh before single-bot updates fetch again
+    BOT_MIRROR_MAX_AGE = int(os.getenv('BOT_MIRROR_MAX_AGE', 60))
+    # Parallelism of restart_all_bots and separate bounds for git/pip work vs. process spawns
+    RESTART_CONCURRENCY = int(os.getenv('RESTART_CONCURRENCY', 8))
+    BOT_INSTALL_CONCURRENCY = int(os.getenv('BOT_INSTALL_CONCURRENCY', 4))
+    BOT_SPAWN_CONCURRENCY = int(os.getenv('BOT_SPAWN_CONCURRENCY', 8))
+    BOT_SPAWN_SETTLE_SECONDS = float(os.getenv('BOT_SPAWN_SETTLE_SECONDS', 1.0))
+    # Rolling restarts: wave size, health window, halt threshold and automatic rollback
+    ROLLING_WAVE_SIZE = int(os.getenv('ROLLING_WAVE_SIZE', 10))
+    ROLLING_HEALTH_SECONDS = float(os.getenv('ROLLING_HEALTH_SECONDS', 20))
+    ROLLING_MAX_FAILURE_RATE = float(os.getenv('ROLLING_MAX_FAILURE_RATE', 0.2))
+    ROLLING_ROLLBACK = os.getenv('ROLLING_ROLLBACK', 'true').lower() in ('1', 'true', 'yes')
+    # Process supervisor: restart backoff (seconds) and crash-loop quarantine threshold
+    SUPERVISOR_BACKOFF_BASE = float(os.getenv('SUPERVISOR_BACKOFF_BASE', 2))
+    SUPERVISOR_BACKOFF_MAX = float(os.getenv('SUPERVISOR_BACKOFF_MAX', 300))
+    CRASH_LOOP_MAX_RESTARTS = int(os.getenv('CRASH_LOOP_MAX_RESTARTS', 5))
+    CRASH_LOOP_WINDOW = int(os.getenv('CRASH_LOOP_WINDOW', 600))
+    # Per-plan resource limits for bot processes (demo subscriptions vs. paid plans); 0 disables a limit
+    DEMO_MEMORY_LIMIT_MB = int(os.getenv('DEMO_MEMORY_LIMIT_MB', 128))
+    PAID_MEMORY_LIMIT_MB = int(os.getenv('PAID_MEMORY_LIMIT_MB', 512))
+    # Optional RLIMIT_DATA per bot process (for hosts without cgroups); thread stacks count toward it,
+    # so keep it well above the memory limit (e.g. 1024+). The memory limits above need BOT_CGROUP_ROOT.
+    DEMO_DATA_LIMIT_MB = int(os.getenv('DEMO_DATA_LIMIT_MB', 0))
+    PAID_DATA_LIMIT_MB = int(os.getenv('PAID_DATA_LIMIT_MB', 0))
+    DEMO_MAX_OPEN_FILES = int(os.getenv('DEMO_MAX_OPEN_FILES', 256))
+    PAID_MAX_OPEN_FILES = int(os.getenv('PAID_MAX_OPEN_FILES', 1024))
+    DEMO_MAX_PROCESSES = int(os.getenv('DEMO_MAX_PROCESSES', 32))
+    PAID_MAX_PROCESSES = int(os.getenv('PAID_MAX_PROCESSES', 128))
+    DEMO_CPU_WEIGHT = int(os.getenv('DEMO_CPU_WEIGHT', 50))
+    PAID_CPU_WEIGHT = int(os.getenv('PAID_CPU_WEIGHT', 100))
+    DEMO_NICE = int(os.getenv('DEMO_NICE', 10))
+    PAID_NICE = int(os.getenv('PAID_NICE', 0))
+    # Delegated cgroup v2 directory for per-bot cgroups (e.g. /sys/fs/cgroup/bot-manager.slice); empty = no memory.max/pids.max
+    BOT_CGROUP_ROOT = os.getenv('BOT_CGROUP_ROOT', '')
+    # Resource sampler: seconds between psutil passes, in-memory samples kept per bot, days of hourly rollups kept
+    RESOURCE_SAMPLE_INTERVAL = float(os.getenv('RESOURCE_SAMPLE_INTERVAL', 15))
+    RESOURCE_RING_SIZE = int(os.getenv('RESOURCE_RING_SIZE', 240))
+    METRICS_RETENTION_DAYS = int(os.getenv('METRICS_RETENTION_DAYS', 30))
+    # Shared host: run template-generated bots as Applications inside a few shared interpreters
+    SHARED_HOST_ENABLED = os.getenv('SHARED_HOST_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    SHARED_HOST_CAPACITY = int(os.getenv('SHARED_HOST_CAPACITY', 100))
+    # Fork-server launcher: one preloaded zygote per interpreter + requirements set forks bot processes
+    BOT_ZYGOTE_ENABLED = os.getenv('BOT_ZYGOTE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    BOT_ZYGOTE_PRELOAD = os.getenv('BOT_ZYGOTE_PRELOAD', 'telegram,telegram.ext,httpx,dotenv')
+    # Webhook ingress: one local HTTP server receives updates for all template bots (behind a TLS reverse proxy)
+    WEBHOOK_INGRESS_ENABLED = os.getenv('WEBHOOK_INGRESS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    WEBHOOK_PUBLIC_URL = os.getenv('WEBHOOK_PUBLIC_URL', '')
+    WEBHOOK_LISTEN_HOST = os.getenv('WEBHOOK_LISTEN_HOST', '127.0.0.1')
+    WEBHOOK_LISTEN_PORT = int(os.getenv('WEBHOOK_LISTEN_PORT', 8081))
+    WEBHOOK_SECRET_KEY = os.getenv('WEBHOOK_SECRET_KEY', '')
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 10))
+    # Bot API server used by the manager and passed to bots (point at a local Bot API server or a fake one for tests)
+    TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org').rstrip('/')
+    # Hibernation: stop idle template bots and wake them on their next update (0 minutes = never for that plan)
+    HIBERNATION_ENABLED = os.getenv('HIBERNATION_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    DEMO_IDLE_HIBERNATE_MINUTES = int(os.getenv('DEMO_IDLE_HIBERNATE_MINUTES', 30))
+    PAID_IDLE_HIBERNATE_MINUTES = int(os.getenv('PAID_IDLE_HIBERNATE_MINUTES', 0))
+    # Seconds between getUpdates peeks for hibernated polling bots, and the wait for a woken bot to be ready
+    HIBERNATION_PEEK_INTERVAL = float(os.getenv('HIBERNATION_PEEK_INTERVAL', 20))
+    HIBERNATION_WAKE_TIMEOUT = float(os.getenv('HIBERNATION_WAKE_TIMEOUT', 30))
+    
+    # Log collector: bot stdout/stderr go through FIFOs read by the manager into size-rotated, gzipped files.
+    # Off by default: while the manager is down, a bot that fills its pipe buffer blocks on its next write.
+    LOG_COLLECTOR_ENABLED = os.getenv('LOG_COLLECTOR_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    LOG_SEGMENT_MB = float(os.getenv('LOG_SEGMENT_MB', 5))
+    # Rotated segments kept per bot and stream, and the cap on all bot logs together (oldest segments go first)
+    LOG_BOT_RETENTION_MB = float(os.getenv('LOG_BOT_RETENTION_MB', 50))
+    LOG_TOTAL_CAP_MB = float(os.getenv('LOG_TOTAL_CAP_MB', 2048))
+    # Seconds a log search from the admin panel may spend scanning segments
+    LOG_SEARCH_TIME_BUDGET = float(os.getenv('LOG_SEARCH_TIME_BUDGET', 3))
+    # Crash detector: seconds between passes, window in which stderr failure signatures count,
+    # non-fatal errors (tracebacks, network, flood) in the window that make a bot "degraded"
+    CRASH_DETECTOR_INTERVAL = float(os.getenv('CRASH_DETECTOR_INTERVAL', 30))
+    CRASH_SIGNATURE_WINDOW = int(os.getenv('CRASH_SIGNATURE_WINDOW', 3600))
+    CRASH_DEGRADED_THRESHOLD = int(os.getenv('CRASH_DEGRADED_THRESHOLD', 3))
+    # Warm pool: pre-built bot directories (code + venv + requirements) kept ready for first deploys; 0 disables
+    WARM_POOL_SIZE = int(os.getenv('WARM_POOL_SIZE', 0))
+    # Snapshots: one prepared directory per commit that new bot directories are reflinked/hardlinked from;
+    # how many recent snapshots are kept on disk
+    SNAPSHOTS_ENABLED = os.getenv('SNAPSHOTS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', 2))
+    # Trash: removed directories are renamed into <deployment_dir>/.trash and deleted in the background
+    # at most this many files per second (0 = unthrottled)
+    TRASH_DELETE_RATE = float(os.getenv('TRASH_DELETE_RATE', 5000))
+    # Disk GC: seconds between passes, seconds a bot_<id> directory without a bots row is left alone,
+    # days after which expired/inactive bots lose their venv (0 keeps them)
+    DISK_GC_INTERVAL = float(os.getenv('DISK_GC_INTERVAL', 3600))
+    DISK_GC_ORPHAN_GRACE = float(os.getenv('DISK_GC_ORPHAN_GRACE', 600))
+    DISK_GC_STALE_VENV_DAYS = float(os.getenv('DISK_GC_STALE_VENV_DAYS', 14))
+    # Admission control before spawning a bot process: memory kept free for the host, 1-minute load per CPU
+    # above which demo bots wait (0 = no load limit), footprint assumed for bots never measured,
+    # seconds between retries of a postponed deploy and how long it may wait before failing
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    ADMISSION_MIN_FREE_MB = int(os.getenv('ADMISSION_MIN_FREE_MB', 256))
+    ADMISSION_MAX_LOAD = float(os.getenv('ADMISSION_MAX_LOAD', 2.0))
+    ADMISSION_DEFAULT_BOT_MB = int(os.getenv('ADMISSION_DEFAULT_BOT_MB', 80))
+    ADMISSION_RETRY_DELAY = float(os.getenv('ADMISSION_RETRY_DELAY', 60))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 3600))
+    # Seconds after a bot (re)started during which another restart that would run the same code is skipped
+    RESTART_COOLDOWN = float(os.getenv('RESTART_COOLDOWN', 30))
+    # Deployment job queue: concurrent workers, attempts per job, base retry delay (seconds, grows per attempt),
+    # how long interactive callers wait for their job, days finished jobs are kept
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 3))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 30))
+    JOB_WAIT_TIMEOUT = float(os.getenv('JOB_WAIT_TIMEOUT', 120))
+    JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
     
     # Payment Configuration
     BANK_CARD_NUMBER = os.getenv('BANK_CARD_NUMBER')
@@ -42,6 +151,8 @@ class Config:
     BOT_STATUS_INACTIVE = "inactive"
     BOT_STATUS_EXPIRED = "expired"
     BOT_STATUS_PENDING = "pending"
+    BOT_STATUS_QUARANTINED = "quarantined"
+    BOT_STATUS_HIBERNATED = "hibernated"
     
     # Payment Status
     PAYMENT_STATUS_PENDING = "pending"
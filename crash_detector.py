@@ -0,0 +1,199 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+from config import Config
+from logger import logger
+from database import db
+from bot_manager import bot_manager
+from log_collector import log_collector
+
+# (signature, fatal, pattern). The first signature matching a line wins, so specific ones come first.
+# Fatal signatures mean the bot cannot serve users however long it stays "running".
+SIGNATURES: List[Tuple[str, bool, bytes]] = [
+    ('conflict', True, rb'terminated by other getUpdates request|Conflict: '),
+    ('invalid_token', True, rb'InvalidToken|Unauthorized|The token `[^`]*` was rejected'),
+    ('import_error', True, rb'ModuleNotFoundError|ImportError'),
+    ('syntax_error', True, rb'SyntaxError|IndentationError'),
+    ('flood', False, rb'RetryAfter|Flood control exceeded'),
+    ('network', False, rb'NetworkError|TimedOut|ConnectError|ReadTimeout'),
+    ('traceback', False, rb'Traceback \(most recent call last\)'),
+]
+FATAL = {name for name, fatal, _ in SIGNATURES if fatal}
+PATTERN = re.compile(b'|'.join(b'(?P<%s>%s)' % (name.encode(), pattern) for name, _, pattern in SIGNATURES))
+
+# An unterminated line longer than this is cut (e.g. a bot printing binary data without newlines)
+MAX_PARTIAL = 64 * 1024
+# Most bytes read from one stderr file per follower pass
+MAX_READ = 1024 * 1024
+
+class CrashDetector:
+    """Classifies known failure signatures in bot stderr as it is written.
+
+    Output collected by the log collector is fed in directly; bots writing their log files
+    themselves (collector disabled) are followed by offset, only new bytes being read on each
+    pass. Matches are kept per bot for CRASH_SIGNATURE_WINDOW seconds and summarised into a
+    state stored in bot_health: 'failing' when a fatal signature was seen, 'degraded' after
+    CRASH_DEGRADED_THRESHOLD other errors, 'healthy' otherwise.
+    """
+    def __init__(self):
+        self.running = False
+        self.events: Dict[int, deque] = {}  # bot_id -> deque of (timestamp, signature)
+        self.last_match: Dict[int, Tuple[str, str]] = {}  # bot_id -> (signature, line)
+        self.states: Dict[int, str] = {}
+        self._partial: Dict[int, bytes] = {}
+        self._offsets: Dict[int, Tuple[int, int]] = {}  # bot_id -> (inode, offset) of followed stderr files
+        self._dirty = set()
+        log_collector.listeners.append(self.feed)
+
+    def feed(self, bot_id: int, stream: str, data: bytes):
+        """Scan newly written output; only complete lines are classified."""
+        if stream != 'stderr':
+            return
+        buf = self._partial.pop(bot_id, b'') + data
+        cut = buf.rfind(b'\n')
+        if cut < 0:
+            self._partial[bot_id] = buf[-MAX_PARTIAL:]
+            return
+        if cut + 1 < len(buf):
+            self._partial[bot_id] = buf[cut + 1:][-MAX_PARTIAL:]
+        self._scan(bot_id, buf[:cut + 1])
+
+    def _scan(self, bot_id: int, data: bytes):
+        now = time.time()
+        events = None
+        line_end = -1
+        for match in PATTERN.finditer(data):
+            if match.start() <= line_end:
+                # Another signature on a line that was already classified
+                continue
+            line_start = data.rfind(b'\n', 0, match.start()) + 1
+            line_end = data.find(b'\n', match.end())
+            if events is None:
+                events = self.events.setdefault(bot_id, deque())
+            events.append((now, match.lastgroup))
+            # The line shown for a bot is the latest fatal one, so a following traceback does not hide it
+            if match.lastgroup in FATAL or self.last_match.get(bot_id, ('', ''))[0] not in FATAL:
+                line = data[line_start:line_end].decode('utf-8', 'replace').strip()
+                self.last_match[bot_id] = (match.lastgroup, line[:300])
+        if events is not None:
+            self._dirty.add(bot_id)
+
+    def _read_appended(self, targets: Dict[int, str]) -> List[Tuple[int, bytes]]:
+        """(Sync) Read what was appended to the given stderr files since the last pass.
+        Only the read offsets are touched here; the data is classified on the event loop."""
+        chunks = []
+        for bot_id, path in targets.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            known = self._offsets.get(bot_id)
+            if known is None:
+                # First sight: start at the end instead of classifying old history
+                offset = st.st_size
+            elif known[0] != st.st_ino or st.st_size < known[1]:
+                # Replaced or truncated
+                offset = 0
+            else:
+                offset = known[1]
+            if st.st_size > offset:
+                try:
+                    with open(path, 'rb') as f:
+                        f.seek(offset)
+                        data = f.read(MAX_READ)
+                except OSError:
+                    continue
+                offset += len(data)
+                chunks.append((bot_id, data))
+            self._offsets[bot_id] = (st.st_ino, offset)
+        for bot_id in list(self._offsets):
+            if bot_id not in targets:
+                del self._offsets[bot_id]
+        return chunks
+
+    async def follow_files(self):
+        """Classify what was appended to the stderr files of bots not attached to the collector.
+        Files are read in a worker thread; events and states are only changed on the event loop."""
+        targets = {
+            bot_id: os.path.join(info['bot_dir'], 'logs', 'stderr.log')
+            for bot_id, info in bot_manager.running_bots.items()
+            if bot_id not in log_collector.streams and info.get('shared') is None
+        }
+        for bot_id, data in await asyncio.to_thread(self._read_appended, targets):
+            self.feed(bot_id, 'stderr', data)
+
+    def counts(self, bot_id: int) -> Dict[str, int]:
+        """Signature counts of a bot within the window"""
+        counts: Dict[str, int] = {}
+        for _, signature in self.events.get(bot_id, ()):
+            counts[signature] = counts.get(signature, 0) + 1
+        return counts
+
+    def state_for(self, counts: Dict[str, int]) -> str:
+        if any(signature in FATAL for signature in counts):
+            return 'failing'
+        if sum(counts.values()) >= Config.CRASH_DEGRADED_THRESHOLD:
+            return 'degraded'
+        return 'healthy'
+
+    async def flush(self):
+        """Expire old matches and store the states that changed since the last flush"""
+        horizon = time.time() - Config.CRASH_SIGNATURE_WINDOW
+        for bot_id, events in list(self.events.items()):
+            expired = False
+            while events and events[0][0] < horizon:
+                events.popleft()
+                expired = True
+            if expired:
+                self._dirty.add(bot_id)
+            if not events:
+                del self.events[bot_id]
+                self.last_match.pop(bot_id, None)
+        if not self._dirty:
+            return
+        rows = []
+        for bot_id in self._dirty:
+            counts = self.counts(bot_id)
+            state = self.state_for(counts)
+            if not counts and self.states.get(bot_id, 'healthy') == 'healthy':
+                continue
+            signature, line = self.last_match.get(bot_id, (None, None))
+            rows.append((bot_id, state, counts, signature, line))
+            if state != self.states.get(bot_id):
+                logger.log_bot_event(bot_id, "Health changed", details=f"{state} {counts}")
+            self.states[bot_id] = state
+        self._dirty.clear()
+        if rows:
+            await db.set_bot_health(rows)
+
+    async def start(self):
+        """Start the follow/flush loop"""
+        self.running = True
+        logger.log_system_event("Crash detector started")
+        while self.running:
+            try:
+                await self.follow_files()
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error in crash detector: {e}")
+            await asyncio.sleep(Config.CRASH_DETECTOR_INTERVAL)
+
+    async def stop(self):
+        """Stop the loop and store pending states"""
+        self.running = False
+        await self.flush()
+        logger.log_system_event("Crash detector stopped")
+
+    def summary(self, bot_id: int) -> Optional[Dict[str, Any]]:
+        """In-memory view of a bot's current health (None if nothing was seen in the window)"""
+        counts = self.counts(bot_id)
+        if not counts:
+            return None
+        signature, line = self.last_match.get(bot_id, (None, None))
+        return {'state': self.state_for(counts), 'counts': counts, 'last_signature': signature, 'last_line': line}
+
+# Global crash detector instance
+crash_detector = CrashDetector()
@@ -1,6 +1,7 @@
 import aiosqlite
 import os
 import asyncio
+import json
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 from config import Config
@@ -71,6 +72,43 @@ class Database:
                 await db.execute("ALTER TABLE bots ADD COLUMN locked_channel_id TEXT")
             except Exception:
                 pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN deployed_sha TEXT")
+            except Exception:
+                pass
+            try:
+                # Commit a rollback moved the bot away from; not deployed to it again (see BotManager.rollback_bot)
+                await db.execute("ALTER TABLE bots ADD COLUMN bad_sha TEXT")
+            except Exception:
+                pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN restart_count INTEGER DEFAULT 0")
+            except Exception:
+                pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN last_exit_code INTEGER")
+            except Exception:
+                pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN last_crash_at TIMESTAMP")
+            except Exception:
+                pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN process_started_at REAL")
+            except Exception:
+                pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN launch_meta TEXT")
+            except Exception:
+                pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN last_exit_reason TEXT")
+            except Exception:
+                pass
+            try:
+                await db.execute("ALTER TABLE bots ADD COLUMN last_cold_start_ms INTEGER")
+            except Exception:
+                pass
             
             # Subscriptions table
             await db.execute('''
@@ -115,6 +153,68 @@ class Database:
                 )
             ''')
             
+            # Hourly resource usage rollups (hour = unix timestamp of the start of the hour)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS bot_metrics_hourly (
+                    bot_id INTEGER NOT NULL,
+                    hour INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    cpu_avg REAL,
+                    cpu_max REAL,
+                    rss_avg INTEGER,
+                    rss_max INTEGER,
+                    fds_max INTEGER,
+                    PRIMARY KEY (bot_id, hour)
+                )
+            ''')
+            
+            # Failure signatures seen in each bot's stderr (counts = JSON {signature: n} over the detector window)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS bot_health (
+                    bot_id INTEGER PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    counts TEXT,
+                    last_signature TEXT,
+                    last_line TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Deployment job queue (see job_queue.py); lower priority runs first, run_after is a unix time
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bot_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 20,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    stage TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    payload TEXT,
+                    error TEXT,
+                    run_after REAL NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority, id)')
+            
+            # Timed deploy/update/restart runs; stages = JSON [{stage, start, end}] with unix timestamps
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS deploy_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bot_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    ok INTEGER NOT NULL,
+                    started_at REAL NOT NULL,
+                    finished_at REAL NOT NULL,
+                    stages TEXT
+                )
+            ''')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_deploy_runs_started ON deploy_runs (started_at)')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_deploy_runs_bot ON deploy_runs (bot_id, started_at)')
+            
             await db.commit()
     
     # User operations
@@ -286,6 +386,87 @@ class Database:
             print(f"Error updating bot status: {e}")
             return False
 
+    async def set_bot_deployed_sha(self, bot_id: int, sha: Optional[str]) -> bool:
+        """Record the commit SHA the bot's running process was started from"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('UPDATE bots SET deployed_sha = ? WHERE id = ?', (sha, bot_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error updating deployed sha for bot {bot_id}: {e}")
+            return False
+
+    async def set_bot_bad_sha(self, bot_id: int, sha: Optional[str]) -> bool:
+        """Record the commit a rollback moved the bot away from (None clears it)"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('UPDATE bots SET bad_sha = ? WHERE id = ?', (sha, bot_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error updating bad sha for bot {bot_id}: {e}")
+            return False
+
+    async def set_bot_launch_meta(self, bot_id: int, process_started_at: float, meta: Dict[str, Any]) -> bool:
+        """Store how the bot's process was launched (create_time, pgid, command) so it can be managed after a manager restart"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('UPDATE bots SET process_started_at = ?, launch_meta = ? WHERE id = ?',
+                                 (process_started_at, json.dumps(meta), bot_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error updating launch metadata for bot {bot_id}: {e}")
+            return False
+
+    async def clear_bot_process(self, bot_id: int) -> bool:
+        """Forget the recorded process of a bot"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('UPDATE bots SET process_id = NULL, process_started_at = NULL, launch_meta = NULL WHERE id = ?', (bot_id,))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error clearing process for bot {bot_id}: {e}")
+            return False
+
+    async def record_bot_crash(self, bot_id: int, exit_code: Optional[int], reason: Optional[str] = None) -> bool:
+        """Record an unexpected bot process exit (reason: e.g. oom_killed, memory_limit, fd_limit)"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('''
+                    UPDATE bots SET last_exit_code = ?, last_exit_reason = ?, last_crash_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (exit_code, reason, bot_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error recording crash for bot {bot_id}: {e}")
+            return False
+
+    async def set_bot_cold_start(self, bot_id: int, latency_ms: int) -> bool:
+        """Record how long the last wake from hibernation took"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('UPDATE bots SET last_cold_start_ms = ? WHERE id = ?', (latency_ms, bot_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error recording cold start for bot {bot_id}: {e}")
+            return False
+
+    async def increment_bot_restart_count(self, bot_id: int) -> bool:
+        """Count an automatic restart performed by the supervisor"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('UPDATE bots SET restart_count = COALESCE(restart_count, 0) + 1 WHERE id = ?', (bot_id,))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error incrementing restart count for bot {bot_id}: {e}")
+            return False
+
     async def update_bot_admin_and_channel(self, bot_id: int, admin_user_id: int = None, locked_channel_id: str = None) -> bool:
         """Update bot admin and locked channel settings"""
         try:
@@ -300,6 +481,290 @@ class Database:
             print(f"Error updating bot admin/channel: {e}")
             return False
     
+    async def add_bot_metrics_hourly(self, rows: List[tuple]) -> bool:
+        """Store hourly rollups: (bot_id, hour, samples, cpu_avg, cpu_max, rss_avg, rss_max, fds_max).
+        A partial hour written earlier (e.g. on shutdown) is merged with the new rows.
+        """
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executemany('''
+                    INSERT INTO bot_metrics_hourly (bot_id, hour, samples, cpu_avg, cpu_max, rss_avg, rss_max, fds_max)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(bot_id, hour) DO UPDATE SET
+                        cpu_avg = (cpu_avg * samples + excluded.cpu_avg * excluded.samples) / (samples + excluded.samples),
+                        rss_avg = (rss_avg * samples + excluded.rss_avg * excluded.samples) / (samples + excluded.samples),
+                        samples = samples + excluded.samples,
+                        cpu_max = MAX(cpu_max, excluded.cpu_max),
+                        rss_max = MAX(rss_max, excluded.rss_max),
+                        fds_max = MAX(fds_max, excluded.fds_max)
+                ''', rows)
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error storing bot metrics: {e}")
+            return False
+
+    async def get_bot_metrics_hourly(self, bot_id: int, hours: int = 24) -> List[Dict[str, Any]]:
+        """Hourly rollups of a bot for the last `hours` hours, oldest first"""
+        since = int(datetime.now().timestamp()) - hours * 3600
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT * FROM bot_metrics_hourly WHERE bot_id = ? AND hour >= ? ORDER BY hour
+            ''', (bot_id, since)) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+
+    async def prune_bot_metrics_hourly(self, retention_days: int) -> bool:
+        """Delete hourly rollups older than retention_days"""
+        try:
+            cutoff = int(datetime.now().timestamp()) - retention_days * 86400
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('DELETE FROM bot_metrics_hourly WHERE hour < ?', (cutoff,))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error pruning bot metrics: {e}")
+            return False
+
+    async def set_bot_health(self, rows: List[tuple]) -> bool:
+        """Store health states: (bot_id, state, counts_dict, last_signature, last_line)"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executemany('''
+                    INSERT INTO bot_health (bot_id, state, counts, last_signature, last_line, updated_at)
+                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(bot_id) DO UPDATE SET
+                        state = excluded.state,
+                        counts = excluded.counts,
+                        last_signature = COALESCE(excluded.last_signature, last_signature),
+                        last_line = COALESCE(excluded.last_line, last_line),
+                        updated_at = CURRENT_TIMESTAMP
+                ''', [(bot_id, state, json.dumps(counts), signature, line)
+                      for bot_id, state, counts, signature, line in rows])
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error storing bot health: {e}")
+            return False
+
+    async def get_bot_health(self, bot_id: int) -> Optional[Dict[str, Any]]:
+        """Health state of a bot with counts decoded, or None if never classified"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('SELECT * FROM bot_health WHERE bot_id = ?', (bot_id,)) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return None
+        health = dict(row)
+        health['counts'] = json.loads(health['counts'] or '{}')
+        return health
+
+    async def get_unhealthy_bots(self) -> List[Dict[str, Any]]:
+        """Bots whose health state is not 'healthy', failing first"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT h.*, b.bot_username FROM bot_health h JOIN bots b ON b.id = h.bot_id
+                WHERE h.state != 'healthy'
+                ORDER BY h.state = 'failing' DESC, h.updated_at DESC
+            ''') as cursor:
+                rows = await cursor.fetchall()
+        result = []
+        for row in rows:
+            health = dict(row)
+            health['counts'] = json.loads(health['counts'] or '{}')
+            result.append(health)
+        return result
+
+    # Job queue operations
+    async def add_job(self, bot_id: int, kind: str, priority: int, payload: Optional[Dict[str, Any]] = None) -> int:
+        """Queue a job, or return the id of a queued/running job of the same kind for the bot
+        (raising its priority if the new request is more urgent)."""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT id, priority, status FROM jobs WHERE bot_id = ? AND kind = ? AND status IN ('queued', 'running')
+                ORDER BY id LIMIT 1
+            ''', (bot_id, kind)) as cursor:
+                row = await cursor.fetchone()
+            if row:
+                if row['status'] == 'queued' and priority < row['priority']:
+                    await db.execute('UPDATE jobs SET priority = ? WHERE id = ?', (priority, row['id']))
+                    await db.commit()
+                return row['id']
+            cursor = await db.execute('''
+                INSERT INTO jobs (bot_id, kind, priority, payload) VALUES (?, ?, ?, ?)
+            ''', (bot_id, kind, priority, json.dumps(payload or {})))
+            await db.commit()
+            return cursor.lastrowid
+
+    async def claim_next_job(self, exclude_bot_ids: List[int]) -> Optional[Dict[str, Any]]:
+        """Mark the most urgent runnable job as running and return it (None if there is none).
+        Jobs of bots in exclude_bot_ids are skipped so one bot never has two jobs in flight."""
+        now = datetime.now().timestamp()
+        placeholders = ",".join("?" * len(exclude_bot_ids))
+        exclude = f"AND bot_id NOT IN ({placeholders})" if exclude_bot_ids else ""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(f'''
+                SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? {exclude}
+                ORDER BY priority, id LIMIT 1
+            ''', (now, *exclude_bot_ids)) as cursor:
+                row = await cursor.fetchone()
+            if not row:
+                return None
+            cursor = await db.execute('''
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'queued'
+            ''', (row['id'],))
+            await db.commit()
+            if cursor.rowcount != 1:
+                return None
+        job = dict(row)
+        job['status'] = 'running'
+        job['attempts'] += 1
+        job['payload'] = json.loads(job['payload'] or '{}')
+        return job
+
+    async def set_job_stage(self, job_id: int, stage: str) -> bool:
+        """Record the stage a running job has reached"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('UPDATE jobs SET stage = ? WHERE id = ?', (stage, job_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error updating job stage: {e}")
+            return False
+
+    async def finish_job(self, job_id: int, status: str, error: Optional[str] = None) -> bool:
+        """Close a job as done, failed or cancelled"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('''
+                    UPDATE jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?
+                ''', (status, error, job_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error finishing job: {e}")
+            return False
+
+    async def retry_job(self, job_id: int, error: str, delay_seconds: float, count_attempt: bool = True) -> bool:
+        """Put a failed attempt back in the queue; its stage is kept so the next attempt can resume.
+        count_attempt=False gives the attempt back (the job was postponed, not failed)."""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('''
+                    UPDATE jobs SET status = 'queued', error = ?, run_after = ?, attempts = attempts - ? WHERE id = ?
+                ''', (error, datetime.now().timestamp() + delay_seconds, 0 if count_attempt else 1, job_id))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error re-queueing job: {e}")
+            return False
+
+    async def requeue_running_jobs(self) -> int:
+        """Jobs interrupted by a manager restart go back to the queue (stage kept). Returns how many."""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("UPDATE jobs SET status = 'queued', run_after = 0 WHERE status = 'running'")
+            await db.commit()
+            return cursor.rowcount
+
+    async def cancel_bot_jobs(self, bot_id: int, kinds: Optional[List[str]] = None) -> int:
+        """Cancel a bot's queued jobs (optionally only some kinds). Returns how many."""
+        query = "UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP WHERE bot_id = ? AND status = 'queued'"
+        params: list = [bot_id]
+        if kinds:
+            query += f" AND kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(query, params)
+            await db.commit()
+            return cursor.rowcount
+
+    async def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Get a job by id"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def get_pending_job(self, bot_id: int) -> Optional[Dict[str, Any]]:
+        """The bot's queued or running job, if any (the most recent one)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT * FROM jobs WHERE bot_id = ? AND status IN ('queued', 'running') ORDER BY id DESC LIMIT 1
+            ''', (bot_id,)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def get_bots_with_jobs(self) -> set:
+        """Ids of bots with a queued or running job"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("SELECT DISTINCT bot_id FROM jobs WHERE status IN ('queued', 'running')") as cursor:
+                return {row[0] for row in await cursor.fetchall()}
+
+    async def count_jobs(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status') as cursor:
+                return {status: n for status, n in await cursor.fetchall()}
+
+    async def prune_jobs(self, retention_days: int) -> bool:
+        """Delete finished jobs older than retention_days"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                # finished_at is CURRENT_TIMESTAMP (UTC), so the cutoff is computed by SQLite as well
+                await db.execute('''
+                    DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < datetime('now', ?)
+                ''', (f"-{int(retention_days)} days",))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error pruning jobs: {e}")
+            return False
+
+    async def add_deploy_run(self, bot_id: int, kind: str, ok: bool, started_at: float, finished_at: float,
+                             stages: List[Dict[str, Any]]) -> bool:
+        """Store one timed run; runs older than METRICS_RETENTION_DAYS are dropped at the same time"""
+        try:
+            cutoff = finished_at - Config.METRICS_RETENTION_DAYS * 86400
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute('''
+                    INSERT INTO deploy_runs (bot_id, kind, ok, started_at, finished_at, stages)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (bot_id, kind, 1 if ok else 0, started_at, finished_at, json.dumps(stages)))
+                await db.execute('DELETE FROM deploy_runs WHERE started_at < ?', (cutoff,))
+                await db.commit()
+                return True
+        except Exception as e:
+            print(f"Error storing deploy run: {e}")
+            return False
+
+    async def get_deploy_runs(self, since: float = 0, bot_id: Optional[int] = None, limit: int = 5000) -> List[Dict[str, Any]]:
+        """Timed runs started at or after `since` (unix time), newest first, stages decoded"""
+        query = 'SELECT * FROM deploy_runs WHERE started_at >= ?'
+        params: list = [since]
+        if bot_id is not None:
+            query += ' AND bot_id = ?'
+            params.append(bot_id)
+        query += ' ORDER BY started_at DESC LIMIT ?'
+        params.append(limit)
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+        runs = []
+        for row in rows:
+            run = dict(row)
+            run['stages'] = json.loads(run['stages'] or '[]')
+            runs.append(run)
+        return runs
+
     async def get_all_bots(self) -> List[Dict[str, Any]]:
         """Get all bots in the system"""
         async with aiosqlite.connect(self.db_path) as db:
@@ -309,7 +774,7 @@ class Database:
                 return [dict(row) for row in rows]
 
     async def delete_bot(self, bot_id: int, owner_id: int) -> bool:
-        """Delete a bot and related data (subscriptions, payments referencing it).
+        """Delete a bot and related data (subscriptions, health, metrics, deploy runs, jobs, payments referencing it).
         Requires owner_id match to prevent deleting others' bots.
         """
         try:
@@ -322,6 +787,11 @@ class Database:
                         return False
                 # Delete related subscriptions
                 await db.execute('DELETE FROM subscriptions WHERE bot_id = ?', (bot_id,))
+                await db.execute('DELETE FROM bot_health WHERE bot_id = ?', (bot_id,))
+                await db.execute('DELETE FROM bot_metrics_hourly WHERE bot_id = ?', (bot_id,))
+                await db.execute('DELETE FROM deploy_runs WHERE bot_id = ?', (bot_id,))
+                # The running job is the delete job calling this; its row goes with the JOB_RETENTION_DAYS prune
+                await db.execute("DELETE FROM jobs WHERE bot_id = ? AND status != 'running'", (bot_id,))
                 # Null payments' bot_id to retain payment history
                 await db.execute('UPDATE payments SET bot_id = NULL WHERE bot_id = ?', (bot_id,))
                 # Delete the bot itself
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import shutil
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from config import Config
+from logger import logger
+from database import db
+from bot_manager import bot_manager, WARM_POOL_DIR, SNAPSHOT_DIR
+from log_collector import log_collector, STREAMS
+from trash_bin import trash_bin, TRASH_DIR
+
+# Directories whose files change size without the directory itself changing (always re-stat'ed)
+VOLATILE_DIRS = ('logs',)
+
+class _DirEntry:
+    __slots__ = ('mtime_ns', 'own', 'shared', 'subdirs')
+
+    def __init__(self, mtime_ns: int, own: int, shared: Dict[int, int], subdirs: List[str]):
+        self.mtime_ns = mtime_ns
+        self.own = own
+        self.shared = shared  # inode -> bytes, for files with more than one link
+        self.subdirs = subdirs
+
+class DiskGC:
+    """Disk accounting and garbage collection of BOT_DEPLOYMENT_DIR.
+
+    Usage is counted in allocated blocks and kept per directory together with the directory's
+    mtime: a directory whose entries did not change is not listed again, only its subdirectories
+    are visited, so a pass over a fleet of venvs stats a few thousand directories instead of every
+    file. Files with several links (snapshot/warm pool hardlinks) are counted once in totals and
+    reported per bot as 'shared'. Each pass also removes bot_<id> directories without a row in the
+    bots table (once they stayed orphaned for DISK_GC_ORPHAN_GRACE seconds and nothing runs from
+    them), drops the venv of bots unused for DISK_GC_STALE_VENV_DAYS (recreated on the next deploy)
+    and rotates oversized logs of bots writing their log files themselves.
+    """
+    def __init__(self):
+        self.running = False
+        self.report: Dict[str, Any] = {}
+        self._dirs: Dict[str, _DirEntry] = {}
+        self._visited = set()
+        self._orphans: Dict[str, float] = {}  # path -> first time seen without a bots row
+        self._lock = asyncio.Lock()
+
+    def _scan(self, path: str, volatile: bool = False) -> Tuple[int, Dict[int, int]]:
+        """(Sync) Bytes of files with a single link and {inode: bytes} of the others below path."""
+        self._visited.add(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._dirs.pop(path, None)
+            return 0, {}
+        entry = self._dirs.get(path)
+        if entry is None or entry.mtime_ns != st.st_mtime_ns or volatile:
+            own, shared, subdirs = 0, {}, []
+            try:
+                with os.scandir(path) as it:
+                    for item in it:
+                        try:
+                            if item.is_dir(follow_symlinks=False):
+                                subdirs.append(item.name)
+                                continue
+                            if item.is_symlink():
+                                continue
+                            ist = item.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        size = ist.st_blocks * 512
+                        if ist.st_nlink > 1:
+                            shared[ist.st_ino] = size
+                        else:
+                            own += size
+            except OSError:
+                pass
+            entry = _DirEntry(st.st_mtime_ns, own, shared, subdirs)
+            self._dirs[path] = entry
+        own, shared = entry.own, dict(entry.shared)
+        for name in entry.subdirs:
+            sub_own, sub_shared = self._scan(os.path.join(path, name), name in VOLATILE_DIRS)
+            own += sub_own
+            shared.update(sub_shared)
+        return own, shared
+
+    def _forget(self, path: str):
+        prefix = path + os.sep
+        for key in [key for key in self._dirs if key == path or key.startswith(prefix)]:
+            del self._dirs[key]
+
+    def _bot_dirs(self) -> Dict[int, str]:
+        out = {}
+        try:
+            names = os.listdir(bot_manager.deployment_dir)
+        except OSError:
+            return out
+        for name in names:
+            suffix = name[len('bot_'):]
+            if name.startswith('bot_') and suffix.isdigit():
+                out[int(suffix)] = os.path.join(bot_manager.deployment_dir, name)
+        return out
+
+    def _measure(self) -> Dict[str, Any]:
+        """(Sync) Per-bot and per-area usage of the deployment directory."""
+        bots, areas = {}, {}
+        self._visited = set()
+        seen_shared: Dict[int, int] = {}
+        own_total = 0
+        for bot_id, path in self._bot_dirs().items():
+            own, shared = self._scan(path)
+            logs, _ = self._scan(os.path.join(path, 'logs'), True)
+            bots[bot_id] = {'own': own, 'shared': sum(shared.values()), 'logs': logs}
+            own_total += own
+            seen_shared.update(shared)
+        area_paths = {'snapshots': SNAPSHOT_DIR, 'warm_pool': WARM_POOL_DIR, 'trash': TRASH_DIR,
+                      'shared_host': '.shared_host', 'zygotes': '.zygotes'}
+        for area, name in area_paths.items():
+            own, shared = self._scan(os.path.join(bot_manager.deployment_dir, name))
+            areas[area] = own + sum(shared.values())
+            own_total += own
+            seen_shared.update(shared)
+        if os.path.isdir(bot_manager.mirror_dir):
+            own, shared = self._scan(bot_manager.mirror_dir)
+            areas['mirror'] = own + sum(shared.values())
+            own_total += own
+            seen_shared.update(shared)
+        # Directories not reached this pass were removed (or their bot was)
+        for path in [path for path in self._dirs if path not in self._visited]:
+            del self._dirs[path]
+        try:
+            fs = shutil.disk_usage(bot_manager.deployment_dir)
+            filesystem = {'total': fs.total, 'used': fs.used, 'free': fs.free}
+        except OSError:
+            filesystem = {}
+        return {
+            'bots': bots,
+            'areas': areas,
+            'total': own_total + sum(seen_shared.values()),
+            'logs': sum(row['logs'] for row in bots.values()),
+            'filesystem': filesystem,
+        }
+
+    def _last_used(self, bot_dir: str) -> float:
+        """(Sync) Latest of the directory's and its active logs' modification times"""
+        times = []
+        for path in [bot_dir] + [os.path.join(bot_dir, 'logs', f"{name}.log") for name in STREAMS]:
+            try:
+                times.append(os.path.getmtime(path))
+            except OSError:
+                pass
+        return max(times, default=0)
+
+    def _collect(self, statuses: Dict[int, str], busy_ids: set) -> Dict[str, Any]:
+        """(Sync) One GC pass over the bot directories; busy bots are never touched."""
+        now = time.time()
+        removed, venvs, rotated = [], [], []
+        bot_dirs = self._bot_dirs()
+        for bot_id, path in bot_dirs.items():
+            if bot_id in busy_ids:
+                self._orphans.pop(path, None)
+                continue
+            if bot_id not in statuses:
+                first_seen = self._orphans.setdefault(path, now)
+                if now - first_seen >= Config.DISK_GC_ORPHAN_GRACE and trash_bin.discard(path):
+                    self._forget(path)
+                    self._orphans.pop(path, None)
+                    removed.append(bot_id)
+                    logger.log_bot_event(bot_id, "Disk GC: orphaned directory removed", details=path)
+                continue
+            self._orphans.pop(path, None)
+            venv = os.path.join(path, 'venv')
+            # Only bots that are off on purpose: a hibernated bot must wake without reinstalling
+            if (Config.DISK_GC_STALE_VENV_DAYS > 0 and os.path.isdir(venv)
+                    and statuses[bot_id] in (Config.BOT_STATUS_EXPIRED, Config.BOT_STATUS_INACTIVE)
+                    and now - self._last_used(path) > Config.DISK_GC_STALE_VENV_DAYS * 86400):
+                if trash_bin.discard(venv):
+                    self._forget(venv)
+                    venvs.append(bot_id)
+                    logger.log_bot_event(bot_id, "Disk GC: stale venv removed",
+                                         details=f"unused for over {Config.DISK_GC_STALE_VENV_DAYS:g} days")
+        for bot_id, path in bot_dirs.items():
+            if bot_id in log_collector.streams or bot_id not in statuses:
+                continue
+            log_dir = os.path.join(path, 'logs')
+            for name in STREAMS:
+                try:
+                    size = os.path.getsize(os.path.join(log_dir, f"{name}.log"))
+                except OSError:
+                    continue
+                if size > log_collector.segment_bytes and log_collector.rotate_file(log_dir, name):
+                    rotated.append(bot_id)
+                    logger.log_bot_event(bot_id, "Disk GC: log rotated", details=f"{name}.log {size} bytes")
+        for path in [path for path in self._orphans if not os.path.exists(path)]:
+            del self._orphans[path]
+        return {'orphans_removed': removed, 'venvs_removed': venvs, 'logs_rotated': sorted(set(rotated)),
+                'orphans_pending': len(self._orphans)}
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Collect garbage, then measure; the result is also kept in self.report"""
+        async with self._lock:
+            started = time.monotonic()
+            statuses = {bot['id']: bot['status'] for bot in await db.get_all_bots()}
+            # Running bots and bots with a job in flight (e.g. a delete that has not stopped the process yet)
+            busy_ids = set(bot_manager.running_bots) | await db.get_bots_with_jobs()
+            gc = await asyncio.to_thread(self._collect, statuses, busy_ids)
+            usage = await asyncio.to_thread(self._measure)
+            self.report = dict(usage, gc=gc, at=time.time(), seconds=time.monotonic() - started,
+                               trash_pending=trash_bin.pending())
+            if gc['orphans_removed'] or gc['venvs_removed'] or gc['logs_rotated']:
+                logger.log_system_event("Disk GC pass", details=f"orphans removed {gc['orphans_removed']}, stale venvs "
+                                        f"{gc['venvs_removed']}, logs rotated {gc['logs_rotated']}")
+            return self.report
+
+    async def start(self):
+        """Start the periodic GC loop"""
+        self.running = True
+        logger.log_system_event("Disk GC started")
+        while self.running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error in disk GC: {e}")
+            await asyncio.sleep(Config.DISK_GC_INTERVAL)
+
+    def stop(self):
+        """Stop the loop"""
+        self.running = False
+        logger.log_system_event("Disk GC stopped")
+
+# Global disk GC instance
+disk_gc = DiskGC()
@@ -0,0 +1,219 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from config import Config
+from logger import logger
+from database import db
+from bot_manager import bot_manager, AdmissionDenied
+from trash_bin import trash_bin
+
+KINDS = ('deploy', 'update', 'restart', 'delete')
+# Lower runs first: paying customers, then demos, then background maintenance
+PRIORITY_PAID = 0
+PRIORITY_DEMO = 10
+PRIORITY_BACKGROUND = 20
+
+class JobQueue:
+    """Persistent queue of deploy/update/restart/delete jobs, run by a fixed number of workers.
+
+    Jobs live in the jobs table with the stage they reached (reported by the BotManager
+    on_stage hooks). Jobs interrupted by a manager restart are queued again on start and
+    resume idempotently: a deploy whose clone or materialization was cut short starts afresh,
+    a deploy of a bot that is already running (e.g. re-adopted) is done, and venv/pip work
+    is skipped when already complete. A bot never has two jobs in flight; a job of the same
+    kind already queued or running for a bot absorbs new submissions. Deploys refused by
+    admission control stay queued and are retried as capacity frees up.
+    """
+    def __init__(self):
+        self.running = False
+        self._workers: List[asyncio.Task] = []
+        self._active_bots = set()
+        self._claim_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        # job_id -> futures of callers waiting for the outcome
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+
+    async def priority_for(self, bot_id: int) -> int:
+        subscription = await db.get_bot_subscription(bot_id)
+        if not subscription or not await db.is_subscription_active(bot_id):
+            return PRIORITY_BACKGROUND
+        return PRIORITY_DEMO if subscription.get('plan_type') == 'demo' else PRIORITY_PAID
+
+    async def submit(self, bot_id: int, kind: str, payload: Optional[Dict[str, Any]] = None,
+                     priority: Optional[int] = None) -> int:
+        """Queue a job and return its id (the id of an equivalent pending job if there is one)"""
+        if kind not in KINDS:
+            raise ValueError(f"unknown job kind {kind!r}")
+        if kind == 'delete':
+            # Nothing queued for a bot that is going away is worth running
+            await db.cancel_bot_jobs(bot_id)
+        if priority is None:
+            priority = await self.priority_for(bot_id)
+        job_id = await db.add_job(bot_id, kind, priority, payload)
+        self._wakeup.set()
+        return job_id
+
+    async def wait(self, job_id: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for a job to finish and return its row, or None on timeout"""
+        job = await db.get_job(job_id)
+        if job is None or job['status'] in ('done', 'failed', 'cancelled'):
+            return job
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[job_id]
+        return await db.get_job(job_id)
+
+    async def submit_and_wait(self, bot_id: int, kind: str, payload: Optional[Dict[str, Any]] = None,
+                              priority: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """Queue a job and wait up to timeout (JOB_WAIT_TIMEOUT by default). True only if it finished successfully."""
+        job_id = await self.submit(bot_id, kind, payload, priority)
+        job = await self.wait(job_id, Config.JOB_WAIT_TIMEOUT if timeout is None else timeout)
+        return bool(job and job['status'] == 'done')
+
+    async def start(self):
+        """Re-queue interrupted jobs and start the workers"""
+        requeued = await db.requeue_running_jobs()
+        if requeued:
+            logger.log_system_event("Resuming interrupted jobs", details=str(requeued))
+        await db.prune_jobs(Config.JOB_RETENTION_DAYS)
+        self.running = True
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(max(1, Config.JOB_WORKERS))]
+        logger.log_system_event("Job queue started", details=f"workers={len(self._workers)}")
+
+    async def stop(self):
+        """Stop the workers; jobs still running are resumed on the next start"""
+        self.running = False
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.log_system_event("Job queue stopped")
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        # Serialised so two workers cannot pick jobs of the same bot at the same time
+        async with self._claim_lock:
+            job = await db.claim_next_job(list(self._active_bots))
+            if job:
+                self._active_bots.add(job['bot_id'])
+            return job
+
+    async def _worker(self, n: int):
+        while self.running:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Job worker {n}: error claiming a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # Woken by submit(); the timeout also picks up retries whose delay has passed
+                    await asyncio.wait_for(self._wakeup.wait(), 5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            finally:
+                self._active_bots.discard(job['bot_id'])
+                # Another job of this bot may have been waiting for this one
+                self._wakeup.set()
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id, bot_id, kind = job['id'], job['bot_id'], job['kind']
+        logger.log_bot_event(bot_id, f"Job {job_id} {kind} started",
+                             details=f"attempt {job['attempts']}, resuming at {job['stage'] or 'start'}")
+
+        async def on_stage(stage: str):
+            await db.set_job_stage(job_id, stage)
+
+        try:
+            ok = await getattr(self, f"_run_{kind}")(job, on_stage)
+            error = None if ok else f"{kind} failed"
+        except asyncio.CancelledError:
+            # Manager shutting down: the job stays 'running' and is resumed on the next start
+            raise
+        except AdmissionDenied as e:
+            await self._postpone(job, str(e))
+            return
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        if ok:
+            logger.log_bot_event(bot_id, f"Job {job_id} {kind} done")
+            await db.finish_job(job_id, 'done')
+        elif job['attempts'] < Config.JOB_MAX_ATTEMPTS:
+            delay = Config.JOB_RETRY_DELAY * job['attempts']
+            logger.log_bot_event(bot_id, f"Job {job_id} {kind} failed; retrying", details=f"in {delay:.0f}s: {error}")
+            await db.retry_job(job_id, error, delay)
+            return
+        else:
+            logger.log_bot_event(bot_id, f"Job {job_id} {kind} failed; giving up",
+                                 details=f"after {job['attempts']} attempts: {error}")
+            logger.error(f"Job {job_id} ({kind} bot {bot_id}) failed: {error}")
+            await db.finish_job(job_id, 'failed', error)
+        self._notify(job_id)
+
+    def _notify(self, job_id: int):
+        for future in self._waiters.pop(job_id, []):
+            if not future.done():
+                future.set_result(None)
+
+    async def _postpone(self, job: Dict[str, Any], reason: str):
+        """The host has no room for the bot right now: wait for capacity without using up attempts,
+        for at most ADMISSION_QUEUE_TIMEOUT seconds after the job was submitted."""
+        job_id, bot_id = job['id'], job['bot_id']
+        # created_at is SQLite CURRENT_TIMESTAMP: UTC, without an offset
+        created_at = datetime.fromisoformat(job['created_at']).replace(tzinfo=timezone.utc)
+        waited = (datetime.now(timezone.utc) - created_at).total_seconds()
+        if waited > Config.ADMISSION_QUEUE_TIMEOUT:
+            logger.log_bot_event(bot_id, f"Job {job_id} {job['kind']} failed; no capacity",
+                                 details=f"waited {waited:.0f}s: {reason}")
+            await db.finish_job(job_id, 'failed', reason)
+        else:
+            logger.log_bot_event(bot_id, f"Job {job_id} {job['kind']} waiting for capacity", details=reason)
+            await db.retry_job(job_id, reason, Config.ADMISSION_RETRY_DELAY, count_attempt=False)
+        # Callers waiting on it see the job still queued and can tell the user why
+        self._notify(job_id)
+
+    async def _run_deploy(self, job: Dict[str, Any], on_stage) -> bool:
+        bot_id = job['bot_id']
+        bot = await db.get_bot(bot_id)
+        if not bot:
+            return True
+        if await bot_manager.is_bot_running(bot_id):
+            # Already up (deployed meanwhile, or re-adopted after the restart that interrupted this job)
+            return True
+        if job['stage'] in ('clone', 'materialize'):
+            # The previous attempt died while creating the directory: whatever is on disk is incomplete
+            trash_bin.discard(bot_manager._bot_dir(bot_id))
+        return await bot_manager.deploy_bot(bot_id, bot['bot_token'], on_stage=on_stage)
+
+    async def _run_update(self, job: Dict[str, Any], on_stage) -> bool:
+        if not await db.get_bot(job['bot_id']):
+            return True
+        return await bot_manager.update_bot_code(job['bot_id'], on_stage=on_stage)
+
+    async def _run_restart(self, job: Dict[str, Any], on_stage) -> bool:
+        if not await db.get_bot(job['bot_id']):
+            return True
+        return await bot_manager.restart_bot(job['bot_id'], mode=job['payload'].get('mode', 'auto'), on_stage=on_stage)
+
+    async def _run_delete(self, job: Dict[str, Any], on_stage) -> bool:
+        bot_id = job['bot_id']
+        if not await bot_manager.delete_bot(bot_id, on_stage=on_stage):
+            return False
+        # The row goes last: stopping a bot the manager holds no handle for needs its recorded PID
+        bot = await db.get_bot(bot_id)
+        return not bot or await db.delete_bot(bot_id, owner_id=bot['owner_id'])
+
+# Global job queue instance
+job_queue = JobQueue()
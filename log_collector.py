@@ -0,0 +1,280 @@
+import asyncio
+import fcntl
+import gzip
+import os
+import shutil
+import stat
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from logger import logger
+
+STREAMS = ('stdout', 'stderr')
+# Bytes read from a pipe per call; a busy bot is drained in a few calls per wake-up
+READ_CHUNK = 64 * 1024
+# Kernel buffer requested for each pipe (capped by /proc/sys/fs/pipe-max-size). Output a bot writes while
+# no manager is reading waits here; once it is full the bot's next stdout/stderr write blocks until a
+# manager attaches again (see LogCollector)
+PIPE_BUFFER_BYTES = 1024 * 1024
+
+class _Stream:
+    __slots__ = ('bot_id', 'name', 'log_dir', 'path', 'fd', 'file', 'size')
+
+    def __init__(self, bot_id: int, name: str, log_dir: str, fd: int):
+        self.bot_id = bot_id
+        self.name = name
+        self.log_dir = log_dir
+        self.path = os.path.join(log_dir, f"{name}.log")
+        self.fd = fd
+        self.file = open(self.path, 'ab')
+        self.size = self.file.tell()
+
+class LogCollector:
+    """Collects bot stdout/stderr through named pipes and writes bounded, rotated logs.
+
+    Each bot gets run/stdout.pipe and run/stderr.pipe. The child writes to them (opened
+    read-write, so a missing reader never raises EPIPE in the bot) and the manager reads them
+    on the event loop into logs/<stream>.log. When the active file reaches LOG_SEGMENT_MB it
+    is renamed to <stream>.log.<timestamp> and gzipped in a worker thread; rotated segments
+    beyond LOG_BOT_RETENTION_MB per bot and stream, then beyond LOG_TOTAL_CAP_MB over all
+    bots, are deleted oldest first. Because the pipes live on disk, bots re-adopted after a
+    manager restart are simply re-attached and their buffered output is not lost.
+
+    The pipes are blocking for the bot: while no manager reads them (manager stopped or
+    restarting), a bot can write up to PIPE_BUFFER_BYTES per stream and then stalls in its next
+    print or log call until a manager re-attaches. A chatty bot therefore stops serving users
+    during a long manager outage, which plain log files never cause; that is why the collector
+    is opt-in (LOG_COLLECTOR_ENABLED).
+    """
+    def __init__(self):
+        self.streams: Dict[int, Dict[str, _Stream]] = {}
+        # Callables (bot_id, stream_name, data) that see every chunk as it is collected
+        self.listeners: List[Callable[[int, str, bytes], None]] = []
+        self._prune_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return Config.LOG_COLLECTOR_ENABLED
+
+    @property
+    def segment_bytes(self) -> int:
+        return int(Config.LOG_SEGMENT_MB * 1024 * 1024)
+
+    def pipe_paths(self, bot_dir: str) -> Dict[str, str]:
+        return {name: os.path.join(bot_dir, 'run', f"{name}.pipe") for name in STREAMS}
+
+    def prepare(self, bot_id: int, bot_dir: str) -> Optional[Dict[str, str]]:
+        """Create the bot's pipes and start reading them. Returns {'stdout': path, 'stderr': path}
+        for the child to open, or None when the collector is disabled or the pipes cannot be made
+        (the caller then falls back to plain log files)."""
+        if not self.enabled:
+            return None
+        paths = self.pipe_paths(bot_dir)
+        try:
+            os.makedirs(os.path.dirname(paths['stdout']), exist_ok=True)
+            for path in paths.values():
+                if os.path.exists(path) and not stat.S_ISFIFO(os.stat(path).st_mode):
+                    os.unlink(path)
+                if not os.path.exists(path):
+                    os.mkfifo(path, 0o600)
+            self.attach(bot_id, bot_dir)
+        except OSError as e:
+            logger.log_bot_event(bot_id, "Log pipes unavailable; writing files directly", details=str(e))
+            return None
+        return paths
+
+    def attach(self, bot_id: int, bot_dir: str) -> bool:
+        """Start reading the bot's existing pipes (also used for bots adopted after a manager restart)."""
+        if bot_id in self.streams:
+            return True
+        paths = self.pipe_paths(bot_dir)
+        if not all(os.path.exists(path) for path in paths.values()):
+            return False
+        log_dir = os.path.join(bot_dir, 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        streams = {}
+        try:
+            for name, path in paths.items():
+                # Read-write: the pipe never reports EOF, so a bot restart does not need a new reader
+                fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+                try:
+                    fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, PIPE_BUFFER_BYTES)
+                except (OSError, AttributeError):
+                    pass
+                streams[name] = _Stream(bot_id, name, log_dir, fd)
+        except OSError:
+            for stream in streams.values():
+                self._close(stream)
+            raise
+        self.streams[bot_id] = streams
+        for stream in streams.values():
+            loop.add_reader(stream.fd, self._on_readable, stream)
+            self._maybe_rotate(stream)
+        return True
+
+    def detach(self, bot_id: int):
+        """Collect what is still buffered in the bot's pipes and stop reading them."""
+        streams = self.streams.pop(bot_id, None)
+        if not streams:
+            return
+        loop = asyncio.get_running_loop()
+        for stream in streams.values():
+            loop.remove_reader(stream.fd)
+            self._drain(stream)
+            self._close(stream)
+
+    def flush(self, bot_id: int):
+        """Copy everything the bot has written so far into its log files (e.g. before reading stderr after an exit)."""
+        for stream in self.streams.get(bot_id, {}).values():
+            self._drain(stream)
+
+    def stop(self):
+        """Detach all bots; their pipes keep buffering until the next manager attaches."""
+        for bot_id in list(self.streams):
+            self.detach(bot_id)
+
+    def _close(self, stream: _Stream):
+        try:
+            os.close(stream.fd)
+        except OSError:
+            pass
+        stream.file.close()
+
+    def _on_readable(self, stream: _Stream):
+        self._drain(stream)
+
+    def _drain(self, stream: _Stream):
+        while True:
+            try:
+                data = os.read(stream.fd, READ_CHUNK)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.error(f"Error reading {stream.name} of bot {stream.bot_id}: {e}")
+                return
+            if not data:
+                return
+            try:
+                stream.file.write(data)
+                stream.file.flush()
+            except OSError as e:
+                # Disk full or similar: drop the output rather than stall the bot behind a full pipe
+                logger.error(f"Error writing {stream.name} log of bot {stream.bot_id}: {e}")
+                continue
+            stream.size += len(data)
+            for listener in self.listeners:
+                try:
+                    listener(stream.bot_id, stream.name, data)
+                except Exception as e:
+                    logger.error(f"Error in log listener for bot {stream.bot_id}: {e}")
+            self._maybe_rotate(stream)
+
+    def _maybe_rotate(self, stream: _Stream):
+        if stream.size < self.segment_bytes:
+            return
+        stream.file.close()
+        # Microsecond timestamps keep names unique and sorting chronologically
+        rotated = f"{stream.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            rotated = f"{stream.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        try:
+            os.rename(stream.path, rotated)
+        except OSError as e:
+            logger.error(f"Error rotating {stream.path}: {e}")
+            rotated = None
+        stream.file = open(stream.path, 'ab')
+        stream.size = stream.file.tell()
+        if rotated:
+            asyncio.get_running_loop().run_in_executor(None, self._compress_and_prune, rotated, stream.log_dir, stream.name)
+
+    def rotate_file(self, log_dir: str, name: str) -> bool:
+        """(Sync) Rotate an active log written by the bot itself (collector off or bypassed): copy it to a
+        segment and truncate it in place, since the bot keeps its append-mode descriptor. Lines written
+        between the copy and the truncate are lost."""
+        path = os.path.join(log_dir, f"{name}.log")
+        rotated = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        try:
+            shutil.copyfile(path, rotated)
+            os.truncate(path, 0)
+        except OSError as e:
+            logger.error(f"Error rotating {path}: {e}")
+            return False
+        self._compress_and_prune(rotated, log_dir, name)
+        return True
+
+    def _compress_and_prune(self, path: str, log_dir: str, name: str):
+        """(Sync) gzip a rotated segment, then enforce the per-bot and global budgets."""
+        # One at a time, so a prune never deletes a segment another thread is still compressing
+        with self._prune_lock:
+            try:
+                with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, READ_CHUNK)
+                os.unlink(path)
+            except OSError as e:
+                logger.error(f"Error compressing {path}: {e}")
+            self._prune(self.segments(log_dir, name), Config.LOG_BOT_RETENTION_MB)
+            self._prune(self._all_segments(), Config.LOG_TOTAL_CAP_MB, extra=self._active_bytes())
+
+    def _prune(self, segments: List[Tuple[str, int]], budget_mb: float, extra: int = 0):
+        """Delete the oldest segments until their total (plus `extra` bytes) fits the budget."""
+        budget = int(budget_mb * 1024 * 1024)
+        total = extra + sum(size for _, size in segments)
+        for path, size in segments:
+            if total <= budget:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def segments(self, log_dir: str, name: str) -> List[Tuple[str, int]]:
+        """(Sync) Rotated segments of one stream as (path, size), oldest first."""
+        prefix = f"{name}.log."
+        out = []
+        try:
+            entries = list(os.scandir(log_dir))
+        except OSError:
+            return out
+        for entry in entries:
+            if entry.name.startswith(prefix):
+                try:
+                    out.append((entry.path, entry.stat().st_size))
+                except OSError:
+                    pass
+        out.sort()
+        return out
+
+    def _bot_log_dirs(self) -> List[str]:
+        try:
+            entries = list(os.scandir(Config.BOT_DEPLOYMENT_DIR))
+        except OSError:
+            return []
+        return [os.path.join(entry.path, 'logs') for entry in entries if entry.name.startswith('bot_') and entry.is_dir()]
+
+    def _all_segments(self) -> List[Tuple[str, int]]:
+        segments = []
+        for log_dir in self._bot_log_dirs():
+            for name in STREAMS:
+                segments.extend(self.segments(log_dir, name))
+        segments.sort(key=lambda item: os.path.basename(item[0]).split('.log.', 1)[1])
+        return segments
+
+    def _active_bytes(self) -> int:
+        total = 0
+        for log_dir in self._bot_log_dirs():
+            for name in STREAMS:
+                try:
+                    total += os.path.getsize(os.path.join(log_dir, f"{name}.log"))
+                except OSError:
+                    pass
+        return total
+
+    def disk_usage(self) -> int:
+        """(Sync) Bytes used by all bot logs, active files and rotated segments."""
+        return self._active_bytes() + sum(size for _, size in self._all_segments())
+
+# Global log collector instance
+log_collector = LogCollector()
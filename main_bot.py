@@ -1,5 +1,7 @@
 import asyncio
 import logging
+import re
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
@@ -14,6 +16,13 @@ from database import db
 from bot_manager import bot_manager
 from payment_handler import payment_handler
 from monitor import monitor
+from resource_sampler import resource_sampler, sparkline
+from webhook_ingress import webhook_ingress
+from log_collector import log_collector
+from crash_detector import crash_detector
+from job_queue import job_queue
+from trash_bin import trash_bin
+from disk_gc import disk_gc
 from error_handler import handle_telegram_errors, error_handler
 from logger import logger
 import os
@@ -21,9 +30,22 @@ import os
 # Conversation states
 WAITING_FOR_BOT_TOKEN, WAITING_FOR_ADMIN_ID, WAITING_FOR_CHANNEL_ID, WAITING_FOR_PAYMENT_PROOF = range(4)
 
+# Crash detector signatures as shown to users
+SIGNATURE_LABELS = {
+    'conflict': 'اجرای هم‌زمان با همین توکن (409 Conflict)',
+    'invalid_token': 'توکن نامعتبر',
+    'import_error': 'کتابخانه نصب نشده (ImportError)',
+    'syntax_error': 'خطای سینتکس در کد',
+    'flood': 'محدودیت ارسال تلگرام',
+    'network': 'خطای شبکه',
+    'traceback': 'Traceback'
+}
+
 class MainBot:
     def __init__(self):
         self.application = None
+        # Background restart-all run started from the setup panel (one at a time)
+        self.restart_all_task = None
     
     def setup_handlers(self):
         """Setup all command and callback handlers"""
@@ -42,6 +64,8 @@ class MainBot:
         self.application.add_handler(CommandHandler("role", self.set_user_role_command))
         self.application.add_handler(CommandHandler("active", self.set_user_active_command))
         self.application.add_handler(CommandHandler("broadcast", self.broadcast_command))
+        self.application.add_handler(CommandHandler("botstats", self.botstats_command))
+        self.application.add_handler(CommandHandler("logs", self.logs_command))
         
         # Conversation handlers (must be added BEFORE catch-all callback handler)
         bot_creation_conv = ConversationHandler(
@@ -237,9 +261,8 @@ class MainBot:
             await self.handle_bot_callback(update, context, data)
         elif data.startswith("start_bot_"):
             bot_id = int(data.split("_")[-1])
-            bot_info = await db.get_bot(bot_id)
-            if bot_info:
-                await bot_manager.deploy_bot(bot_id, bot_info['bot_token'])
+            if await db.get_bot(bot_id):
+                await job_queue.submit_and_wait(bot_id, 'deploy')
             await self.handle_bot_callback(update, context, f"bot_{bot_id}")
         elif data.startswith("stop_bot_"):
             bot_id = int(data.split("_")[-1])
@@ -247,7 +270,7 @@ class MainBot:
             await self.handle_bot_callback(update, context, f"bot_{bot_id}")
         elif data.startswith("restart_bot_"):
             bot_id = int(data.split("_")[-1])
-            await bot_manager.restart_bot(bot_id)
+            await job_queue.submit_and_wait(bot_id, 'restart')
             await self.handle_bot_callback(update, context, f"bot_{bot_id}")
         elif data.startswith("plan_"):
             await self.handle_plan_callback(update, context, data)
@@ -288,6 +311,10 @@ class MainBot:
             await self.show_system_stats(update, context)
         elif data == "restart_all_bots":
             await self.handle_restart_all_bots(update, context)
+        elif data == "restart_changed_bots":
+            await self.handle_restart_all_bots(update, context, only_if_changed=True)
+        elif data == "rolling_restart_bots":
+            await self.handle_restart_all_bots(update, context, rolling=True)
         elif data == "cleanup_expired":
             await self.handle_cleanup_expired(update, context)
     
@@ -625,6 +652,7 @@ class MainBot:
         for bot in all_bots:
             if await db.is_subscription_active(bot['id']):
                 active_bots += 1
+        jobs = await db.count_jobs()
         
         text = f"""
 ⚙️ **پنل ادمین**
@@ -633,6 +661,7 @@ class MainBot:
 • کل ربات‌ها: {len(all_bots)}
 • ربات‌های فعال: {active_bots}
 • پرداخت‌های در انتظار: {len(pending_payments)}
+• کارهای استقرار: {jobs.get('queued', 0)} در صف، {jobs.get('running', 0)} در حال اجرا، {jobs.get('failed', 0)} ناموفق
 
 **عملیات ادمین:**
         """
@@ -641,6 +670,10 @@ class MainBot:
             [InlineKeyboardButton("👥 مدیریت کاربران", callback_data="admin_users")],
             [InlineKeyboardButton("💳 پرداخت‌های در انتظار", callback_data="admin_payments")],
             [InlineKeyboardButton("🤖 همه ربات‌ها", callback_data="admin_bots")],
+            [InlineKeyboardButton("📈 مصرف منابع", callback_data="admin_resources")],
+            [InlineKeyboardButton("🩺 سلامت ربات‌ها", callback_data="admin_health")],
+            [InlineKeyboardButton("⏱ زمان استقرار", callback_data="admin_deploys")],
+            [InlineKeyboardButton("💽 فضای دیسک", callback_data="admin_disk")],
             [InlineKeyboardButton("⚙️ تنظیمات", callback_data="admin_settings")],
             [InlineKeyboardButton("📢 ارسال پیام", callback_data="admin_broadcast")],
             [InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data="main_menu")]
@@ -760,11 +793,11 @@ class MainBot:
                             # Grant demo subscription
                             await db.add_subscription(bot_id, 'demo', int(Config.DEMO_DURATION_DAYS))
                             await db.set_user_used_demo(user_id, True)
-                            # Try to deploy immediately
+                            # Queue the deploy right away
                             try:
                                 bot_info = await db.get_bot(bot_id)
                                 if bot_info and bot_info.get('bot_token'):
-                                    await bot_manager.deploy_bot(bot_id, bot_info['bot_token'])
+                                    await job_queue.submit(bot_id, 'deploy')
                             except Exception as e:
                                 logger.error(f"Error deploying demo bot {bot_id}: {e}")
                             try:
@@ -803,9 +836,10 @@ class MainBot:
         bot_id = int(data.replace("bot_", ""))
         user_id = update.callback_query.from_user.id
         
-        # Get bot info
+        # Get bot info (admins may open any bot's panel, e.g. to read its logs)
         bot = await db.get_bot(bot_id)
-        if not bot or bot['owner_id'] != user_id:
+        is_admin = await db.is_admin(user_id)
+        if not bot or (bot['owner_id'] != user_id and not is_admin):
             await update.callback_query.edit_message_text("❌ Bot not found or access denied.")
             return
         
@@ -828,6 +862,31 @@ class MainBot:
             f"• آخرین فعالیت: {last_activity}"
         )
         
+        if status.get('restart_count'):
+            text += f"\n• ری‌استارت‌های خودکار: {int(status['restart_count'])}"
+        exit_reasons = {
+            'oom_killed': 'کمبود حافظه (OOM)',
+            'memory_limit': 'رسیدن به سقف حافظه',
+            'fd_limit': 'رسیدن به سقف فایل‌های باز',
+            'pids_limit': 'رسیدن به سقف پردازه‌ها',
+            'killed': 'کشته شدن توسط سیستم'
+        }
+        if status.get('last_exit_reason') in exit_reasons:
+            text += f"\n• علت آخرین توقف: {exit_reasons[status['last_exit_reason']]}"
+        health = await db.get_bot_health(bot_id)
+        if status['is_running'] and health and health['state'] != 'healthy':
+            text += f"\n⚠️ خطای تکراری در لاگ: {escape(self._signature_summary(health['counts']))}"
+        if status['status'] == Config.BOT_STATUS_HIBERNATED:
+            text += "\n💤 ربات به خاطر بی‌استفاده بودن خوابیده و با اولین پیام خودکار بیدار می‌شه."
+        if status['status'] == Config.BOT_STATUS_QUARANTINED:
+            text += "\n⚠️ ربات به خاطر کرش‌های پشت‌سرهم قرنطینه شده؛ بعد از رفع مشکل «▶️ شروع ربات» رو بزن."
+        job = await db.get_pending_job(bot_id)
+        if job and job['kind'] == 'delete':
+            text += "\n🗑️ ربات در حال حذفه."
+        elif not status['is_running']:
+            if job and job['status'] == 'queued' and (job.get('error') or '').startswith('capacity:'):
+                text += "\n⏳ الان ظرفیت سرور پره؛ ربات در صف روشن شدنه و به‌محض آزاد شدن ظرفیت خودکار روشن می‌شه."
+        
         if subscription:
             end_date = datetime.fromisoformat(subscription['end_date'])
             days_left = (end_date - datetime.now()).days
@@ -847,6 +906,11 @@ class MainBot:
             keyboard.append([InlineKeyboardButton("🔄 راه‌اندازی مجدد ربات", callback_data=f"restart_bot_{bot_id}")])
         else:
             keyboard.append([InlineKeyboardButton("💳 اشتراک", callback_data="subscribe")])
+        if is_admin:
+            keyboard.append([
+                InlineKeyboardButton("📜 مشاهده لاگ‌ها", callback_data=f"admin_logs_stderr_{bot_id}"),
+                InlineKeyboardButton("⏱ استقرارهای اخیر", callback_data=f"admin_deployruns_{bot_id}")
+            ])
         
         keyboard.append([
             InlineKeyboardButton("🗑️ حذف ربات", callback_data=f"delete_bot_{bot_id}"),
@@ -903,17 +967,17 @@ class MainBot:
         if not bot or bot['owner_id'] != user_id:
             await update.callback_query.answer("دسترسی غیرمجاز", show_alert=True)
             return
-        # Stop and remove files
+        # The delete job stops the bot, removes its files and then its row (queued deploys of this bot are cancelled)
         try:
-            await bot_manager.delete_bot(bot_id)
+            ok = await job_queue.submit_and_wait(bot_id, 'delete')
         except Exception:
-            pass
-        # Remove from DB
-        ok = await db.delete_bot(bot_id, owner_id=user_id)
+            ok = False
         if ok:
             await update.callback_query.edit_message_text("🗑️ ربات حذف شد.")
             # Show updated list
             await self.show_user_bots(update, context, user_id)
+        elif await db.get_pending_job(bot_id):
+            await update.callback_query.edit_message_text("⏳ حذف ربات در حال انجامه و به‌زودی تموم می‌شه.")
         else:
             await update.callback_query.edit_message_text("❌ حذف ربات ناموفق بود.")
     
@@ -933,6 +997,31 @@ class MainBot:
             await self.show_all_bots(update, context)
         elif data == "admin_settings":
             await self.show_admin_settings(update, context)
+        elif data == "admin_resources":
+            await self.show_resource_usage(update, context)
+        elif data == "admin_health":
+            await self.show_bot_health(update, context)
+        elif data == "admin_deploys":
+            await self.show_deploy_timings(update, context)
+        elif data == "admin_disk":
+            await self.show_disk_usage(update, context)
+        elif data == "admin_disk_gc":
+            await disk_gc.run_once()
+            await self.show_disk_usage(update, context)
+        elif data.startswith("admin_deployruns_"):
+            await self.show_bot_deploy_runs(update, context, int(data.split("_")[-1]))
+        elif data.startswith("admin_botstats_"):
+            bot_id = int(data.split("_")[-1])
+            keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="admin_resources")]]
+            await update.callback_query.edit_message_text(
+                await self._format_bot_stats(bot_id),
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        elif data.startswith("admin_logs_"):
+            # admin_logs_<stream>_<bot_id>
+            _, _, stream, bot_id = data.split("_")
+            await self.show_bot_logs(update, context, int(bot_id), stream)
         elif data == "admin_broadcast":
             await self.show_broadcast_panel(update, context)
         elif data == "broadcast_text":
@@ -1355,6 +1444,8 @@ class MainBot:
         """
         keyboard = [
             [InlineKeyboardButton("🔄 راه‌اندازی مجدد همه ربات‌ها", callback_data="restart_all_bots")],
+            [InlineKeyboardButton("♻️ راه‌اندازی مجدد فقط ربات‌های تغییرکرده", callback_data="restart_changed_bots")],
+            [InlineKeyboardButton("🌊 به‌روزرسانی مرحله‌ای (با بررسی سلامت)", callback_data="rolling_restart_bots")],
             [InlineKeyboardButton("🧹 پاکسازی ربات‌های منقضی", callback_data="cleanup_expired")],
             [InlineKeyboardButton("📊 آمار سیستم", callback_data="system_stats")],
             [InlineKeyboardButton("🔙 بازگشت به پنل ادمین", callback_data="admin_panel")]
@@ -1374,6 +1465,299 @@ class MainBot:
                 reply_markup=reply_markup
             )
 
+    async def botstats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /botstats [bot_id] command (admin only): top bots by usage, or one bot's history"""
+        user_id = update.effective_user.id
+        if not await db.is_admin(user_id):
+            await update.message.reply_text("❌ Access denied. Admin privileges required.")
+            return
+        if context.args:
+            try:
+                bot_id = int(context.args[0])
+            except ValueError:
+                await update.message.reply_text("استفاده: /botstats [bot_id]")
+                return
+            text = await self._format_bot_stats(bot_id)
+        else:
+            text = await self._format_resource_usage()
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
+    async def logs_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /logs <bot_id> [out] [pattern] command (admin only): tail a bot's log, or search it.
+        A pattern written as /regex/ is matched as a regular expression, anything else as a substring.
+        """
+        user_id = update.effective_user.id
+        if not await db.is_admin(user_id):
+            await update.message.reply_text("❌ Access denied. Admin privileges required.")
+            return
+        usage = "استفاده: /logs bot_id [out] [عبارت یا /regex/]"
+        args = list(context.args or [])
+        try:
+            bot_id = int(args.pop(0))
+        except (IndexError, ValueError):
+            await update.message.reply_text(usage)
+            return
+        stream = 'stderr'
+        if args and args[0] in ('out', 'stdout'):
+            stream = 'stdout'
+            args.pop(0)
+        pattern = " ".join(args)
+        if not pattern:
+            await update.message.reply_text(await self._format_bot_logs(bot_id, stream), parse_mode=ParseMode.HTML)
+            return
+        regex = len(pattern) > 2 and pattern.startswith('/') and pattern.endswith('/')
+        try:
+            result = await bot_manager.search_bot_logs(bot_id, pattern[1:-1] if regex else pattern, stream, regex=regex)
+        except re.error as e:
+            await update.message.reply_text(f"❌ الگوی نامعتبر: {escape(str(e))}", parse_mode=ParseMode.HTML)
+            return
+        header = f"<b>🔎 جستجو در {stream} ربات {bot_id}:</b> <code>{escape(pattern)}</code>\n"
+        if not result['matches']:
+            header += "موردی پیدا نشد."
+        elif not result['complete']:
+            header += f"(جدیدترین نتایج؛ {result['files_scanned']} فایل بررسی شد)\n"
+        lines = [f"{name.replace(f'{stream}.log', '').lstrip('.') or 'current'}: {line}" for name, line in result['matches']]
+        await update.message.reply_text(header + self._log_block(lines), parse_mode=ParseMode.HTML)
+
+    def _log_block(self, lines: list, limit: int = 3500) -> str:
+        """Newest log lines that fit in one Telegram message, as an HTML <pre> block."""
+        kept = []
+        size = 0
+        for line in reversed(lines):
+            line = line[:500]
+            size += len(line) + 1
+            if size > limit:
+                break
+            kept.append(line)
+        if not kept:
+            return ""
+        return f"<pre>{escape(chr(10).join(reversed(kept)))}</pre>"
+
+    async def _format_bot_logs(self, bot_id: int, stream: str) -> str:
+        bot = await db.get_bot(bot_id)
+        if not bot:
+            return "❌ ربات پیدا نشد."
+        lines = await bot_manager.tail_bot_log(bot_id, stream, 40)
+        text = f"<b>📜 {stream} ربات @{escape(str(bot['bot_username']))}</b> (آخرین خطوط)\n\n"
+        return text + (self._log_block(lines) or "لاگی ثبت نشده.")
+
+    @handle_telegram_errors
+    async def show_bot_logs(self, update: Update, context: ContextTypes.DEFAULT_TYPE, bot_id: int, stream: str):
+        """Show the tail of a bot's stderr/stdout for admin"""
+        if stream not in ('stdout', 'stderr'):
+            stream = 'stderr'
+        other = 'stdout' if stream == 'stderr' else 'stderr'
+        keyboard = [
+            [InlineKeyboardButton("🔄 بروزرسانی", callback_data=f"admin_logs_{stream}_{bot_id}"),
+             InlineKeyboardButton(f"📄 {other}", callback_data=f"admin_logs_{other}_{bot_id}")],
+            [InlineKeyboardButton("🔙 بازگشت به ربات", callback_data=f"bot_{bot_id}")]
+        ]
+        try:
+            await update.callback_query.edit_message_text(
+                await self._format_bot_logs(bot_id, stream),
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        except Exception as e:
+            # Refresh without new output
+            if 'Message is not modified' not in str(e):
+                raise
+
+    def _signature_summary(self, counts: dict) -> str:
+        return "، ".join(f"{SIGNATURE_LABELS.get(name, name)} ×{n}"
+                        for name, n in sorted(counts.items(), key=lambda item: -item[1]))
+
+    @handle_telegram_errors
+    async def show_bot_health(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show bots with failure signatures in their stderr for admin"""
+        await crash_detector.flush()
+        unhealthy = await db.get_unhealthy_bots()
+        text = f"<b>🩺 سلامت ربات‌ها</b> (خطاهای {Config.CRASH_SIGNATURE_WINDOW // 60} دقیقه اخیر)\n\n"
+        if not unhealthy:
+            text += "✅ خطای شناخته‌شده‌ای در لاگ ربات‌ها دیده نشده."
+        keyboard = []
+        for health in unhealthy[:20]:
+            icon = '🔴' if health['state'] == 'failing' else '🟡'
+            text += f"{icon} @{escape(str(health['bot_username']))}: {escape(self._signature_summary(health['counts']))}\n"
+            if health.get('last_line'):
+                text += f"<code>{escape(health['last_line'][:150])}</code>\n"
+            keyboard.append([InlineKeyboardButton(f"📜 @{health['bot_username']}",
+                                                  callback_data=f"admin_logs_stderr_{health['bot_id']}")])
+        keyboard.append([InlineKeyboardButton("🔄 بروزرسانی", callback_data="admin_health")])
+        keyboard.append([InlineKeyboardButton("🔙 بازگشت به پنل ادمین", callback_data="admin_panel")])
+        try:
+            await update.callback_query.edit_message_text(
+                text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        except Exception as e:
+            if 'Message is not modified' not in str(e):
+                raise
+
+    @handle_telegram_errors
+    async def show_deploy_timings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show p50/p95 per deploy stage over the last week for admin"""
+        stats = await bot_manager.deploy_timing_stats(7)
+        kind_names = {'deploy': 'استقرار', 'update': 'به‌روزرسانی کد', 'restart': 'ری‌استارت'}
+        text = "<b>⏱ زمان استقرار (۷ روز اخیر)</b>\nمیانه / صدک ۹۵ به ثانیه\n"
+        if not stats:
+            text += "\nهنوز اجرایی ثبت نشده."
+        for kind, by_stage in stats.items():
+            total = by_stage.get('total')
+            text += f"\n<b>{kind_names.get(kind, kind)}</b> ({total['count'] if total else 0} موفق، {by_stage['failed']['count']} ناموفق)\n"
+            rows = [(stage, row) for stage, row in by_stage.items() if stage not in ('total', 'failed')]
+            rows.sort(key=lambda item: -item[1]['p95'])
+            if total:
+                rows.insert(0, ('total', total))
+            lines = [f"{stage:<8} {row['p50']:>7.1f} {row['p95']:>7.1f}  n={row['count']}" for stage, row in rows]
+            text += f"<pre>{escape(chr(10).join(lines))}</pre>"
+        keyboard = [[InlineKeyboardButton("🔄 بروزرسانی", callback_data="admin_deploys")],
+                    [InlineKeyboardButton("🔙 بازگشت به پنل ادمین", callback_data="admin_panel")]]
+        try:
+            await update.callback_query.edit_message_text(
+                text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        except Exception as e:
+            if 'Message is not modified' not in str(e):
+                raise
+
+    @handle_telegram_errors
+    async def show_bot_deploy_runs(self, update: Update, context: ContextTypes.DEFAULT_TYPE, bot_id: int):
+        """Show a bot's recent deploy/update/restart runs with stage durations for admin"""
+        runs = await db.get_deploy_runs(bot_id=bot_id, limit=10)
+        text = f"<b>⏱ استقرارهای اخیر ربات {bot_id}</b>\n\n"
+        if not runs:
+            text += "اجرایی ثبت نشده."
+        for run in runs:
+            when = datetime.fromtimestamp(run['started_at']).strftime('%m-%d %H:%M')
+            stages = "، ".join(f"{st['stage']} {st['end'] - st['start']:.1f}s"
+                              for st in run['stages'] if st.get('end') is not None)
+            text += (f"{'✅' if run['ok'] else '❌'} {when} {escape(run['kind'])}: "
+                     f"{run['finished_at'] - run['started_at']:.1f}s\n<code>{escape(stages or '-')}</code>\n")
+        keyboard = [[InlineKeyboardButton("🔙 بازگشت به ربات", callback_data=f"bot_{bot_id}")]]
+        try:
+            await update.callback_query.edit_message_text(
+                text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        except Exception as e:
+            if 'Message is not modified' not in str(e):
+                raise
+
+    @staticmethod
+    def _format_size(n: float) -> str:
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if n < 1024:
+                return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+            n /= 1024
+        return f"{n:.1f} TB"
+
+    @handle_telegram_errors
+    async def show_disk_usage(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show deployment directory usage and the last GC pass for admin"""
+        report = disk_gc.report or await disk_gc.run_once()
+        size = self._format_size
+        usernames = {bot['id']: bot['bot_username'] for bot in await db.get_all_bots()}
+        text = "<b>💽 فضای دیسک</b>\n\n"
+        fs = report['filesystem']
+        if fs:
+            text += f"دیسک: {size(fs['used'])} از {size(fs['total'])} (آزاد {size(fs['free'])})\n"
+        text += f"پوشه استقرار: {size(report['total'])}، لاگ‌ها: {size(report['logs'])}\n"
+        area_names = {'snapshots': 'اسنپ‌شات‌ها', 'warm_pool': 'استخر آماده', 'trash': 'سطل زباله',
+                      'shared_host': 'میزبان مشترک', 'zygotes': 'زیگوت‌ها', 'mirror': 'آینه مخزن'}
+        areas = [(area_names.get(area, area), used) for area, used in report['areas'].items() if used]
+        if areas:
+            text += "، ".join(f"{name}: {size(used)}" for name, used in areas) + "\n"
+        top = sorted(report['bots'].items(), key=lambda item: -item[1]['own'])[:10]
+        if top:
+            text += "\n<b>بیشترین مصرف (اختصاصی / مشترک / لاگ):</b>\n"
+        for bot_id, row in top:
+            name = f"@{usernames[bot_id]}" if bot_id in usernames else f"#{bot_id} (یتیم)"
+            text += f"• {escape(str(name))}: {size(row['own'])} / {size(row['shared'])} / {size(row['logs'])}\n"
+        gc = report['gc']
+        text += (f"\n<b>آخرین پاک‌سازی</b> ({datetime.fromtimestamp(report['at']).strftime('%H:%M')}، "
+                 f"{report['seconds']:.1f}s): {len(gc['orphans_removed'])} پوشه یتیم، "
+                 f"{len(gc['venvs_removed'])} venv قدیمی، {len(gc['logs_rotated'])} لاگ چرخانده شد")
+        if gc['orphans_pending']:
+            text += f"\n⏳ {gc['orphans_pending']} پوشه یتیم در انتظار حذف"
+        if report['trash_pending']:
+            text += f"\n🗑 {report['trash_pending']} مورد در حال حذف از سطل زباله"
+        keyboard = [[InlineKeyboardButton("🧹 پاک‌سازی اکنون", callback_data="admin_disk_gc")],
+                    [InlineKeyboardButton("🔄 بروزرسانی", callback_data="admin_disk")],
+                    [InlineKeyboardButton("🔙 بازگشت به پنل ادمین", callback_data="admin_panel")]]
+        try:
+            await update.callback_query.edit_message_text(
+                text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        except Exception as e:
+            if 'Message is not modified' not in str(e):
+                raise
+
+    async def _format_resource_usage(self) -> str:
+        usernames = {bot['id']: bot['bot_username'] for bot in await db.get_all_bots()}
+        text = "<b>📈 مصرف منابع ربات‌ها</b>\n\n<b>بیشترین حافظه:</b>\n"
+        by_memory = resource_sampler.top(10, 'rss')
+        if not by_memory:
+            return text + "هنوز نمونه‌ای ثبت نشده."
+        for row in by_memory:
+            text += (f"• @{escape(str(usernames.get(row['bot_id'], row['bot_id'])))}: "
+                     f"{row['rss'] / 1048576:.0f} MB، CPU {row['cpu']:.0f}%، FD {row['fds']}\n")
+        text += "\n<b>بیشترین CPU:</b>\n"
+        for row in resource_sampler.top(5, 'cpu'):
+            text += (f"• @{escape(str(usernames.get(row['bot_id'], row['bot_id'])))}: "
+                     f"CPU {row['cpu']:.0f}%، {row['rss'] / 1048576:.0f} MB\n")
+        return text
+
+    async def _format_bot_stats(self, bot_id: int) -> str:
+        bot = await db.get_bot(bot_id)
+        if not bot:
+            return "❌ ربات پیدا نشد."
+        text = f"<b>📈 مصرف منابع @{escape(str(bot['bot_username']))}</b>\n\n"
+        samples = resource_sampler.history(bot_id)
+        if samples:
+            last = samples[-1]
+            text += (f"<b>الان:</b> {last['rss'] / 1048576:.0f} MB، CPU {last['cpu']:.0f}%، "
+                     f"FD {last['fds']}، Threads {last['threads']}\n")
+            minutes = (samples[-1]['ts'] - samples[0]['ts']) / 60
+            text += f"\n<b>حافظه ({minutes:.0f} دقیقه اخیر):</b>\n<code>{sparkline([s['rss'] for s in samples])}</code>\n"
+            text += f"<b>CPU:</b>\n<code>{sparkline([s['cpu'] for s in samples])}</code>\n"
+        else:
+            text += "نمونه‌ای در حافظه نیست (ربات در حال اجرا نیست یا تازه شروع شده).\n"
+        hourly = await db.get_bot_metrics_hourly(bot_id, 24)
+        if hourly:
+            peak = max(hourly, key=lambda r: r['rss_max'])
+            text += (f"\n<b>۲۴ ساعت اخیر:</b> میانگین {sum(r['rss_avg'] for r in hourly) / len(hourly) / 1048576:.0f} MB، "
+                     f"اوج {peak['rss_max'] / 1048576:.0f} MB، بیشینه CPU {max(r['cpu_max'] for r in hourly):.0f}%\n"
+                     f"<code>{sparkline([r['rss_max'] for r in hourly], width=24)}</code>")
+        return text
+
+    @handle_telegram_errors
+    async def show_resource_usage(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show top bots by memory/CPU for admin, with per-bot history buttons"""
+        keyboard = []
+        usernames = {bot['id']: bot['bot_username'] for bot in await db.get_all_bots()}
+        for row in resource_sampler.top(10, 'rss'):
+            keyboard.append([InlineKeyboardButton(f"📊 @{usernames.get(row['bot_id'], row['bot_id'])}",
+                                                  callback_data=f"admin_botstats_{row['bot_id']}")])
+        keyboard.append([InlineKeyboardButton("🔄 بروزرسانی", callback_data="admin_resources")])
+        keyboard.append([InlineKeyboardButton("🔙 بازگشت به پنل ادمین", callback_data="admin_panel")])
+        try:
+            await update.callback_query.edit_message_text(
+                await self._format_resource_usage(),
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        except Exception as e:
+            # Refresh with unchanged numbers
+            if 'Message is not modified' not in str(e):
+                raise
+
     async def show_system_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show system statistics in setup panel"""
         all_bots = await db.get_all_bots()
@@ -1410,9 +1794,60 @@ class MainBot:
         )
 
     @handle_telegram_errors
-    async def handle_restart_all_bots(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Restart all bots from setup panel"""
-        summary = await bot_manager.restart_all_bots()
+    async def handle_restart_all_bots(self, update: Update, context: ContextTypes.DEFAULT_TYPE, only_if_changed: bool = False, rolling: bool = False):
+        """Restart all bots from setup panel (optionally only bots whose code changed, or as a health-gated rollout).
+        Runs in the background so the bot stays responsive; progress is shown by editing the panel message.
+        """
+        if self.restart_all_task and not self.restart_all_task.done():
+            await update.callback_query.answer("⏳ راه‌اندازی مجدد قبلی هنوز در حال انجامه", show_alert=True)
+            return
+        await update.callback_query.edit_message_text("⏳ راه‌اندازی مجدد ربات‌ها شروع شد...")
+        self.restart_all_task = context.application.create_task(
+            self._run_restart_all_bots(update, context, only_if_changed, rolling)
+        )
+
+    async def _run_restart_all_bots(self, update: Update, context: ContextTypes.DEFAULT_TYPE, only_if_changed: bool, rolling: bool = False):
+        """Background body of handle_restart_all_bots: restart, stream progress, then report to admin"""
+        query = update.callback_query
+        last_edit = 0.0
+
+        async def on_progress(done, total, result, summary):
+            nonlocal last_edit
+            now = time.monotonic()
+            # Telegram rate-limits edits: refresh every few seconds and once at the end
+            if done < total and now - last_edit < 3:
+                return
+            last_edit = now
+            text = (
+                "⏳ در حال راه‌اندازی مجدد ربات‌ها...\n\n"
+                f"پیشرفت: {done}/{total}\n"
+                f"🟢 راه‌اندازی‌شده: {len(summary.get('restarted', []))}\n"
+                f"⚪ بدون تغییر: {len(summary.get('unchanged', []))}\n"
+                f"⏱ ردشده (تازه راه‌اندازی‌شده): {len(summary.get('skipped_cooldown', []))}\n"
+                f"⛔ متوقف‌شده: {len(summary.get('stopped_expired', [])) + len(summary.get('stopped_inactive', []))}\n"
+                f"❗ خطا/ناسالم: {len(summary.get('errors', [])) + len(summary.get('unhealthy', []))}\n\n"
+                f"آخرین مورد: @{result.get('username') or '-'} (ID {result.get('id')})"
+            )
+            try:
+                await query.edit_message_text(text)
+            except Exception:
+                pass
+
+        try:
+            if rolling:
+                summary = await bot_manager.rolling_restart_bots(progress_callback=on_progress)
+            else:
+                summary = await bot_manager.restart_all_bots(only_if_changed=only_if_changed, progress_callback=on_progress)
+        except Exception as e:
+            logger.error(f"Error in background restart-all: {e}")
+            return
+        if rolling:
+            await self._report_rolling_restart(context, summary)
+            try:
+                await self.show_setup_panel(update, context)
+            except Exception:
+                pass
+            return
         # Notify admin with results
         try:
             if Config.ADMIN_USER_ID:
@@ -1425,6 +1860,8 @@ class MainBot:
                     "<b>🔄 گزارش راه‌اندازی مجدد همه ربات‌ها</b>\n\n"
                     f"<b>تعداد راه‌اندازی‌شده‌ها:</b> {len(summary.get('restarted', []))}\n"
                     f"<b>تعداد فقط آپدیت‌شده‌ها:</b> {len(summary.get('updated_only', []))}\n"
+                    f"<b>تعداد بدون تغییر (دست‌نخورده):</b> {len(summary.get('unchanged', []))}\n"
+                    f"<b>تعداد ردشده (تازه راه‌اندازی‌شده):</b> {len(summary.get('skipped_cooldown', []))}\n"
                     f"<b>تعداد متوقف‌شده‌های منقضی:</b> {len(summary.get('stopped_expired', []))}\n"
                     f"<b>تعداد متوقف‌شده‌های بدون اشتراک:</b> {len(summary.get('stopped_inactive', []))}\n"
                     f"<b>خطاها:</b> {len(summary.get('errors', []))}\n\n"
@@ -1439,7 +1876,44 @@ class MainBot:
                 await context.bot.send_message(chat_id=int(Config.ADMIN_USER_ID), text=text, parse_mode=ParseMode.HTML)
         except Exception:
             pass
-        await self.show_setup_panel(update, context)
+        try:
+            await self.show_setup_panel(update, context)
+        except Exception:
+            pass
+
+    async def _report_rolling_restart(self, context: ContextTypes.DEFAULT_TYPE, summary: dict):
+        """Send the rolling restart report to the admin"""
+        try:
+            if not Config.ADMIN_USER_ID:
+                return
+            def fmt_list(items):
+                if not items:
+                    return "—"
+                lines = []
+                for x in items:
+                    line = f"• @{escape(str(x.get('username') or '-'))} (ID {x.get('id')})"
+                    if x.get('error'):
+                        line += f": {escape(str(x.get('error')))}"
+                    lines.append(line)
+                return "\n".join(lines)
+            text = (
+                "<b>🌊 گزارش به‌روزرسانی مرحله‌ای</b>\n\n"
+                f"<b>وضعیت:</b> {'⛔ متوقف شد (نرخ خطا از حد مجاز گذشت)' if summary.get('halted') else '✅ کامل شد'}\n"
+                f"<b>تعداد مراحل:</b> {summary.get('waves', 0)}\n"
+                f"<b>راه‌اندازی‌شده و سالم:</b> {len(summary.get('restarted', []))}\n"
+                f"<b>فقط آپدیت‌شده (خواب):</b> {len(summary.get('updated_only', []))}\n"
+                f"<b>بدون تغییر:</b> {len(summary.get('unchanged', []))}\n"
+                f"<b>ناسالم:</b> {len(summary.get('unhealthy', []))}\n"
+                f"<b>برگشت به نسخه قبلی:</b> {len(summary.get('rolled_back', []))}\n"
+                f"<b>انجام‌نشده (بعد از توقف):</b> {len(summary.get('skipped', []))}\n\n"
+                f"<b>❗ ناسالم‌ها:</b>\n{fmt_list(summary.get('unhealthy'))}\n\n"
+                f"<b>↩️ برگشت‌خورده‌ها:</b>\n{fmt_list(summary.get('rolled_back'))}"
+            )
+            if summary.get('errors'):
+                text += f"\n\n<b>❗ خطاها:</b>\n{fmt_list(summary.get('errors'))}"
+            await context.bot.send_message(chat_id=int(Config.ADMIN_USER_ID), text=text, parse_mode=ParseMode.HTML)
+        except Exception:
+            pass
 
     async def _application_error(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Global error handler for the application to log errors gracefully."""
@@ -1509,8 +1983,29 @@ class MainBot:
         # Setup deployment directory
         await bot_manager.setup_deployment_directory()
         
+        # Re-adopt bots that kept running while the manager was down (before the monitor redeploys them)
+        try:
+            await bot_manager.reconcile_processes()
+        except Exception as e:
+            logger.error(f"Error reconciling bot processes: {e}")
+        
+        # Deploy/restart/delete workers (also resumes jobs interrupted by the last shutdown)
+        await job_queue.start()
+        bot_manager.kick_warm_pool_refill()
+        
         # Start monitoring in background
         monitor_task = asyncio.create_task(monitor.start_monitoring())
+        sampler_task = asyncio.create_task(resource_sampler.start_sampling())
+        detector_task = asyncio.create_task(crash_detector.start())
+        disk_gc_task = asyncio.create_task(disk_gc.start())
+        if Config.HIBERNATION_ENABLED:
+            wake_task = asyncio.create_task(bot_manager.start_wake_poller())
+        if webhook_ingress.enabled:
+            try:
+                await webhook_ingress.start()
+            except Exception as e:
+                # Bots fall back to polling when their webhook cannot be served
+                logger.error(f"Error starting webhook ingress: {e}")
         
         # Start the bot using async initialization to work with asyncio.run()
         if self.application is None:
@@ -1531,6 +2026,28 @@ class MainBot:
                 await monitor.stop_monitoring()
             except Exception:
                 pass
+            try:
+                await resource_sampler.stop_sampling()
+            except Exception:
+                pass
+            try:
+                await crash_detector.stop()
+            except Exception:
+                pass
+            disk_gc.stop()
+            try:
+                await job_queue.stop()
+            except Exception:
+                pass
+            try:
+                await webhook_ingress.stop()
+            except Exception:
+                pass
+            bot_manager.stop_wake_poller()
+            # Bots keep running; their output waits in the pipes until the next manager attaches
+            log_collector.stop()
+            # Whatever is still in the trash is deleted after the next start
+            trash_bin.stop()
             try:
                 await self.application.stop()
             except Exception:
@@ -5,6 +5,7 @@ from typing import List, Dict, Any
 from config import Config
 from database import db
 from bot_manager import bot_manager
+from job_queue import job_queue
 
 logger = logging.getLogger(__name__)
 
@@ -64,10 +65,11 @@ class BotMonitor:
                         # Notify user about expiration
                         await self.notify_user_expiration(owner_id, bot)
                     
-                    # If subscription is active and bot is not running, start it
-                    elif is_subscription_active and not is_bot_running:
+                    # If subscription is active and bot is not running, start it (quarantined bots wait for a manual start)
+                    # Hibernated bots are woken by their next update, not here
+                    elif is_subscription_active and not is_bot_running and bot.get('status') not in (Config.BOT_STATUS_QUARANTINED, Config.BOT_STATUS_HIBERNATED):
                         logger.info(f"Starting bot {bot_id} with active subscription")
-                        await bot_manager.deploy_bot(bot_id, bot['bot_token'])
+                        await job_queue.submit(bot_id, 'deploy')
                     
                     # Check if subscription expires in 3 days
                     elif days_left <= 3 and days_left > 0:
@@ -91,6 +93,15 @@ class BotMonitor:
         # Clean up any dead processes
         await bot_manager.cleanup_dead_processes()
         
+        # Keep pre-built slots ready for new bots (and rebuilt after the mirror moves on)
+        bot_manager.kick_warm_pool_refill()
+        
+        # Stop template bots idle longer than their plan allows
+        try:
+            await bot_manager.hibernate_idle_bots()
+        except Exception as e:
+            logger.error(f"Error hibernating idle bots: {e}")
+        
         logger.info("Bot check completed")
     
     async def notify_user_expiration(self, user_id: int, bot: Dict[str, Any]):
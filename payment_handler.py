@@ -7,7 +7,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 from config import Config
 from database import db
-from bot_manager import bot_manager
+from job_queue import job_queue, PRIORITY_PAID
 
 logger = logging.getLogger(__name__)
 
@@ -349,7 +349,7 @@ class PaymentHandler:
             # Deploy bot if token available
             deploy_ok = False
             if bot and bot.get('bot_token'):
-                deploy_ok = await bot_manager.deploy_bot(payment['bot_id'], bot['bot_token'])
+                deploy_ok = await job_queue.submit_and_wait(payment['bot_id'], 'deploy', priority=PRIORITY_PAID)
             # Notify user
             try:
                 from telegram import Bot as PTBBot
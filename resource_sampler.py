@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+from array import array
+from typing import Dict, Any, List, Optional
+import psutil
+from config import Config
+from logger import logger
+from database import db
+from bot_manager import bot_manager
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+class MetricRing:
+    """Fixed-size ring buffer of samples for one bot, one typed array per metric
+    (about 28 bytes per sample instead of a dict/tuple of Python objects).
+    """
+    __slots__ = ('size', 'ts', 'cpu', 'rss', 'fds', 'threads', 'pos', 'count')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.ts = array('d', [0.0]) * size
+        self.cpu = array('f', [0.0]) * size
+        self.rss = array('Q', [0]) * size
+        self.fds = array('I', [0]) * size
+        self.threads = array('I', [0]) * size
+        self.pos = 0
+        self.count = 0
+
+    def append(self, ts: float, cpu: float, rss: int, fds: int, threads: int):
+        i = self.pos
+        self.ts[i] = ts
+        self.cpu[i] = cpu
+        self.rss[i] = rss
+        self.fds[i] = fds
+        self.threads[i] = threads
+        self.pos = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        if not self.count:
+            return None
+        i = (self.pos - 1) % self.size
+        return {'ts': self.ts[i], 'cpu': self.cpu[i], 'rss': self.rss[i],
+                'fds': self.fds[i], 'threads': self.threads[i]}
+
+    def samples(self, since: float = 0.0) -> List[Dict[str, Any]]:
+        """Samples in chronological order, optionally only those taken at or after `since`."""
+        start = (self.pos - self.count) % self.size
+        out = []
+        for k in range(self.count):
+            i = (start + k) % self.size
+            if self.ts[i] >= since:
+                out.append({'ts': self.ts[i], 'cpu': self.cpu[i], 'rss': self.rss[i],
+                            'fds': self.fds[i], 'threads': self.threads[i]})
+        return out
+
+def sparkline(values: List[float], width: int = 30) -> str:
+    """Render values as a one-line unicode chart (downsampled to `width` buckets by max)."""
+    if not values:
+        return ""
+    if len(values) > width:
+        step = len(values) / width
+        values = [max(values[int(k * step):int((k + 1) * step)] or [0]) for k in range(width)]
+    top = max(values) or 1
+    return "".join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int(v / top * (len(SPARK_CHARS) - 1)))] for v in values)
+
+class ResourceSampler:
+    def __init__(self):
+        self.running = False
+        self.interval = Config.RESOURCE_SAMPLE_INTERVAL
+        self.ring_size = Config.RESOURCE_RING_SIZE
+        self.rings: Dict[int, MetricRing] = {}
+        # Guards rings: written by the sampling thread, read by the admin views on the event loop
+        self._lock = threading.Lock()
+        # psutil.Process objects are kept between passes: cpu_percent() measures since the previous call
+        self._procs: Dict[int, psutil.Process] = {}
+        # Running hourly aggregates, flushed to bot_metrics_hourly when the hour rolls over
+        self._hourly: Dict[int, Dict[str, Any]] = {}
+
+    async def start_sampling(self):
+        """Start the sampling loop"""
+        self.running = True
+        logger.log_system_event("Resource sampler started")
+        while self.running:
+            try:
+                rows = await asyncio.to_thread(self.sample_once, self._targets())
+                if rows:
+                    await db.add_bot_metrics_hourly(rows)
+                    await db.prune_bot_metrics_hourly(Config.METRICS_RETENTION_DAYS)
+            except Exception as e:
+                logger.error(f"Error in resource sampler: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop_sampling(self):
+        """Stop the sampling loop and persist the current partial hour"""
+        self.running = False
+        rows = [self._rollup_row(bot_id, acc) for bot_id, acc in self._hourly.items() if acc['samples']]
+        self._hourly.clear()
+        if rows:
+            await db.add_bot_metrics_hourly(rows)
+        logger.log_system_event("Resource sampler stopped")
+
+    def _targets(self) -> Dict[int, int]:
+        """bot_id -> pid of the bots running in a process of their own (taken on the event loop)"""
+        # Bots inside a shared host process are skipped: per-bot usage is not separable
+        return {bot_id: info['process'].pid for bot_id, info in bot_manager.running_bots.items()
+                if info.get('shared') is None}
+
+    def sample_once(self, targets: Dict[int, int]) -> List[tuple]:
+        """(Sync) One psutil pass over the given bot processes (see _targets).
+        Returns hourly rollup rows that became complete during this pass.
+        """
+        now = time.time()
+        hour = int(now // 3600) * 3600
+        finished = []
+        live = set()
+        for bot_id, pid in targets.items():
+            proc = self._procs.get(bot_id)
+            try:
+                if proc is None or proc.pid != pid:
+                    proc = psutil.Process(pid)
+                    self._procs[bot_id] = proc
+                with proc.oneshot():
+                    cpu = proc.cpu_percent(None)
+                    rss = proc.memory_info().rss
+                    fds = proc.num_fds()
+                    threads = proc.num_threads()
+            except psutil.Error:
+                self._procs.pop(bot_id, None)
+                continue
+            live.add(bot_id)
+            with self._lock:
+                ring = self.rings.get(bot_id)
+                if ring is None:
+                    ring = self.rings[bot_id] = MetricRing(self.ring_size)
+                ring.append(now, cpu, rss, fds, threads)
+
+            acc = self._hourly.get(bot_id)
+            if acc is not None and acc['hour'] != hour:
+                finished.append(self._rollup_row(bot_id, acc))
+                acc = None
+            if acc is None:
+                acc = self._hourly[bot_id] = {'hour': hour, 'samples': 0, 'cpu_sum': 0.0, 'cpu_max': 0.0,
+                                              'rss_sum': 0, 'rss_max': 0, 'fds_max': 0}
+            acc['samples'] += 1
+            acc['cpu_sum'] += cpu
+            acc['cpu_max'] = max(acc['cpu_max'], cpu)
+            acc['rss_sum'] += rss
+            acc['rss_max'] = max(acc['rss_max'], rss)
+            acc['fds_max'] = max(acc['fds_max'], fds)
+
+        # Forget stopped bots: their process handles now, their history once it has aged out of the ring
+        for bot_id in list(self._procs):
+            if bot_id not in live:
+                del self._procs[bot_id]
+        for bot_id in list(self._hourly):
+            if bot_id not in live:
+                finished.append(self._rollup_row(bot_id, self._hourly.pop(bot_id)))
+        horizon = now - self.ring_size * self.interval
+        with self._lock:
+            for bot_id in list(self.rings):
+                latest = self.rings[bot_id].latest()
+                if bot_id not in live and (latest is None or latest['ts'] < horizon):
+                    del self.rings[bot_id]
+        return finished
+
+    def _rollup_row(self, bot_id: int, acc: Dict[str, Any]) -> tuple:
+        n = acc['samples'] or 1
+        return (bot_id, acc['hour'], acc['samples'], acc['cpu_sum'] / n, acc['cpu_max'],
+                acc['rss_sum'] // n, acc['rss_max'], acc['fds_max'])
+
+    def top(self, n: int = 10, key: str = 'rss') -> List[Dict[str, Any]]:
+        """Bots with the highest latest `key` ('rss', 'cpu' or 'fds')."""
+        rows = []
+        with self._lock:
+            latest_by_bot = [(bot_id, ring.latest()) for bot_id, ring in self.rings.items()]
+        for bot_id, latest in latest_by_bot:
+            if latest and bot_id in bot_manager.running_bots:
+                rows.append(dict(latest, bot_id=bot_id))
+        rows.sort(key=lambda r: r[key], reverse=True)
+        return rows[:n]
+
+    def history(self, bot_id: int, seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Recent in-memory samples of a bot (the whole ring when seconds is None)."""
+        with self._lock:
+            ring = self.rings.get(bot_id)
+            if ring is None:
+                return []
+            return ring.samples(time.time() - seconds if seconds else 0.0)
+
+# Global resource sampler instance
+resource_sampler = ResourceSampler()
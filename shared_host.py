@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Shared runtime host for template bots.
+
+Runs many template-generated bots (see BotManager.create_bot_template) as separate
+python-telegram-bot Application instances inside one interpreter. BotManager starts
+this script as its own process and controls it over a Unix socket with one JSON
+object per line:
+
+    {"op": "ping"}
+    {"op": "start", "bot_id": 1, "token": "...", "bot_dir": "/path/to/bot_1"}
+    {"op": "stop", "bot_id": 1}
+    {"op": "restart", "bot_id": 1, "token": "...", "bot_dir": "/path/to/bot_1"}
+    {"op": "list"}
+
+Every request gets a single JSON line back: {"ok": true, ...} or {"ok": false, "error": "..."}.
+Only the standard library and the template's own dependencies are imported here.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict, Any
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger("shared_host")
+
+class SharedHost:
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.bots: Dict[int, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+        self._stopped = asyncio.Event()
+
+    def _load_bot_instance(self, bot_id: int, token: str, bot_dir: str):
+        """Import the bot's bot.py under a per-bot module name and build its BotInstance."""
+        spec = importlib.util.spec_from_file_location(f"tenant_bot_{bot_id}", os.path.join(bot_dir, "bot.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.BotInstance(token)
+
+    async def start_bot(self, bot_id: int, token: str, bot_dir: str) -> Dict[str, Any]:
+        if bot_id in self.bots:
+            return {'ok': True, 'already_running': True}
+        instance = self._load_bot_instance(bot_id, token, bot_dir)
+        app = instance.application
+        # What Application.run_polling does, minus owning the event loop
+        await app.initialize()
+        try:
+            await app.updater.start_polling()
+            await app.start()
+        except Exception:
+            await app.shutdown()
+            raise
+        self.bots[bot_id] = {'instance': instance, 'bot_dir': bot_dir, 'started_at': time.time()}
+        logger.info(f"Bot {bot_id} started")
+        return {'ok': True}
+
+    async def stop_bot(self, bot_id: int) -> Dict[str, Any]:
+        entry = self.bots.pop(bot_id, None)
+        if entry is None:
+            return {'ok': True, 'not_running': True}
+        app = entry['instance'].application
+        try:
+            if app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+            await app.shutdown()
+        finally:
+            sys.modules.pop(f"tenant_bot_{bot_id}", None)
+        logger.info(f"Bot {bot_id} stopped")
+        return {'ok': True}
+
+    async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'bots': len(self.bots)}
+        if op == 'list':
+            return {'ok': True, 'bots': {str(bot_id): entry['started_at'] for bot_id, entry in self.bots.items()}}
+        bot_id = int(request['bot_id'])
+        # One lifecycle operation at a time keeps start/stop of the same bot from interleaving
+        async with self._lock:
+            if op == 'start':
+                return await self.start_bot(bot_id, request['token'], request['bot_dir'])
+            if op == 'stop':
+                return await self.stop_bot(bot_id)
+            if op == 'restart':
+                await self.stop_bot(bot_id)
+                return await self.start_bot(bot_id, request['token'], request['bot_dir'])
+        return {'ok': False, 'error': f"unknown op {op!r}"}
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.handle_request(json.loads(line))
+                except Exception as e:
+                    logger.error(f"Request failed: {e}")
+                    response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopped.set)
+        logger.info(f"Shared host listening on {self.socket_path}")
+        async with server:
+            await self._stopped.wait()
+        for bot_id in list(self.bots):
+            try:
+                await self.stop_bot(bot_id)
+            except Exception as e:
+                logger.error(f"Error stopping bot {bot_id}: {e}")
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shared runtime host for template bots")
+    parser.add_argument('--socket', required=True, help="Unix socket path to listen on")
+    args = parser.parse_args()
+    asyncio.run(SharedHost(args.socket).serve())
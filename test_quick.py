@@ -5,6 +5,11 @@ Quick test script for Telegram Bot Manager System
 
 import sys
 import os
+import asyncio
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 # Add current directory to Python path
@@ -56,6 +61,20 @@ def test_imports():
         print(f"❌ Monitor import failed: {e}")
         return False
     
+    try:
+        from resource_sampler import resource_sampler
+        print("✅ Resource sampler module imported successfully")
+    except Exception as e:
+        print(f"❌ Resource sampler import failed: {e}")
+        return False
+    
+    try:
+        from crash_detector import crash_detector
+        print("✅ Crash detector module imported successfully")
+    except Exception as e:
+        print(f"❌ Crash detector import failed: {e}")
+        return False
+    
     return True
 
 def test_config():
@@ -126,6 +145,639 @@ def test_main_bot():
         print(f"❌ MainBot test failed: {e}")
         return False
 
+@contextmanager
+def sandbox(**overrides):
+    """Temporary deployment directory and database with Config overrides.
+    Yields (tmp_dir, manager): a fresh BotManager that the job queue, disk GC and crash detector use meanwhile
+    (asyncio locks belong to the loop they were created on, so every test gets its own).
+    """
+    import bot_manager as bot_manager_module
+    import crash_detector
+    import disk_gc
+    import job_queue
+    from config import Config
+    from database import db
+    from trash_bin import trash_bin, TRASH_DIR
+    from webhook_ingress import webhook_ingress
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = dict(BOT_DEPLOYMENT_DIR=os.path.join(tmp, 'deploy'), BOT_MIRROR_DIR=os.path.join(tmp, 'mirror.git'),
+                        BOT_REPO_URL='', BOT_SPAWN_SETTLE_SECONDS=0, WARM_POOL_SIZE=0, SNAPSHOTS_ENABLED=False,
+                        ADMISSION_ENABLED=False, LOG_COLLECTOR_ENABLED=False, SHARED_HOST_ENABLED=False,
+                        BOT_ZYGOTE_ENABLED=False, WEBHOOK_INGRESS_ENABLED=False)
+        settings.update(overrides)
+        saved_config = {name: getattr(Config, name) for name in settings}
+        saved_db_path, saved_trash_dir = db.db_path, trash_bin.trash_dir
+        saved_wake_callback = webhook_ingress.wake_callback
+        modules = (bot_manager_module, crash_detector, disk_gc, job_queue)
+        saved_managers = [module.bot_manager for module in modules]
+        for name, value in settings.items():
+            setattr(Config, name, value)
+        db.db_path = os.path.join(tmp, 'test.db')
+        trash_bin.trash_dir = os.path.join(Config.BOT_DEPLOYMENT_DIR, TRASH_DIR)
+        manager = bot_manager_module.BotManager()
+        for module in modules:
+            module.bot_manager = manager
+        try:
+            yield tmp, manager
+        finally:
+            for module, saved in zip(modules, saved_managers):
+                module.bot_manager = saved
+            webhook_ingress.wake_callback = saved_wake_callback
+            db.db_path, trash_bin.trash_dir = saved_db_path, saved_trash_dir
+            for name, value in saved_config.items():
+                setattr(Config, name, value)
+
+async def add_test_bots(*bots):
+    """Insert (bot_id, plan_type or None) rows for a test database; plans get an active 5-day subscription"""
+    import aiosqlite
+    from database import db
+
+    await db.init_db()
+    async with aiosqlite.connect(db.db_path) as conn:
+        await conn.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (1, 'tester')")
+        for bot_id, plan in bots:
+            await conn.execute("INSERT INTO bots (id, owner_id, bot_token, bot_username, status) VALUES (?, 1, ?, ?, 'active')",
+                               (bot_id, f"{bot_id}:test", f"test_{bot_id}_bot"))
+        await conn.commit()
+    for bot_id, plan in bots:
+        if plan:
+            await db.add_subscription(bot_id, plan, 5)
+
+def make_test_repo(path: str, code: str = "import time\nprint('up', flush=True)\ntime.sleep(60)\n") -> str:
+    """A local git repository whose bot runs `code`, by default printing a line and sleeping (no requirements to install)"""
+    os.makedirs(path)
+    with open(os.path.join(path, 'main.py'), 'w') as f:
+        f.write(code)
+    for args in (['init', '-q'], ['add', 'main.py'],
+                 ['-c', 'user.email=test@example.com', '-c', 'user.name=test', 'commit', '-qm', 'bot']):
+        subprocess.run(['git', *args], cwd=path, check=True)
+    return path
+
+def run_checks(scenario, checks, test_repo: bool = False, **overrides) -> bool:
+    """Run scenario(tmp, manager) in a sandbox with the Config overrides and assert its checks.
+    checks are (label, result key) pairs, or (label, (keys...)) when all keys must hold. With test_repo
+    the bots are deployed from a fresh make_test_repo. A coroutine returned by the scenario is run.
+    """
+    with sandbox(**overrides) as (tmp, manager):
+        if test_repo:
+            from config import Config
+            Config.BOT_REPO_URL = manager.repo_url = make_test_repo(os.path.join(tmp, 'repo'))
+        result = scenario(tmp, manager)
+        if asyncio.iscoroutine(result):
+            result = asyncio.run(result)
+
+    outcomes = [(label, all(result.get(key) for key in ((keys,) if isinstance(keys, str) else keys)))
+                for label, keys in checks]
+    for label, ok in outcomes:
+        print(f"{'✅' if ok else '❌'} {label}")
+    assert all(ok for _, ok in outcomes), result
+    return True
+
+async def _deploy_timings(tmp, manager) -> dict:
+    from config import Config
+    from database import db
+
+    await add_test_bots((1, None), (2, None))
+    await manager.setup_deployment_directory()
+    await manager.sync_mirror()
+    try:
+        started = time.perf_counter()
+        cold_ok = await manager.deploy_bot(1, "1:test")
+        cold = time.perf_counter() - started
+
+        Config.WARM_POOL_SIZE = 1
+        await manager.refill_warm_pool()
+        started = time.perf_counter()
+        warm_ok = await manager.deploy_bot(2, "2:test")
+        warm = time.perf_counter() - started
+        # The claim started a background refill of the slot
+        await manager._warm_refill_task
+        runs = await db.get_deploy_runs(bot_id=2)
+        print(f"   cold deploy {cold:.2f}s, warm deploy {warm:.2f}s")
+        return {'deployed': cold_ok and warm_ok, 'warm_faster': warm < cold,
+                'claimed': bool(runs) and [stage['stage'] for stage in runs[0]['stages']][:1] == ['claim'],
+                'refilled': len(manager._warm_slots()) == 1}
+    finally:
+        for bot_id in list(manager.running_bots):
+            await manager.stop_bot(bot_id)
+
+def test_warm_pool_claim():
+    """Test that a first deploy claiming a warm pool slot is faster than a cold clone + venv build"""
+    print("\n🔥 Testing warm pool deploys...")
+    return run_checks(_deploy_timings, [
+        ("Both deploys succeeded", 'deployed'),
+        ("Second deploy claimed a slot", 'claimed'),
+        ("Warm deploy faster than cold deploy", 'warm_faster'),
+        ("Claimed slot was refilled", 'refilled'),
+    ], test_repo=True)
+
+async def _supervisor_scenario(tmp, manager) -> dict:
+    from config import Config
+    from database import db
+
+    await add_test_bots((1, '1_month'))
+    await manager.setup_deployment_directory()
+    # The bot exits shortly after every start
+    Config.BOT_REPO_URL = manager.repo_url = make_test_repo(os.path.join(tmp, 'crashing'),
+                                                           "import time\ntime.sleep(0.3)\nraise SystemExit(3)\n")
+    result = {}
+    try:
+        result['deployed'] = await manager.deploy_bot(1, "1:test")
+        for _ in range(200):
+            bot = await db.get_bot(1)
+            if bot['status'] == Config.BOT_STATUS_QUARANTINED:
+                break
+            await asyncio.sleep(0.1)
+        result['quarantined'] = bot['status'] == Config.BOT_STATUS_QUARANTINED
+        result['restarted_until_limit'] = bot['restart_count'] == Config.CRASH_LOOP_MAX_RESTARTS
+        result['exit_recorded'] = bot['last_exit_code'] == 3
+
+        # Several backoff periods later nothing has brought it back
+        await asyncio.sleep(Config.SUPERVISOR_BACKOFF_MAX * 5)
+        bot = await db.get_bot(1)
+        result['stays_down'] = 1 not in manager.running_bots and bot['status'] == Config.BOT_STATUS_QUARANTINED and \
+            bot['restart_count'] == Config.CRASH_LOOP_MAX_RESTARTS
+    finally:
+        for bot_id in list(manager.running_bots):
+            await manager.stop_bot(bot_id)
+    return result
+
+def test_supervisor_quarantine():
+    """Test that a bot exiting CRASH_LOOP_MAX_RESTARTS + 1 times within the window is quarantined, not restarted"""
+    print("\n🚑 Testing supervisor crash-loop quarantine...")
+    return run_checks(_supervisor_scenario, [
+        ("Crashing bot deployed", 'deployed'),
+        ("Restarted up to CRASH_LOOP_MAX_RESTARTS", 'restarted_until_limit'),
+        ("Exit code recorded", 'exit_recorded'),
+        ("Quarantined after one more exit in the window", 'quarantined'),
+        ("No restart scheduled after the quarantine", 'stays_down'),
+    ], CRASH_LOOP_MAX_RESTARTS=2, CRASH_LOOP_WINDOW=60, SUPERVISOR_BACKOFF_BASE=0.1, SUPERVISOR_BACKOFF_MAX=0.2)
+
+async def _reconcile_scenario(tmp, manager) -> dict:
+    import psutil
+    from config import Config
+    from database import db
+
+    await add_test_bots((1, None), (2, None), (3, None))
+    processes = {}
+    for bot_id in (1, 2, 3):
+        bot_dir = os.path.join(Config.BOT_DEPLOYMENT_DIR, f"bot_{bot_id}")
+        os.makedirs(bot_dir)
+        with open(os.path.join(bot_dir, 'main.py'), 'w') as f:
+            f.write("import time\ntime.sleep(60)\n")
+        # What a previous manager left behind: a running bot and its recorded pid and create_time
+        processes[bot_id] = subprocess.Popen([sys.executable, 'main.py'], cwd=bot_dir, start_new_session=True)
+        started_at = psutil.Process(processes[bot_id].pid).create_time()
+        if bot_id == 2:
+            # The recorded pid now belongs to a process started later (pid reuse)
+            started_at -= 100
+        await db.update_bot_status(bot_id, Config.BOT_STATUS_ACTIVE, processes[bot_id].pid)
+        await db.set_bot_launch_meta(bot_id, started_at, {'entrypoint': 'main.py'})
+    # Bot 3's process is gone by the time the manager comes back
+    processes[3].terminate()
+    processes[3].wait()
+    result = {}
+    try:
+        bots = {bot['id']: bot for bot in await db.get_all_bots()}
+        proc_1, proc_2 = psutil.Process(processes[1].pid), psutil.Process(processes[2].pid)
+        result['identity_checked'] = manager._is_bot_process(proc_1, bots[1]) and \
+            not manager._is_bot_process(proc_2, bots[2]) and manager._is_bot_process(proc_2)
+
+        summary = await manager.reconcile_processes()
+        result['adopted'] = summary['adopted'] == [1] and manager.running_bots[1]['process'].pid == processes[1].pid
+        result['reused_pid_not_adopted'] = 2 not in manager.running_bots and 2 in summary['stale'] and \
+            processes[2].pid in summary['reaped'] and processes[2].poll() is not None
+        bot = await db.get_bot(3)
+        result['dead_pid_reset'] = 3 in summary['stale'] and not bot['process_id'] and \
+            bot['status'] == Config.BOT_STATUS_INACTIVE
+    finally:
+        for bot_id in list(manager.running_bots):
+            await manager.stop_bot(bot_id)
+        for process in processes.values():
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    return result
+
+def test_process_reconciliation():
+    """Test re-adopting surviving bot processes by pid and create_time after a manager restart"""
+    print("\n🔎 Testing process reconciliation...")
+    return run_checks(_reconcile_scenario, [
+        ("Recorded create_time tells a bot from a reused pid", 'identity_checked'),
+        ("Matching pid and create_time adopted", 'adopted'),
+        ("Reused pid with another create_time not adopted", 'reused_pid_not_adopted'),
+        ("Dead pid cleared and bot marked inactive", 'dead_pid_reset'),
+    ])
+
+async def _stop_scenario(tmp, manager) -> dict:
+    import signal
+    from config import Config
+
+    await add_test_bots((1, None), (2, None))
+    await manager.setup_deployment_directory()
+    Config.BOT_REPO_URL = manager.repo_url = make_test_repo(
+        os.path.join(tmp, 'stubborn'), "import signal, time\nsignal.signal(signal.SIGTERM, signal.SIG_IGN)\ntime.sleep(60)\n")
+    loop = asyncio.get_running_loop()
+    result = {}
+    try:
+        result['deployed'] = await manager.deploy_bot(1, "1:test") and await manager.deploy_bot(2, "2:test")
+        processes = [manager.running_bots[bot_id]['process'] for bot_id in (1, 2)]
+
+        # The loop keeps ticking while both bots sit out their termination grace period
+        gaps = []
+        async def tick():
+            while True:
+                before = loop.time()
+                await asyncio.sleep(0.05)
+                gaps.append(loop.time() - before)
+        ticker = asyncio.create_task(tick())
+        started = loop.time()
+        stopped = await manager.stop_many([1, 2])
+        elapsed = loop.time() - started
+        ticker.cancel()
+
+        print(f"   stop_many {elapsed:.1f}s, longest loop stall {max(gaps) * 1000:.0f}ms")
+        result['stopped'] = stopped == {1: True, 2: True} and not manager.running_bots
+        result['killed'] = all(process.poll() == -signal.SIGKILL for process in processes)
+        result['one_grace_period'] = 10 <= elapsed < 15
+        result['loop_responsive'] = max(gaps) < 0.5
+    finally:
+        for bot_id in list(manager.running_bots):
+            await manager.stop_bot(bot_id)
+    return result
+
+def test_stop_unresponsive():
+    """Test that bots ignoring SIGTERM are killed after one shared grace period without blocking the loop"""
+    print("\n🛑 Testing stop of bots that ignore SIGTERM...")
+    # The settle time lets the bots install their SIGTERM handler before they are stopped
+    return run_checks(_stop_scenario, [
+        ("Both bots deployed", 'deployed'),
+        ("stop_many reported both stopped", 'stopped'),
+        ("SIGTERM-ignoring bots killed with SIGKILL", 'killed'),
+        ("Batch took one grace period, not one per bot", 'one_grace_period'),
+        ("Event loop not blocked while waiting", 'loop_responsive'),
+    ], BOT_SPAWN_SETTLE_SECONDS=1)
+
+async def _job_queue_scenario(tmp, manager) -> dict:
+    from config import Config
+    from database import db
+    from job_queue import JobQueue
+
+    await add_test_bots((1, None), (2, None))
+    await manager.setup_deployment_directory()
+    queue = JobQueue()
+    result = {}
+    try:
+        first = await queue.submit(1, 'deploy')
+        result['deduplicated'] = await queue.submit(1, 'deploy') == first
+
+        # A manager that died while cloning: the job is left running with a half-written directory
+        await db.claim_next_job([])
+        await db.set_job_stage(first, 'clone')
+        partial = os.path.join(Config.BOT_DEPLOYMENT_DIR, 'bot_1', 'partial')
+        os.makedirs(os.path.dirname(partial))
+        open(partial, 'w').close()
+        await queue.start()
+        job = await queue.wait(first, 120)
+        result['resumed'] = bool(job and job['status'] == 'done' and job['attempts'] == 2)
+        result['running'] = await manager.is_bot_running(1)
+        result['partial_discarded'] = not os.path.exists(partial)
+
+        # No room on the host: the deploy stays queued without using up an attempt or touching the disk
+        Config.ADMISSION_ENABLED = True
+        manager.host_headroom = lambda: {'memory': 0, 'load_per_cpu': 0.0}
+        result['refused'] = not await queue.submit_and_wait(2, 'deploy', timeout=30)
+        pending = await db.get_pending_job(2)
+        result['postponed'] = bool(pending and pending['status'] == 'queued' and pending['attempts'] == 0
+                                   and (pending['error'] or '').startswith('capacity:'))
+        result['nothing_built'] = not os.path.exists(os.path.join(Config.BOT_DEPLOYMENT_DIR, 'bot_2'))
+    finally:
+        await queue.stop()
+        for bot_id in list(manager.running_bots):
+            await manager.stop_bot(bot_id)
+    return result
+
+def test_job_queue():
+    """Test job deduplication, resuming an interrupted deploy and postponing a deploy without capacity"""
+    print("\n📋 Testing job queue...")
+    return run_checks(_job_queue_scenario, [
+        ("Second submission joined the queued job", 'deduplicated'),
+        ("Interrupted deploy resumed on start", ('resumed', 'running')),
+        ("Half-cloned directory discarded before the retry", 'partial_discarded'),
+        ("Deploy without capacity refused", 'refused'),
+        ("Refused deploy stays queued without using an attempt", 'postponed'),
+        ("Refused deploy built nothing", 'nothing_built'),
+    ], test_repo=True, ADMISSION_RETRY_DELAY=3600, ADMISSION_QUEUE_TIMEOUT=3600, JOB_WORKERS=1)
+
+async def _coalescing_scenario(tmp, manager) -> dict:
+    from config import Config
+    from database import db
+
+    await add_test_bots((1, '1_month'))
+    await manager.setup_deployment_directory()
+    result = {}
+    try:
+        deploys = await asyncio.gather(*(manager.deploy_bot(1, "1:test") for _ in range(5)))
+        runs = await db.get_deploy_runs(bot_id=1)
+        result['deploys_joined'] = all(deploys) and len(runs) == 1
+        pid = manager.running_bots[1]['process'].pid
+        result['deploy_while_running'] = await manager.deploy_bot(1, "1:test") and \
+            manager.running_bots[1]['process'].pid == pid
+
+        result['cooldown'] = await manager.restart_bot(1, 'fast') and manager.running_bots[1]['process'].pid == pid
+        summary = await manager.restart_all_bots()
+        result['restart_all_cooldown'] = [entry['id'] for entry in summary['skipped_cooldown']] == [1] and \
+            not summary['restarted'] and manager.running_bots[1]['process'].pid == pid
+        await asyncio.sleep(Config.RESTART_COOLDOWN + 0.2)
+        # Fast restarts join an auto restart in flight: it respawns too
+        restarts = await asyncio.gather(*(manager.restart_bot(1, mode) for mode in ('auto', 'fast', 'fast', 'auto')))
+        runs = await db.get_deploy_runs(bot_id=1)
+        result['restarts_joined'] = all(restarts) and [run['kind'] for run in runs].count('restart') == 1
+        result['restarted'] = 1 in manager.running_bots and manager.running_bots[1]['process'].pid != pid
+        result['ops_cleared'] = not manager._bot_ops and not manager._bot_op_owner
+    finally:
+        for bot_id in list(manager.running_bots):
+            await manager.stop_bot(bot_id)
+    return result
+
+def test_operation_coalescing():
+    """Test that concurrent deploys/restarts of a bot join one operation and restarts honour the cooldown"""
+    print("\n🔁 Testing control operation coalescing...")
+    return run_checks(_coalescing_scenario, [
+        ("Five concurrent deploys ran once", 'deploys_joined'),
+        ("Deploy of a running bot left it alone", 'deploy_while_running'),
+        ("Restart within the cooldown skipped", 'cooldown'),
+        ("Restart-all reports the cooldown skip", 'restart_all_cooldown'),
+        ("Concurrent fast and auto restarts ran once", ('restarts_joined', 'restarted')),
+        ("No operation left registered", 'ops_cleared'),
+    ], test_repo=True, RESTART_COOLDOWN=5)
+
+async def _admission_scenario(tmp, manager) -> dict:
+    from config import Config
+    from bot_manager import AdmissionDenied
+
+    await add_test_bots((1, 'demo'), (2, 'demo'), (3, '1_month'), (4, 'demo'))
+    await manager.setup_deployment_directory()
+    result = {}
+    try:
+        result['admitted'] = await manager.deploy_bot(1, "1:test") and await manager.deploy_bot(2, "2:test")
+        result['reservations_released'] = not manager._admission_reserved
+
+        # The host is full from here on
+        manager.host_headroom = lambda: {'memory': 0, 'load_per_cpu': 0.0}
+        try:
+            await manager.deploy_bot(4, "4:test")
+            result['demo_refused'] = False
+        except AdmissionDenied as e:
+            result['demo_refused'] = str(e).startswith('capacity:')
+        result['demo_built_nothing'] = not os.path.exists(os.path.join(Config.BOT_DEPLOYMENT_DIR, 'bot_4'))
+        result['demos_kept'] = sorted(manager.running_bots) == [1, 2]
+
+        result['paid_admitted'] = await manager.deploy_bot(3, "3:test")
+        result['one_demo_preempted'] = 3 in manager.running_bots and len(set(manager.running_bots) & {1, 2}) == 1
+        result['preempting_cleared'] = not manager._preempting
+    finally:
+        for bot_id in list(manager.running_bots):
+            await manager.stop_bot(bot_id)
+    return result
+
+def test_admission_control():
+    """Test that a full host refuses demo deploys and stops a demo bot to make room for a paid one"""
+    print("\n🚦 Testing admission control...")
+    return run_checks(_admission_scenario, [
+        ("Demo bots admitted while there is headroom", 'admitted'),
+        ("Reservations released after the spawns", 'reservations_released'),
+        ("Demo deploy refused on a full host", 'demo_refused'),
+        ("Refused deploy built nothing", 'demo_built_nothing'),
+        ("Running demos kept for a refused demo", 'demos_kept'),
+        ("Paid bot admitted on a full host", 'paid_admitted'),
+        ("Exactly one demo preempted for it", 'one_demo_preempted'),
+        ("Preemption bookkeeping cleared", 'preempting_cleared'),
+    ], test_repo=True, ADMISSION_ENABLED=True, ADMISSION_DEFAULT_BOT_MB=1)
+
+async def _log_budget_scenario(tmp, manager) -> dict:
+    from config import Config
+    from log_collector import LogCollector
+
+    collector = LogCollector()
+    bot_dir = os.path.join(Config.BOT_DEPLOYMENT_DIR, 'bot_1')
+    log_dir = os.path.join(bot_dir, 'logs')
+    result = {}
+    pipes = collector.prepare(1, bot_dir)
+    try:
+        # What a chatty bot would print: incompressible, so segment sizes stay predictable
+        writer = os.open(pipes['stdout'], os.O_WRONLY)
+        last = b""
+        for _ in range(40):
+            last = os.urandom(4096)
+            os.write(writer, last)
+            await asyncio.sleep(0.01)
+        os.close(writer)
+        collector.flush(1)
+        # Compression and pruning run in worker threads
+        for _ in range(100):
+            segments = collector.segments(log_dir, 'stdout')
+            if segments and all(path.endswith('.gz') for path, _ in segments):
+                break
+            await asyncio.sleep(0.05)
+        active = os.path.getsize(os.path.join(log_dir, 'stdout.log'))
+        result['rotated'] = len(segments) >= 1 and active < collector.segment_bytes
+        result['compressed'] = all(path.endswith('.gz') for path, _ in segments)
+        result['bot_budget'] = sum(size for _, size in segments) <= Config.LOG_BOT_RETENTION_MB * 1024 * 1024
+        result['oldest_pruned'] = sum(size for _, size in segments) + active < 40 * 4096
+        with open(os.path.join(log_dir, 'stdout.log'), 'rb') as f:
+            result['latest_kept'] = f.read().endswith(last) or active == 0
+        oldest_bot_1 = segments[0][0] if segments else None
+    finally:
+        collector.stop()
+
+    # A second bot writing its own log file (collector bypassed) pushes all logs over the global cap
+    other_logs = os.path.join(Config.BOT_DEPLOYMENT_DIR, 'bot_2', 'logs')
+    os.makedirs(other_logs)
+    with open(os.path.join(other_logs, 'stderr.log'), 'wb') as f:
+        f.write(os.urandom(30 * 1024))
+    result['file_rotated'] = await asyncio.to_thread(collector.rotate_file, other_logs, 'stderr') and \
+        os.path.getsize(os.path.join(other_logs, 'stderr.log')) == 0
+    result['global_cap'] = collector.disk_usage() <= Config.LOG_TOTAL_CAP_MB * 1024 * 1024
+    result['global_oldest_first'] = bool(collector.segments(other_logs, 'stderr')) and \
+        oldest_bot_1 is not None and not os.path.exists(oldest_bot_1)
+    return result
+
+def test_log_budgets():
+    """Test log rotation, compression and the per-bot and global log budgets"""
+    print("\n📜 Testing log rotation and budgets...")
+    return run_checks(_log_budget_scenario, [
+        ("Active log rotated at LOG_SEGMENT_MB", 'rotated'),
+        ("Rotated segments compressed", 'compressed'),
+        ("Segments within LOG_BOT_RETENTION_MB", 'bot_budget'),
+        ("Oldest output pruned", 'oldest_pruned'),
+        ("Latest output kept", 'latest_kept'),
+        ("Bot-written log rotated and truncated", 'file_rotated'),
+        ("All logs within LOG_TOTAL_CAP_MB", 'global_cap'),
+        ("Global cap pruned the oldest segment first", 'global_oldest_first'),
+    ], LOG_COLLECTOR_ENABLED=True, LOG_SEGMENT_MB=0.01, LOG_BOT_RETENTION_MB=0.03, LOG_TOTAL_CAP_MB=0.05)
+
+def _make_tree(path: str, files: int, size: int = 0):
+    os.makedirs(path)
+    for n in range(files):
+        with open(os.path.join(path, f"f{n}"), 'wb') as f:
+            f.write(os.urandom(size))
+
+def _trash_scenario(tmp, manager) -> dict:
+    from config import Config
+    from trash_bin import TrashBin
+
+    trash = TrashBin()
+    result = {}
+    try:
+        # Left over by a previous manager: emptied once the bin starts
+        _make_tree(os.path.join(trash.trash_dir, 'bot_9.1'), 10)
+        victim = os.path.join(Config.BOT_DEPLOYMENT_DIR, 'bot_1')
+        _make_tree(os.path.join(victim, 'venv'), 1000)
+        outside = os.path.join(tmp, 'outside')
+        _make_tree(outside, 3)
+        os.symlink(outside, os.path.join(victim, 'linked'))
+
+        started = time.perf_counter()
+        discarded = trash.discard(victim) and not os.path.exists(victim)
+        discard_seconds = time.perf_counter() - started
+        result['discarded'] = discarded and discard_seconds < 0.5
+        result['missing'] = trash.discard(victim) is False
+        started = time.perf_counter()
+        while trash.pending() and time.perf_counter() - started < 30:
+            time.sleep(0.05)
+        empty_seconds = time.perf_counter() - started
+        result['emptied'] = trash.pending() == 0
+        result['paced'] = empty_seconds >= 0.3
+        result['symlink_target_kept'] = len(os.listdir(outside)) == 3
+        print(f"   discard {discard_seconds * 1000:.1f}ms, background delete {empty_seconds:.2f}s")
+    finally:
+        trash.stop()
+    return result
+
+def test_trash_bin():
+    """Test that directories are moved to the trash at once and deleted in the background"""
+    print("\n🗑️ Testing trash bin...")
+    return run_checks(_trash_scenario, [
+        ("Directory moved out of the way at once", 'discarded'),
+        ("Discarding a missing path reports False", 'missing'),
+        ("Trash (including leftovers) emptied in the background", 'emptied'),
+        ("Deletion paced to TRASH_DELETE_RATE", 'paced'),
+        ("Symlinked directory target not deleted", 'symlink_target_kept'),
+    ], TRASH_DELETE_RATE=2000)
+
+async def _disk_gc_scenario(tmp, manager) -> dict:
+    from config import Config
+    from database import db
+    from disk_gc import DiskGC
+
+    await add_test_bots((1, None), (2, None))
+    await db.update_bot_status(2, Config.BOT_STATUS_EXPIRED)
+    await db.add_job(4, 'delete', 0)
+    deploy_dir = Config.BOT_DEPLOYMENT_DIR
+    for bot_id in (1, 2, 3, 4):
+        _make_tree(os.path.join(deploy_dir, f"bot_{bot_id}", 'venv'), 5, 4096)
+    os.makedirs(os.path.join(deploy_dir, 'bot_1', 'logs'))
+    with open(os.path.join(deploy_dir, 'bot_1', 'logs', 'stderr.log'), 'wb') as f:
+        f.write(os.urandom(32 * 1024))
+    # bot_2 has been off for three days
+    old = time.time() - 3 * 86400
+    os.utime(os.path.join(deploy_dir, 'bot_2'), (old, old))
+
+    gc = DiskGC()
+    first = await gc.run_once()
+    await asyncio.sleep(Config.DISK_GC_ORPHAN_GRACE + 0.1)
+    second = await gc.run_once()
+    return {
+        'grace_respected': first['gc']['orphans_removed'] == [] and first['gc']['orphans_pending'] == 1,
+        'orphan_removed': second['gc']['orphans_removed'] == [3] and not os.path.exists(os.path.join(deploy_dir, 'bot_3')),
+        'busy_kept': os.path.isdir(os.path.join(deploy_dir, 'bot_4', 'venv')),
+        'stale_venv_removed': first['gc']['venvs_removed'] == [2] and not os.path.exists(os.path.join(deploy_dir, 'bot_2', 'venv')),
+        'active_venv_kept': os.path.isdir(os.path.join(deploy_dir, 'bot_1', 'venv')),
+        'log_rotated': first['gc']['logs_rotated'] == [1] and
+            os.path.getsize(os.path.join(deploy_dir, 'bot_1', 'logs', 'stderr.log')) == 0,
+        'measured': second['bots'][1]['own'] >= 5 * 4096 and 3 not in second['bots'],
+    }
+
+def test_disk_gc():
+    """Test the disk GC grace periods, stale venv removal, log rotation and accounting"""
+    print("\n🧹 Testing disk GC...")
+    return run_checks(_disk_gc_scenario, [
+        ("Orphan kept during DISK_GC_ORPHAN_GRACE", 'grace_respected'),
+        ("Orphan removed after the grace period", 'orphan_removed'),
+        ("Orphan with a job in flight kept", 'busy_kept'),
+        ("Venv of a long-expired bot removed", 'stale_venv_removed'),
+        ("Venv of an active bot kept", 'active_venv_kept'),
+        ("Oversized bot-written log rotated", 'log_rotated'),
+        ("Usage measured per bot", 'measured'),
+    ], DISK_GC_ORPHAN_GRACE=1, DISK_GC_STALE_VENV_DAYS=1, LOG_SEGMENT_MB=0.01)
+
+async def _crash_detector_scenario(tmp, manager) -> dict:
+    from config import Config
+    from database import db
+    from crash_detector import CrashDetector
+    from log_collector import log_collector
+
+    await add_test_bots((1, None), (2, None), (3, None), (4, None))
+    detector = CrashDetector()
+    result = {}
+    try:
+        # A line split over two writes is classified once it is complete; stdout is not scanned
+        detector.feed(1, 'stdout', b"Conflict: terminated by other getUpdates request\n")
+        detector.feed(1, 'stderr', b"telegram.error.Conflict: terminated by other getUp")
+        result['partial_waits'] = detector.counts(1) == {}
+        detector.feed(1, 'stderr', b"dates request; make sure that only one bot instance is running\n")
+        result['conflict'] = detector.counts(1) == {'conflict': 1}
+
+        detector.feed(2, 'stderr', b"telegram.error.NetworkError: httpx.ConnectError\n" * Config.CRASH_DEGRADED_THRESHOLD)
+        result['one_per_line'] = detector.counts(2) == {'network': Config.CRASH_DEGRADED_THRESHOLD}
+
+        detector.feed(3, 'stderr', b"Traceback (most recent call last):\n"
+                                   b"telegram.error.InvalidToken: The token `1:x` was rejected by the server.\n"
+                                   b"Traceback (most recent call last):\n")
+        result['fatal_line_kept'] = detector.last_match[3][0] == 'invalid_token'
+
+        # Bots writing stderr.log themselves are followed from the end of the file
+        bot_dir = os.path.join(Config.BOT_DEPLOYMENT_DIR, 'bot_4')
+        stderr_log = os.path.join(bot_dir, 'logs', 'stderr.log')
+        os.makedirs(os.path.dirname(stderr_log))
+        with open(stderr_log, 'wb') as f:
+            f.write(b"ModuleNotFoundError: No module named 'old'\n")
+        manager.running_bots[4] = {'bot_dir': bot_dir}
+        await detector.follow_files()
+        result['history_skipped'] = detector.counts(4) == {}
+        with open(stderr_log, 'ab') as f:
+            f.write(b"telegram.error.RetryAfter: Flood control exceeded. Retry in 5 seconds\n")
+        await detector.follow_files()
+        result['appended_read'] = detector.counts(4) == {'flood': 1}
+        manager.running_bots.pop(4)
+
+        await detector.flush()
+        states = {bot_id: (await db.get_bot_health(bot_id) or {}).get('state') for bot_id in (1, 2, 3, 4)}
+        result['states'] = states == {1: 'failing', 2: 'degraded', 3: 'failing', 4: 'healthy'}
+
+        await asyncio.sleep(Config.CRASH_SIGNATURE_WINDOW + 0.1)
+        await detector.flush()
+        result['window_expired'] = (await db.get_bot_health(1))['state'] == 'healthy' and not detector.events
+    finally:
+        log_collector.listeners.remove(detector.feed)
+    return result
+
+def test_crash_detector():
+    """Test classification of bot stderr into failure signatures and health states"""
+    print("\n🩺 Testing crash detector...")
+    return run_checks(_crash_detector_scenario, [
+        ("Incomplete line held back, stdout ignored", 'partial_waits'),
+        ("getUpdates conflict classified", 'conflict'),
+        ("Each line counted once", 'one_per_line'),
+        ("Fatal line not hidden by a later traceback", 'fatal_line_kept'),
+        ("Followed file starts at its end", 'history_skipped'),
+        ("Appended output classified", 'appended_read'),
+        ("States stored: failing, degraded, healthy", 'states'),
+        ("Matches expire after CRASH_SIGNATURE_WINDOW", 'window_expired'),
+    ], CRASH_SIGNATURE_WINDOW=1, CRASH_DEGRADED_THRESHOLD=3)
+
 def main():
     """Main test function"""
     print("🧪 Telegram Bot Manager System - Quick Test")
@@ -135,6 +787,17 @@ def main():
         ("Imports", test_imports),
         ("Configuration", test_config),
         ("MainBot", test_main_bot),
+        ("Warm Pool", test_warm_pool_claim),
+        ("Supervisor Quarantine", test_supervisor_quarantine),
+        ("Process Reconciliation", test_process_reconciliation),
+        ("Stop Unresponsive Bots", test_stop_unresponsive),
+        ("Job Queue", test_job_queue),
+        ("Operation Coalescing", test_operation_coalescing),
+        ("Admission Control", test_admission_control),
+        ("Log Budgets", test_log_budgets),
+        ("Trash Bin", test_trash_bin),
+        ("Disk GC", test_disk_gc),
+        ("Crash Detector", test_crash_detector),
     ]
     
     passed = 0
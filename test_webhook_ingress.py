@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+End-to-end test of the webhook ingress against a local fake Bot API server.
+The generated template bot is started for real and receives its update through the ingress.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Add current directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+BOT_ID = 7
+BOT_TOKEN = "123:fake"
+
+START_UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1, 'date': 0, 'text': '/start',
+        'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'u'},
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+    }
+}
+
+class FakeBotApi:
+    """Minimal Bot API: answers every method with ok and records which methods were called."""
+    def __init__(self):
+        self.calls = []
+        self.server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        request_line = await reader.readline()
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        await reader.readexactly(int(headers.get('content-length') or 0))
+        method = request_line.split()[1].decode().rsplit('/', 1)[-1]
+        self.calls.append(method)
+        results = {
+            'getMe': {'id': BOT_ID, 'is_bot': True, 'first_name': 'b', 'username': 'fake_bot'},
+            'sendMessage': {'message_id': 2, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': 'x'},
+        }
+        body = json.dumps({'ok': True, 'result': results.get(method, True)}).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+        await writer.drain()
+        writer.close()
+
+async def _run_webhook_roundtrip(deploy_dir: str) -> dict:
+    import httpx
+    from config import Config
+    from bot_manager import bot_manager
+    from webhook_ingress import WebhookIngress
+
+    api = FakeBotApi()
+    await api.start()
+    saved = (Config.WEBHOOK_SECRET_KEY, Config.TELEGRAM_API_BASE_URL, Config.BOT_DEPLOYMENT_DIR,
+             Config.WEBHOOK_LISTEN_PORT, Config.WEBHOOK_PUBLIC_URL)
+    Config.WEBHOOK_SECRET_KEY = "test-key"
+    Config.TELEGRAM_API_BASE_URL = api.base_url
+    Config.BOT_DEPLOYMENT_DIR = deploy_dir
+    Config.WEBHOOK_LISTEN_PORT = 0
+    Config.WEBHOOK_PUBLIC_URL = "https://example.test"
+    ingress = WebhookIngress()
+    process = None
+    result = {}
+    try:
+        await ingress.start()
+        port = ingress.server.sockets[0].getsockname()[1]
+        bot_dir = os.path.join(deploy_dir, f"bot_{BOT_ID}")
+        await bot_manager.create_bot_template(bot_dir)
+        os.makedirs(os.path.join(bot_dir, 'run'), exist_ok=True)
+        result['registered'] = await ingress.register(BOT_ID, BOT_TOKEN)
+
+        env = dict(os.environ, BOT_TOKEN=BOT_TOKEN, BOT_UPDATE_SOCKET=ingress.update_socket(BOT_ID),
+                   BOT_API_BASE_URL=f"{api.base_url}/bot")
+        process = subprocess.Popen([sys.executable, 'bot.py'], cwd=bot_dir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        secret = ingress.secret_for(BOT_ID)
+        url = f"http://127.0.0.1:{port}/tg/{BOT_ID}/{secret}"
+        async with httpx.AsyncClient(timeout=15) as client:
+            # 503 until the bot serves its update socket
+            for _ in range(60):
+                response = await client.post(url, json=START_UPDATE,
+                                             headers={'X-Telegram-Bot-Api-Secret-Token': secret})
+                if response.status_code != 503:
+                    break
+                await asyncio.sleep(0.25)
+            result['with_header'] = response.status_code
+            result['without_header'] = (await client.post(url, json=START_UPDATE)).status_code
+            result['bad_secret'] = (await client.post(f"http://127.0.0.1:{port}/tg/{BOT_ID}/bad",
+                                                      json=START_UPDATE)).status_code
+        for _ in range(40):
+            if 'sendMessage' in api.calls:
+                break
+            await asyncio.sleep(0.25)
+        result['calls'] = list(api.calls)
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        await ingress.stop()
+        await api.stop()
+        (Config.WEBHOOK_SECRET_KEY, Config.TELEGRAM_API_BASE_URL, Config.BOT_DEPLOYMENT_DIR,
+         Config.WEBHOOK_LISTEN_PORT, Config.WEBHOOK_PUBLIC_URL) = saved
+    return result
+
+def test_webhook_roundtrip():
+    """Test setWebhook, secret checks and delivery of an update to a template bot"""
+    print("\n🔗 Testing webhook ingress against a fake Bot API...")
+
+    with tempfile.TemporaryDirectory() as deploy_dir:
+        result = asyncio.run(_run_webhook_roundtrip(deploy_dir))
+
+    checks = [
+        ("setWebhook accepted", result.get('registered') is True and 'setWebhook' in result.get('calls', [])),
+        ("Update with secret header delivered (200)", result.get('with_header') == 200),
+        ("Update without secret header refused (403)", result.get('without_header') == 403),
+        ("Update to a wrong secret path refused (404)", result.get('bad_secret') == 404),
+        ("Bot answered /start through the Bot API", 'sendMessage' in result.get('calls', [])),
+    ]
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+    assert all(ok for _, ok in checks), result
+    return True
+
+def main():
+    """Run the webhook ingress tests"""
+    print("🧪 Webhook Ingress Test")
+    print("=" * 50)
+
+    tests = [
+        ("Webhook Roundtrip", test_webhook_roundtrip),
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test_name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+            else:
+                print(f"❌ {test_name} test failed")
+        except Exception as e:
+            print(f"❌ {test_name} test failed with exception: {e}")
+
+    print("\n" + "=" * 50)
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+    return 0 if passed == total else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
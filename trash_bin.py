@@ -0,0 +1,125 @@
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+from config import Config
+from logger import logger
+
+# Trash entries live under <deployment_dir>/.trash (same filesystem as bot directories, so moving there is a rename)
+TRASH_DIR = ".trash"
+# Files unlinked between two checks of the rate limit
+DELETE_BATCH = 200
+
+class TrashBin:
+    """Removes directory trees without blocking the caller.
+
+    discard() renames a path into the trash area, which is atomic and instant however many
+    files the tree holds (a bot directory with its venv is tens of thousands). A background
+    thread then deletes trash entries one file at a time, paced to TRASH_DELETE_RATE files per
+    second so a large delete does not starve running bots of disk I/O. Entries left over by a
+    previous manager are picked up again on start.
+    """
+    def __init__(self):
+        self.trash_dir = os.path.join(Config.BOT_DEPLOYMENT_DIR, TRASH_DIR)
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the deleting thread (also called on the first discard)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="trash-bin", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        """Stop the deleting thread; what is left in the trash is deleted after the next start"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def discard(self, path: str) -> bool:
+        """Move a file or directory tree to the trash and return immediately. False if it did not exist."""
+        if not os.path.lexists(path):
+            return False
+        os.makedirs(self.trash_dir, exist_ok=True)
+        target = os.path.join(self.trash_dir, f"{os.path.basename(path.rstrip(os.sep))}.{time.time_ns()}")
+        try:
+            os.rename(path, target)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            # Different filesystem or similar: delete in place (slow, but never leaves the path behind)
+            logger.warning(f"Cannot move {path} to the trash, deleting in place: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return True
+        self.start()
+        return True
+
+    def pending(self) -> int:
+        """Number of trash entries not deleted yet"""
+        try:
+            return len(os.listdir(self.trash_dir))
+        except OSError:
+            return 0
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(timeout=60)
+            self._wakeup.clear()
+            try:
+                names = sorted(os.listdir(self.trash_dir))
+            except OSError:
+                continue
+            for name in names:
+                if self._stopping:
+                    return
+                try:
+                    self._delete(os.path.join(self.trash_dir, name))
+                except Exception as e:
+                    logger.error(f"Error emptying trash entry {name}: {e}")
+
+    def _delete(self, path: str):
+        """Delete one entry bottom-up, pausing between batches to stay under TRASH_DELETE_RATE files per second"""
+        rate = Config.TRASH_DELETE_RATE
+        batch_started = time.monotonic()
+        removed = 0
+
+        def paced_remove(remove, target: str):
+            nonlocal batch_started, removed
+            try:
+                remove(target)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Cannot delete {target}: {e}")
+            removed += 1
+            if rate > 0 and removed % DELETE_BATCH == 0:
+                pause = DELETE_BATCH / rate - (time.monotonic() - batch_started)
+                if pause > 0:
+                    time.sleep(pause)
+                batch_started = time.monotonic()
+
+        if os.path.islink(path) or not os.path.isdir(path):
+            paced_remove(os.unlink, path)
+            return
+        for root, dirs, files in os.walk(path, topdown=False):
+            if self._stopping:
+                return
+            for name in files:
+                paced_remove(os.unlink, os.path.join(root, name))
+            for name in dirs:
+                target = os.path.join(root, name)
+                # Symlinked directories are listed as dirs but removed as files
+                paced_remove(os.unlink if os.path.islink(target) else os.rmdir, target)
+        paced_remove(os.rmdir, path)
+
+# Global trash bin instance
+trash_bin = TrashBin()
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict
+import httpx
+from config import Config
+from logger import logger
+
+# Largest update body accepted (Telegram updates are a few KB)
+MAX_BODY_BYTES = 1024 * 1024
+
+class WebhookIngress:
+    """Single local HTTP server receiving Telegram webhooks for all managed bots.
+
+    Each bot gets the path /tg/<bot_id>/<secret>, where the secret is an HMAC of the bot id,
+    and Telegram also sends it back in X-Telegram-Bot-Api-Secret-Token. Accepted updates are
+    forwarded as one JSON line to the bot process's Unix socket (BOT_UPDATE_SOCKET, at
+    <bot_dir>/run/updates.sock), which answers "ok". Routing needs no in-memory state, so it
+    keeps working for bots re-adopted after a manager restart. TLS is expected to be
+    terminated by a reverse proxy in front of this server.
+    """
+    def __init__(self):
+        self.server = None
+        self.host = Config.WEBHOOK_LISTEN_HOST
+        self.port = Config.WEBHOOK_LISTEN_PORT
+        key = Config.WEBHOOK_SECRET_KEY or Config.MAIN_BOT_TOKEN or ''
+        self._key = key.encode()
+        # bot_id -> time of the last update delivered (activity signal for hibernation)
+        self.last_update: Dict[int, float] = {}
+        # async (bot_id) -> bool; set by BotManager to wake a hibernated bot when its update cannot be delivered
+        self.wake_callback = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(Config.WEBHOOK_INGRESS_ENABLED and Config.WEBHOOK_PUBLIC_URL and self._key)
+
+    def secret_for(self, bot_id: int) -> str:
+        return hmac.new(self._key, f"bot:{bot_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def update_socket(self, bot_id: int) -> str:
+        return os.path.join(Config.BOT_DEPLOYMENT_DIR, f"bot_{bot_id}", 'run', 'updates.sock')
+
+    def webhook_url(self, bot_id: int) -> str:
+        return f"{Config.WEBHOOK_PUBLIC_URL.rstrip('/')}/tg/{bot_id}/{self.secret_for(bot_id)}"
+
+    async def start(self):
+        """Start the HTTP server"""
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.log_system_event("Webhook ingress listening", details=f"{self.host}:{self.port}")
+
+    async def stop(self):
+        """Stop the HTTP server"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            logger.log_system_event("Webhook ingress stopped")
+
+    async def _telegram(self, token: str, method: str, payload: Dict) -> Dict:
+        async with httpx.AsyncClient(timeout=15) as client:
+            response = await client.post(f"{Config.TELEGRAM_API_BASE_URL}/bot{token}/{method}", json=payload)
+            return response.json()
+
+    async def register(self, bot_id: int, token: str) -> bool:
+        """Point the bot's webhook at the ingress. Returns False if Telegram refused (the bot should poll instead)."""
+        try:
+            result = await self._telegram(token, 'setWebhook', {
+                'url': self.webhook_url(bot_id),
+                'secret_token': self.secret_for(bot_id),
+                'max_connections': Config.WEBHOOK_MAX_CONNECTIONS
+            })
+        except (httpx.HTTPError, ValueError) as e:
+            logger.log_bot_event(bot_id, "setWebhook failed", details=str(e))
+            return False
+        if not result.get('ok'):
+            logger.log_bot_event(bot_id, "setWebhook refused", details=str(result.get("description")))
+            return False
+        return True
+
+    async def forward(self, bot_id: int, update: Dict) -> bool:
+        """Hand one update to the bot process. False if it is not reachable (Telegram will retry)."""
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.update_socket(bot_id)), 5)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        try:
+            writer.write(json.dumps(update).encode() + b"\n")
+            await writer.drain()
+            return (await asyncio.wait_for(reader.readline(), 10)).strip() == b"ok"
+        except (OSError, asyncio.TimeoutError):
+            return False
+        finally:
+            writer.close()
+
+    async def is_ready(self, bot_id: int) -> bool:
+        """True once the bot process accepts connections on its update socket."""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.update_socket(bot_id)), 2)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status = await self._route(request_line.decode('latin-1'), headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, request_line: str, headers: Dict[str, str], body: bytes) -> int:
+        parts = request_line.split()
+        if len(parts) < 2 or parts[0] != 'POST':
+            return 405
+        segments = parts[1].strip('/').split('/')
+        if len(segments) != 3 or segments[0] != 'tg' or not segments[1].isdigit():
+            return 404
+        bot_id = int(segments[1])
+        secret = self.secret_for(bot_id)
+        if not hmac.compare_digest(segments[2].encode(), secret.encode()):
+            return 404
+        if not hmac.compare_digest(headers.get('x-telegram-bot-api-secret-token', '').encode(), secret.encode()):
+            return 403
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return 400
+        delivered = await self.forward(bot_id, update)
+        if not delivered and self.wake_callback and await self.wake_callback(bot_id):
+            # The bot was hibernated and is up again; deliver this update now instead of on Telegram's retry
+            delivered = await self.forward(bot_id, update)
+        if delivered:
+            self.last_update[bot_id] = time.time()
+            return 200
+        # 503 makes Telegram redeliver the update later instead of dropping it
+        return 503
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, close: bool = False):
+        reasons = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                   405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+        writer.write((f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+                      f"Content-Length: 0\r\n"
+                      f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n").encode())
+        await writer.drain()
+
+# Global webhook ingress instance
+webhook_ingress = WebhookIngress()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Fork-server ("zygote") for bot processes.
+
+Started by BotManager with a bot venv's interpreter. It imports the heavy libraries
+bots use (telegram, httpx, ...) once, then forks a child per bot on request, so a bot
+starts without re-importing them and unchanged pages stay shared copy-on-write.
+BotManager talks to it over a Unix socket, one JSON object per line:
+
+    {"op": "ping"}
+    {"op": "spawn", "entrypoint": "bot.py", "cwd": "/path/to/bot_1", "env": {...},
+     "stdout": "/path/to/bot_1/run/stdout.pipe", "stderr": "/path/to/bot_1/run/stderr.pipe"}
+    {"op": "status", "pid": 1234}
+
+Replies are single JSON lines: {"ok": true, ...} or {"ok": false, "error": "..."}.
+The server is single-threaded on purpose: forking is only safe without other threads.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import runpy
+import signal
+import socket
+import stat
+import sys
+import traceback
+from collections import OrderedDict
+
+# Exit codes of reaped children kept for "status" queries
+MAX_EXIT_CODES = 4096
+
+class Zygote:
+    def __init__(self, socket_path: str, preload: list):
+        self.socket_path = socket_path
+        self.preload = preload
+        self.exit_codes = OrderedDict()  # pid -> exit code (negative signal number when killed)
+        self.children = set()
+        self.listener = None
+
+    def preload_modules(self):
+        for name in self.preload:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                print(f"zygote: could not preload {name}: {e}", file=sys.stderr)
+
+    def _reap(self, signum, frame):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.children.discard(pid)
+            self.exit_codes[pid] = os.waitstatus_to_exitcode(status)
+            while len(self.exit_codes) > MAX_EXIT_CODES:
+                self.exit_codes.popitem(last=False)
+
+    @staticmethod
+    def _open_output(path: str) -> int:
+        # The manager's log collector pipes are opened read-write so writes never fail with EPIPE
+        if os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode):
+            return os.open(path, os.O_RDWR)
+        return os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _run_child(self, request: dict):
+        """Runs in the forked child: become the bot process and never return."""
+        code = 1
+        try:
+            os.setsid()
+            for sig in (signal.SIGCHLD, signal.SIGTERM, signal.SIGINT, signal.SIGPIPE):
+                signal.signal(sig, signal.SIG_DFL)
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            stdout = self._open_output(request['stdout'])
+            stderr = self._open_output(request['stderr'])
+            os.dup2(devnull, 0)
+            os.dup2(stdout, 1)
+            os.dup2(stderr, 2)
+            for fd in (devnull, stdout, stderr):
+                os.close(fd)
+            # Drop every other inherited descriptor (listening socket, the request connection)
+            try:
+                inherited = [int(fd) for fd in os.listdir('/proc/self/fd')]
+            except OSError:
+                inherited = range(3, 1024)
+            for fd in inherited:
+                if fd > 2:
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            entrypoint = os.path.join(request['cwd'], request['entrypoint'])
+            sys.argv = [entrypoint]
+            # Same as `python bot.py`: the script's directory comes first on sys.path
+            sys.path[0] = request['cwd']
+            runpy.run_path(entrypoint, run_name='__main__')
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    def handle_request(self, request: dict) -> dict:
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'children': len(self.children)}
+        if op == 'status':
+            pid = int(request['pid'])
+            if pid in self.exit_codes:
+                return {'ok': True, 'running': False, 'exit_code': self.exit_codes[pid]}
+            return {'ok': True, 'running': pid in self.children, 'exit_code': None}
+        if op == 'spawn':
+            pid = os.fork()
+            if pid == 0:
+                self._run_child(request)
+            self.children.add(pid)
+            return {'ok': True, 'pid': pid}
+        return {'ok': False, 'error': f"unknown op {op!r}"}
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.listener.listen(64)
+        signal.signal(signal.SIGCHLD, self._reap)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        print(f"zygote: listening on {self.socket_path}", flush=True)
+        try:
+            while True:
+                conn, _ = self.listener.accept()
+                with conn:
+                    reader = conn.makefile('rb')
+                    for line in reader:
+                        try:
+                            response = self.handle_request(json.loads(line))
+                        except Exception as e:
+                            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                        conn.sendall(json.dumps(response).encode() + b"\n")
+                    reader.close()
+        finally:
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fork-server for bot processes")
+    parser.add_argument('--socket', required=True, help="Unix socket path to listen on")
+    parser.add_argument('--preload', default="", help="Comma-separated modules to import before forking")
+    args = parser.parse_args()
+    zygote = Zygote(args.socket, [name for name in args.preload.split(',') if name])
+    zygote.preload_modules()
+    zygote.serve()